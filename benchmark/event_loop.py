@@ -0,0 +1,109 @@
+"""
+事件循环基准测试
+
+在不同的事件循环实现(asyncio默认事件循环,uvloop等)下,分别测试帧模式和行模式的回显吞吐量和请求-响应延迟
+用法: python -m benchmark.event_loop [--loops asyncio,uvloop] [--messages 条数] [--size 字节数] [--engine stream|protocol] [--cipher 加密套件]
+"""
+import argparse,asyncio,importlib.util,os,sys,time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tcp_quick.connect import Connect
+from tcp_quick.cipher import get_cipher_suite
+from tcp_quick.protocol import FrameProtocol
+from tcp_quick.loop import run
+
+def percentile(values:list,percent:float)->float:
+    values=sorted(values)
+    return values[min(len(values)-1,int(len(values)*percent/100))]
+
+def configure(connect:Connect,use_line:bool,cipher:str,key:bytes,is_server:bool)->Connect:
+    connect.use_line(use_line)
+    if cipher!='none':
+        connect._use_aes=True
+        connect.set_cipher(get_cipher_suite(cipher)(key,is_server=is_server))
+    return connect
+
+async def open_pair(use_line:bool,engine:str,cipher:str)->tuple:
+    """建立一对已连接的回显服务端和客户端"""
+    loop=asyncio.get_running_loop()
+    key=os.urandom(32)
+    handlers=set()
+
+    async def echo(reader,writer)->None:
+        handlers.add(asyncio.current_task())
+        connect=configure(Connect(reader,writer),use_line,cipher,key,True)
+        try:
+            while True:
+                await connect.send(await connect.recv())
+        except (ConnectionError,ValueError,asyncio.IncompleteReadError):
+            pass
+        finally:
+            await connect.close()
+
+    if engine=='protocol':
+        server=await loop.create_server(lambda:FrameProtocol(echo),'127.0.0.1',0)
+        port=server.sockets[0].getsockname()[1]
+        _,reader=await loop.create_connection(FrameProtocol,'127.0.0.1',port)
+        writer=reader.writer()
+    else:
+        server=await asyncio.start_server(echo,'127.0.0.1',0)
+        port=server.sockets[0].getsockname()[1]
+        reader,writer=await asyncio.open_connection('127.0.0.1',port)
+    return server,configure(Connect(reader,writer),use_line,cipher,key,False),handlers
+
+async def bench_case(use_line:bool,engine:str,cipher:str,messages:int,size:int)->dict:
+    server,client,handlers=await open_pair(use_line,engine,cipher)
+    # 行模式下避免数据中出现换行符,只测试框架本身的开销
+    payload=b'x'*size
+    # 吞吐量: 发送和接收同时进行
+    async def sender()->None:
+        for _ in range(messages):
+            await client.send(payload)
+
+    start=time.perf_counter()
+    send_task=asyncio.ensure_future(sender())
+    for _ in range(messages):
+        await client.recv()
+    await send_task
+    throughput=messages/(time.perf_counter()-start)
+    # 延迟: 逐条请求-响应
+    latencies=[]
+    for _ in range(min(messages,5000)):
+        start=time.perf_counter()
+        await client.send(payload)
+        await client.recv()
+        latencies.append(time.perf_counter()-start)
+    await client.close()
+    await asyncio.gather(*handlers,return_exceptions=True)
+    server.close()
+    await server.wait_closed()
+    return {
+        'throughput':throughput,
+        'p50':percentile(latencies,50)*1e6,
+        'p99':percentile(latencies,99)*1e6
+    }
+
+async def bench_loop(args)->list:
+    results=[]
+    for mode in ('frame','line'):
+        results.append((mode,await bench_case(mode=='line',args.engine,args.cipher,args.messages,args.size)))
+    return results
+
+def main()->None:
+    parser=argparse.ArgumentParser(description='事件循环基准测试')
+    parser.add_argument('--loops',default='asyncio,uvloop',help='要测试的事件循环(逗号分隔,未安装的会被跳过)')
+    parser.add_argument('--messages',type=int,default=20000,help='吞吐量测试的消息条数')
+    parser.add_argument('--size',type=int,default=128,help='单条消息大小(字节)')
+    parser.add_argument('--engine',default='stream',choices=('stream','protocol'),help='传输引擎')
+    parser.add_argument('--cipher',default='none',choices=('none','aes-gcm','chacha20-poly1305','aes-eax'),help='加密套件')
+    args=parser.parse_args()
+    print(f'消息条数: {args.messages}, 消息大小: {args.size} 字节, 传输引擎: {args.engine}, 加密套件: {args.cipher}')
+    print(f'{"事件循环":>10} {"模式":>6} {"吞吐(条/s)":>12} {"p50(us)":>10} {"p99(us)":>10}')
+    for loop in args.loops.split(','):
+        if loop!='asyncio' and importlib.util.find_spec(loop) is None:
+            print(f'{loop:>10} 未安装,跳过')
+            continue
+        for mode,result in run(bench_loop(args),loop):
+            print(f'{loop:>10} {mode:>6} {result["throughput"]:>12.0f} {result["p50"]:>10.1f} {result["p99"]:>10.1f}')
+
+if __name__=='__main__':
+    main()
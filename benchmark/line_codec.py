@@ -0,0 +1,52 @@
+"""
+行模式编码方式基准测试
+
+对比escape编码(转义换行符)和length编码(长度前缀行)在不同换行符密度下的编解码耗时和数据膨胀率
+用法: python -m benchmark.line_codec [--size 字节数] [--rounds 次数]
+"""
+import argparse,os,sys,time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tcp_quick.frame import escape_line,unescape_line,pack_line_header,parse_line_header
+
+def build_payload(size:int,newline_ratio:float)->bytes:
+    """构建指定换行符密度的日志类数据"""
+    if newline_ratio<=0:
+        return b'a'*size
+    line=b'x'*max(int(1/newline_ratio)-1,0)+b'\n'
+    return (line*(size//len(line)+1))[:size]
+
+def bench_escape(payload:bytes,rounds:int)->tuple:
+    start=time.perf_counter()
+    for _ in range(rounds):
+        encoded=escape_line(payload)
+        decoded=unescape_line(encoded)
+    elapsed=time.perf_counter()-start
+    assert decoded==payload
+    return elapsed,len(encoded)+1
+
+def bench_length(payload:bytes,rounds:int)->tuple:
+    start=time.perf_counter()
+    for _ in range(rounds):
+        header=pack_line_header(len(payload))
+        length=parse_line_header(header[:-1])
+    elapsed=time.perf_counter()-start
+    assert length==len(payload)
+    return elapsed,len(header)+len(payload)+1
+
+def main()->None:
+    parser=argparse.ArgumentParser(description='行模式编码方式基准测试')
+    parser.add_argument('--size',type=int,default=1<<20,help='单条数据大小(字节)')
+    parser.add_argument('--rounds',type=int,default=50,help='每种情况的编解码次数')
+    args=parser.parse_args()
+    print(f'数据大小: {args.size} 字节, 次数: {args.rounds}')
+    print(f'{"换行符密度":>10} {"编码":>8} {"耗时(ms/次)":>12} {"吞吐(MB/s)":>12} {"膨胀率":>8}')
+    for ratio in (0,0.001,0.01,0.1,0.5,1):
+        payload=build_payload(args.size,ratio)
+        for name,bench in (('escape',bench_escape),('length',bench_length)):
+            elapsed,wire_size=bench(payload,args.rounds)
+            per_round=elapsed/args.rounds
+            throughput=args.size/per_round/1e6 if per_round>0 else float('inf')
+            print(f'{ratio:>10} {name:>8} {per_round*1000:>12.3f} {throughput:>12.1f} {wire_size/args.size:>8.2f}')
+
+if __name__=='__main__':
+    main()
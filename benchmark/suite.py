@@ -0,0 +1,462 @@
+"""
+综合基准测试
+
+在本机回环地址上测试Connect的性能,结果可以保存为JSON并与之前保存的基线对比:
+echo:不同传输方式(raw:原始数据,tcp0:MCP-TCP0帧,tcp1:MCP-TCP1帧,line:行模式)、加密方式(none,aes,tls)、消息大小和并发连接数下的吞吐量(条/s,MB/s)和请求-响应延迟(p50/p99/p999)
+handshake:密钥交换速率(rsa,x25519,resume:通过会话票据恢复会话,tls:TLS握手)
+sendall:服务端向所有连接广播同一条消息,直到所有客户端都收到为止的速率和延迟
+与基线对比时,吞吐量下降或延迟上升超过阈值的结果视为退化,存在退化时退出码为1
+用法: python -m benchmark.suite [--cases echo,handshake,sendall] [--modes raw,tcp0,tcp1,line] [--security none,aes,tls] [--sizes 16,1K,64K,1M] [--concurrency 1,100] [--output 结果.json] [--baseline 基线.json]
+"""
+import argparse,asyncio,contextlib,io,json,os,platform,ssl,sys,tempfile,time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tcp_quick.connect import Connect
+from tcp_quick.cipher import get_cipher_suite
+from tcp_quick.protocol import FrameProtocol
+from tcp_quick.key_provider import GeneratedKeyProvider
+from tcp_quick.ticket import TicketKeyCache
+from tcp_quick.broadcast import broadcast
+from tcp_quick.cert_manager import CertManager
+from tcp_quick.loop import run
+try:
+    import resource
+except ImportError:
+    resource=None
+
+# 单位后缀->字节数
+_UNITS={'K':1<<10,'M':1<<20,'G':1<<30}
+# 指标->是否越大越好
+METRICS={'msgs_s':True,'mb_s':True,'p50_us':False,'p99_us':False,'p999_us':False}
+
+class BenchConnect(Connect):
+    """基准测试使用的连接(服务端公钥由测试本身生成,直接信任)"""
+
+    async def _verify_server_public_key(self,public_key_text:str)->None:
+        pass
+
+def parse_size(text:str)->int:
+    """解析带单位的大小(例如16,1K,64K,256M)"""
+    text=text.strip().upper().rstrip('B')
+    if text and text[-1] in _UNITS:
+        return int(text[:-1])*_UNITS[text[-1]]
+    return int(text)
+
+def format_size(size:int)->str:
+    for unit in ('G','M','K'):
+        if size>=_UNITS[unit] and size%_UNITS[unit]==0:
+            return f'{size//_UNITS[unit]}{unit}'
+    return str(size)
+
+def parse_list(text:str,convert=str)->list:
+    return [convert(item) for item in text.split(',') if item.strip()]
+
+def percentile(values:list,percent:float)->float:
+    """values需要已排序"""
+    if not values:
+        return 0.0
+    return values[min(len(values)-1,int(len(values)*percent/100))]
+
+def summarize(name:str,messages:int,message_size:int,elapsed:float,latencies:list,**extra)->dict:
+    latencies.sort()
+    return {
+        'name':name,
+        **extra,
+        'messages':messages,
+        'msgs_s':messages/elapsed if elapsed else 0.0,
+        'mb_s':messages*message_size/elapsed/1e6 if elapsed else 0.0,
+        'p50_us':percentile(latencies,50)*1e6,
+        'p99_us':percentile(latencies,99)*1e6,
+        'p999_us':percentile(latencies,99.9)*1e6
+    }
+
+def raise_fd_limit(need:int)->None:
+    """并发连接数较多时尽量提高文件描述符上限"""
+    if resource is None:
+        return
+    soft,hard=resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft!=resource.RLIM_INFINITY and soft<need:
+        target=need if hard==resource.RLIM_INFINITY else min(need,hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE,(target,hard))
+        except (ValueError,OSError):
+            pass
+        if target<need:
+            print(f'文件描述符上限为{target},并发连接数较多时可能失败',file=sys.stderr)
+
+def create_tls_contexts(directory:str)->tuple:
+    """生成自签名证书,返回(服务端SSL上下文,客户端SSL上下文)"""
+    key_path=os.path.join(directory,'bench.key')
+    cert_path=os.path.join(directory,'bench.crt')
+    private_key=CertManager.generate_private_key()
+    name=CertManager.build_x509_name(common_name='127.0.0.1')
+    CertManager.generate_certificate(private_key,name,name,output_private_key_path=key_path,output_certificate_path=cert_path)
+    server_context=ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert_path,key_path)
+    client_context=ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+    client_context.check_hostname=False
+    client_context.verify_mode=ssl.CERT_NONE
+    return server_context,client_context
+
+class Bench:
+    """
+    基准测试运行器
+
+    @param args:命令行参数
+    """
+
+    def __init__(self,args)->None:
+        self._args=args
+        self._tls=None
+        self._key_provider=None
+        self._directory=tempfile.TemporaryDirectory()
+        # JSON输出到标准输出时表格输出到标准错误
+        self._out=sys.stderr if args.output=='-' else sys.stdout
+
+    def tls(self)->tuple:
+        if self._tls is None:
+            self._tls=create_tls_contexts(self._directory.name)
+        return self._tls
+
+    def close(self)->None:
+        self._directory.cleanup()
+
+    def configure(self,connect:Connect,mode:str,security:str,key:bytes,is_server:bool)->Connect:
+        """按传输方式和加密方式设置连接(AES直接使用预先共享的密钥,不进行密钥交换)"""
+        if mode=='line':
+            connect.use_line().set_line_codec(self._args.line_codec)
+        elif mode in ('tcp0','tcp1'):
+            connect.set_frame_version(int(mode[-1]))
+        if security=='aes':
+            connect._use_aes=True
+            connect.set_cipher(get_cipher_suite(self._args.cipher)(key,is_server=is_server))
+        return connect
+
+    async def start_server(self,handler,security:str,backlog:int)->tuple:
+        """启动服务端,返回(服务端,端口)"""
+        ssl_context=self.tls()[0] if security=='tls' else None
+        if self._args.engine=='protocol':
+            loop=asyncio.get_running_loop()
+            server=await loop.create_server(lambda:FrameProtocol(handler),'127.0.0.1',0,ssl=ssl_context,backlog=backlog)
+        else:
+            server=await asyncio.start_server(handler,'127.0.0.1',0,ssl=ssl_context,backlog=backlog)
+        return server,server.sockets[0].getsockname()[1]
+
+    async def open_connection(self,port:int,security:str)->tuple:
+        ssl_context=self.tls()[1] if security=='tls' else None
+        if self._args.engine=='protocol':
+            loop=asyncio.get_running_loop()
+            _,reader=await loop.create_connection(FrameProtocol,'127.0.0.1',port,ssl=ssl_context)
+            return reader,reader.writer()
+        return await asyncio.open_connection('127.0.0.1',port,ssl=ssl_context)
+
+    async def open_clients(self,port:int,count:int,factory)->list:
+        """分批建立count个连接(避免一次性发起过多连接导致监听队列溢出)"""
+        connects=[]
+        for start in range(0,count,256):
+            connects.extend(await asyncio.gather(*(factory() for _ in range(min(256,count-start)))))
+        return connects
+
+    async def echo_case(self,mode:str,security:str,size:int,concurrency:int)->dict:
+        """并发连接的回显吞吐量和请求-响应延迟"""
+        args=self._args
+        key=os.urandom(32)
+        handlers=set()
+        raw=mode=='raw'
+
+        async def echo(reader,writer)->None:
+            handlers.add(asyncio.current_task())
+            connect=self.configure(BenchConnect(reader,writer),mode,security,key,True)
+            try:
+                while True:
+                    if raw:
+                        data=await connect.recv_raw(size,fill_byte=-1,fill_byte_timeout=0)
+                        if len(data)<size:
+                            break
+                        await connect.send_raw(data)
+                    else:
+                        await connect.send(await connect.recv(fill_byte=-1,fill_byte_timeout=0))
+            except (ConnectionError,ValueError,asyncio.IncompleteReadError):
+                pass
+            finally:
+                await connect.close()
+
+        async def open_client()->Connect:
+            reader,writer=await self.open_connection(port,security)
+            return self.configure(BenchConnect(reader,writer),mode,security,key,False)
+
+        server,port=await self.start_server(echo,security,min(concurrency,4096))
+        connects=await self.open_clients(port,concurrency,open_client)
+        # 消息大小较大时按总字节数预算减少消息条数
+        budget=max(1,args.max_bytes//size)
+        messages=max(1,min(args.messages,budget)//concurrency)
+        rounds=max(1,min(args.rounds,budget)//concurrency)
+        payload=b'x'*size
+
+        async def send(connect:Connect,data:bytes)->None:
+            if raw:
+                await connect.send_raw(data)
+            else:
+                await connect.send(data)
+
+        async def recv(connect:Connect)->None:
+            if raw:
+                data=await connect.recv_raw(size,fill_byte=-1,fill_byte_timeout=0)
+            else:
+                data=await connect.recv(fill_byte=-1,fill_byte_timeout=0)
+            if len(data)!=size:
+                raise ValueError('数据异常')
+
+        async def pipeline(connect:Connect)->None:
+            # 发送和接收同时进行
+            async def sender()->None:
+                for _ in range(messages):
+                    await send(connect,payload)
+
+            task=asyncio.ensure_future(sender())
+            for _ in range(messages):
+                await recv(connect)
+            await task
+
+        async def ping_pong(connect:Connect,latencies:list)->None:
+            for _ in range(rounds):
+                start=time.perf_counter()
+                await send(connect,payload)
+                await recv(connect)
+                latencies.append(time.perf_counter()-start)
+
+        try:
+            start=time.perf_counter()
+            await asyncio.gather(*(pipeline(connect) for connect in connects))
+            elapsed=time.perf_counter()-start
+            latencies=[]
+            await asyncio.gather(*(ping_pong(connect,latencies) for connect in connects))
+        finally:
+            await asyncio.gather(*(connect.close() for connect in connects),return_exceptions=True)
+            await asyncio.gather(*handlers,return_exceptions=True)
+            server.close()
+            await server.wait_closed()
+        name=f'echo/{mode}/{security}/{format_size(size)}/c{concurrency}'
+        return summarize(name,messages*concurrency,size,elapsed,latencies,case='echo',mode=mode,security=security,size=size,concurrency=concurrency)
+
+    async def handshake_case(self,kind:str,concurrency:int)->dict:
+        """握手速率(每次握手都建立新的TCP连接,tls只包含TLS握手,其他方式不使用TLS)"""
+        args=self._args
+        if self._key_provider is None and kind!='tls':
+            self._key_provider=GeneratedKeyProvider()
+            await self._key_provider.prepare()
+        key_exchange='rsa' if kind=='rsa' else 'x25519'
+        ticket_keys=TicketKeyCache() if kind=='resume' else None
+        security='tls' if kind=='tls' else 'none'
+        handlers=set()
+
+        async def accept(reader,writer)->None:
+            handlers.add(asyncio.current_task())
+            connect=BenchConnect(reader,writer,use_aes=kind!='tls')
+            try:
+                if kind!='tls':
+                    connect.set_key_provider(self._key_provider)
+                    connect.set_key_exchange(key_exchange)
+                    connect.set_ticket_keys(ticket_keys)
+                    await connect.key_exchange_to_client()
+                await connect.send_raw(b'\n')
+            except (ConnectionError,ValueError,asyncio.IncompleteReadError):
+                pass
+            finally:
+                await connect.close()
+
+        session=None
+
+        async def handshake(latencies:list,count:int)->None:
+            nonlocal session
+            for _ in range(count):
+                start=time.perf_counter()
+                reader,writer=await self.open_connection(port,security)
+                connect=BenchConnect(reader,writer,use_aes=kind!='tls')
+                try:
+                    if kind!='tls':
+                        connect.set_key_exchange(key_exchange)
+                        if kind=='resume':
+                            connect.use_session_ticket(session)
+                        await connect.key_exchange_to_server()
+                        if kind=='resume':
+                            session=connect.get_session_ticket()
+                    if await connect.recv_raw_line(30)!=b'':
+                        raise ValueError('握手失败')
+                finally:
+                    await connect.close()
+                latencies.append(time.perf_counter()-start)
+
+        server,port=await self.start_server(accept,security,min(concurrency,4096))
+        count=max(1,args.handshakes//concurrency)
+        latencies=[]
+        try:
+            # RSA密钥交换时服务端和客户端都会打印公钥
+            with contextlib.redirect_stdout(io.StringIO()):
+                if kind=='resume':
+                    # 先完成一次完整的握手以获取票据
+                    await handshake([],1)
+                start=time.perf_counter()
+                await asyncio.gather(*(handshake(latencies,count) for _ in range(concurrency)))
+                elapsed=time.perf_counter()-start
+        finally:
+            await asyncio.gather(*handlers,return_exceptions=True)
+            server.close()
+            await server.wait_closed()
+        return summarize(f'handshake/{kind}/c{concurrency}',count*concurrency,0,elapsed,latencies,case='handshake',kind=kind,concurrency=concurrency)
+
+    async def sendall_case(self,security:str,size:int,concurrency:int)->dict:
+        """服务端使用broadcast向所有连接发送同一条消息(与Server.sendall相同),每轮等待所有客户端都收到"""
+        args=self._args
+        key=os.urandom(32)
+        server_connects=[]
+        ready=asyncio.Event()
+        done=asyncio.Event()
+
+        async def accept(reader,writer)->None:
+            connect=self.configure(BenchConnect(reader,writer),'tcp1',security,key,True)
+            server_connects.append(connect)
+            if len(server_connects)==concurrency:
+                ready.set()
+            await done.wait()
+            await connect.close()
+
+        async def open_client()->Connect:
+            reader,writer=await self.open_connection(port,security)
+            return self.configure(BenchConnect(reader,writer),'tcp1',security,key,False)
+
+        server,port=await self.start_server(accept,security,min(concurrency,4096))
+        connects=await self.open_clients(port,concurrency,open_client)
+        await ready.wait()
+        payload=b'x'*size
+        rounds=max(1,min(args.rounds,max(1,args.max_bytes//max(size*concurrency,1))))
+        latencies=[]
+        try:
+            start=time.perf_counter()
+            for _ in range(rounds):
+                round_start=time.perf_counter()
+                received=asyncio.gather(*(connect.recv(fill_byte=-1,fill_byte_timeout=0) for connect in connects))
+                result=await broadcast(server_connects,payload)
+                if result.errors:
+                    raise ConnectionError('广播失败')
+                await received
+                latencies.append(time.perf_counter()-round_start)
+            elapsed=time.perf_counter()-start
+        finally:
+            done.set()
+            await asyncio.gather(*(connect.close() for connect in connects),return_exceptions=True)
+            server.close()
+            await server.wait_closed()
+        name=f'sendall/{security}/{format_size(size)}/c{concurrency}'
+        return summarize(name,rounds*concurrency,size,elapsed,latencies,case='sendall',security=security,size=size,concurrency=concurrency)
+
+    async def run(self)->list:
+        args=self._args
+        cases=parse_list(args.cases)
+        concurrency=parse_list(args.concurrency,int)
+        raise_fd_limit(max(concurrency)*2+256)
+        results=[]
+
+        def report(result:dict)->None:
+            results.append(result)
+            print(f'{result["name"]:<36} {result["msgs_s"]:>12.0f} {result["mb_s"]:>10.2f} {result["p50_us"]:>10.1f} {result["p99_us"]:>10.1f} {result["p999_us"]:>10.1f}',file=self._out,flush=True)
+
+        print(f'{"测试":<36} {"条/s":>12} {"MB/s":>10} {"p50(us)":>10} {"p99(us)":>10} {"p999(us)":>10}',file=self._out)
+        if 'echo' in cases:
+            for mode in parse_list(args.modes):
+                for security in parse_list(args.security):
+                    if mode=='raw' and security=='aes':
+                        # 原始数据不经过AES加密
+                        continue
+                    for size in parse_list(args.sizes,parse_size):
+                        for count in concurrency:
+                            report(await self.echo_case(mode,security,size,count))
+        if 'handshake' in cases:
+            for kind in parse_list(args.kex):
+                for count in concurrency:
+                    report(await self.handshake_case(kind,count))
+        if 'sendall' in cases:
+            for security in parse_list(args.security):
+                for count in concurrency:
+                    report(await self.sendall_case(security,parse_size(args.fanout_size),count))
+        return results
+
+def compare(results:list,baseline:dict,threshold:float)->list:
+    """
+    与基线对比
+
+    @return:退化的结果列表[(名称,指标,基线值,当前值,变化比例)]
+    """
+    base={result['name']:result for result in baseline['results']}
+    regressions=[]
+    print(f'\n与基线对比(阈值{threshold:.0%}):')
+    for result in results:
+        old=base.get(result['name'])
+        if old is None:
+            continue
+        changes=[]
+        for metric,higher_is_better in METRICS.items():
+            if not old.get(metric):
+                continue
+            change=result[metric]/old[metric]-1
+            changes.append(f'{metric} {change:+.1%}')
+            if (change<-threshold) if higher_is_better else (change>threshold):
+                regressions.append((result['name'],metric,old[metric],result[metric],change))
+        print(f'{result["name"]:<36} {", ".join(changes)}')
+    for name,metric,old,new,change in regressions:
+        print(f'退化: {name} {metric} {old:.1f} -> {new:.1f} ({change:+.1%})')
+    return regressions
+
+async def bench(args)->list:
+    runner=Bench(args)
+    try:
+        return await runner.run()
+    finally:
+        runner.close()
+
+def main()->None:
+    parser=argparse.ArgumentParser(description='综合基准测试')
+    parser.add_argument('--cases',default='echo,handshake,sendall',help='要运行的测试(逗号分隔: echo,handshake,sendall)')
+    parser.add_argument('--modes',default='raw,tcp0,tcp1,line',help='echo测试的传输方式(逗号分隔: raw,tcp0,tcp1,line)')
+    parser.add_argument('--security',default='none,aes,tls',help='echo和sendall测试的加密方式(逗号分隔: none,aes,tls)')
+    parser.add_argument('--sizes',default='16,1K,64K,1M',help='echo测试的消息大小(逗号分隔,支持K/M/G后缀,最大可测试256M等)')
+    parser.add_argument('--concurrency',default='1,100',help='并发连接数(逗号分隔,例如1,100,10000)')
+    parser.add_argument('--messages',type=int,default=20000,help='每个echo测试吞吐量阶段的总消息条数(由所有连接平分)')
+    parser.add_argument('--rounds',type=int,default=2000,help='每个echo测试延迟阶段的总请求数以及sendall测试的轮数')
+    parser.add_argument('--max-bytes',type=parse_size,default=parse_size('256M'),help='每个测试阶段最多传输的字节数(消息较大时据此减少消息条数)')
+    parser.add_argument('--kex',default='rsa,x25519,resume,tls',help='handshake测试的握手方式(逗号分隔: rsa,x25519,resume,tls)')
+    parser.add_argument('--handshakes',type=int,default=200,help='每个handshake测试的总握手次数')
+    parser.add_argument('--fanout-size',default='128',help='sendall测试的消息大小')
+    parser.add_argument('--engine',default='stream',choices=('stream','protocol'),help='传输引擎')
+    parser.add_argument('--cipher',default='aes-gcm',choices=('aes-gcm','chacha20-poly1305','aes-eax'),help='aes加密方式使用的加密套件')
+    parser.add_argument('--line-codec',default='escape',choices=('escape','length'),help='行模式编码方式')
+    parser.add_argument('--loop',default=None,help='事件循环实现(默认为asyncio,可选uvloop)')
+    parser.add_argument('--output',default='',help='将结果保存为JSON文件(可作为之后对比的基线,-表示输出到标准输出)')
+    parser.add_argument('--baseline',default='',help='与之前保存的JSON结果对比')
+    parser.add_argument('--threshold',type=float,default=0.1,help='视为退化的变化比例(默认为0.1,即吞吐量下降或延迟上升超过10%%)')
+    args=parser.parse_args()
+    results=run(bench(args),args.loop)
+    report={
+        'meta':{
+            'time':time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python':platform.python_version(),
+            'platform':platform.platform(),
+            'engine':args.engine,
+            'loop':args.loop or 'asyncio',
+            'cipher':args.cipher
+        },
+        'results':results
+    }
+    if args.output=='-':
+        json.dump(report,sys.stdout,ensure_ascii=False,indent=2)
+        print()
+    elif args.output:
+        with open(args.output,'w',encoding='utf-8') as f:
+            json.dump(report,f,ensure_ascii=False,indent=2)
+    if args.baseline:
+        with open(args.baseline,encoding='utf-8') as f:
+            baseline=json.load(f)
+        if compare(results,baseline,args.threshold):
+            sys.exit(1)
+
+if __name__=='__main__':
+    main()
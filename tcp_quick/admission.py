@@ -0,0 +1,154 @@
+import asyncio,collections,time
+
+class AdmissionQueue:
+    """
+    连接准入队列
+
+    同时处理的连接数达到上限后,新的连接按优先级进入等待队列,同一优先级内先进先出
+    每当有连接释放名额时只唤醒一个等待者,名额直接转交给被唤醒的等待者,不会被新到达的连接抢占
+
+    @param limit:同时处理的最大连接数
+    @param max_queue:最大排队数(0表示不限制)
+    @param timeout:默认排队超时时间(秒,0表示不限制)
+    """
+
+    def __init__(self,limit:int,max_queue:int=0,timeout:float=0)->None:
+        if limit<=0:
+            raise ValueError('最大连接数必须大于0')
+        if max_queue<0:
+            raise ValueError('最大排队数不能小于0')
+        self._limit=limit
+        self._max_queue=max_queue
+        self._timeout=timeout
+        self._active=0
+        # 优先级->等待者队列(数字越小优先级越高),已取消的等待者会在唤醒时跳过
+        self._waiters={}
+        self._queued=0
+        self._queued_by_priority=collections.Counter()
+        self._stats=collections.Counter()
+        self._wait_total=0.0
+        self._wait_max=0.0
+        self._queued_peak=0
+
+    def active(self)->int:
+        """获取当前占用的名额数"""
+        return self._active
+
+    def queued(self)->int:
+        """获取当前排队数"""
+        return self._queued
+
+    def limit(self)->int:
+        """获取最大连接数"""
+        return self._limit
+
+    def set_limit(self,limit:int)->None:
+        """调整最大连接数(调大时立即唤醒对应数量的等待者)"""
+        if limit<=0:
+            raise ValueError('最大连接数必须大于0')
+        self._limit=limit
+        while self._active<self._limit and self._wake_next():
+            self._active+=1
+
+    def try_acquire(self)->bool:
+        """尝试立即获取名额(有连接在排队时不会插队)"""
+        if self._active<self._limit and not self._queued:
+            self._active+=1
+            self._stats['admitted']+=1
+            return True
+        return False
+
+    async def acquire(self,priority:int=0,timeout:float=None)->None:
+        """
+        获取名额,没有空闲名额时排队等待
+
+        @param priority:优先级(数字越小优先级越高)
+        @param timeout:排队超时时间(秒,None表示使用默认值,0表示不限制)
+        """
+        if self.try_acquire():
+            return
+        if self._max_queue and self._queued>=self._max_queue:
+            self._stats['rejected']+=1
+            raise ConnectionError('排队的连接数已达上限')
+        if timeout is None:
+            timeout=self._timeout
+        waiter=asyncio.get_running_loop().create_future()
+        queue=self._waiters.get(priority)
+        if queue is None:
+            queue=self._waiters[priority]=collections.deque()
+        queue.append(waiter)
+        self._queued+=1
+        self._queued_by_priority[priority]+=1
+        self._queued_peak=max(self._queued_peak,self._queued)
+        start=time.monotonic()
+        try:
+            if timeout:
+                await asyncio.wait_for(waiter,timeout)
+            else:
+                await waiter
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # 已经被唤醒但调用者被取消,把名额转交给下一个等待者
+                self.release()
+            else:
+                waiter.cancel()
+                self._queued-=1
+                self._queued_by_priority[priority]-=1
+                # 大量等待者超时后清理队列中已取消的等待者
+                queue=self._waiters.get(priority)
+                if queue is not None and len(queue)>2*self._queued_by_priority[priority]+16:
+                    queue=collections.deque(item for item in queue if not item.done())
+                    if queue:
+                        self._waiters[priority]=queue
+                    else:
+                        del self._waiters[priority]
+            if isinstance(e,asyncio.TimeoutError):
+                self._stats['timeout']+=1
+                raise TimeoutError('排队超时')
+            self._stats['cancelled']+=1
+            raise
+        wait_time=time.monotonic()-start
+        self._stats['admitted']+=1
+        self._stats['admitted_from_queue']+=1
+        self._wait_total+=wait_time
+        self._wait_max=max(self._wait_max,wait_time)
+
+    def release(self)->None:
+        """释放名额(有等待者时直接转交给下一个等待者)"""
+        if self._active>self._limit or not self._wake_next():
+            self._active-=1
+
+    def stats(self)->dict:
+        """获取排队统计信息"""
+        waited=self._stats['admitted_from_queue']
+        return {
+            'active':self._active,
+            'limit':self._limit,
+            'queued':self._queued,
+            'queued_by_priority':{priority:count for priority,count in sorted(self._queued_by_priority.items()) if count},
+            'queued_peak':self._queued_peak,
+            'admitted':self._stats['admitted'],
+            'admitted_from_queue':waited,
+            'rejected':self._stats['rejected'],
+            'timeout':self._stats['timeout'],
+            'cancelled':self._stats['cancelled'],
+            'wait_avg':self._wait_total/waited if waited else 0.0,
+            'wait_max':self._wait_max
+        }
+
+    def _wake_next(self)->bool:
+        """唤醒优先级最高的等待者,名额直接转交(没有等待者时返回False)"""
+        for priority in sorted(self._waiters):
+            queue=self._waiters[priority]
+            while queue:
+                waiter=queue.popleft()
+                if waiter.done():
+                    continue
+                waiter.set_result(None)
+                self._queued-=1
+                self._queued_by_priority[priority]-=1
+                if not queue:
+                    del self._waiters[priority]
+                return True
+            del self._waiters[priority]
+        return False
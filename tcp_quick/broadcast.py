@@ -0,0 +1,112 @@
+import asyncio,collections,time
+from .connect import Connect
+
+class BroadcastResult:
+    """
+    广播结果
+
+    @param total:目标连接数
+    """
+    __slots__=('total','sent','errors','elapsed')
+
+    def __init__(self,total:int)->None:
+        self.total=total
+        self.sent=0
+        # 发送失败的连接->异常
+        self.errors={}
+        self.elapsed=0.0
+
+    @property
+    def failed(self)->int:
+        """发送失败的连接数"""
+        return len(self.errors)
+
+    @property
+    def timeout(self)->int:
+        """发送超时的连接数"""
+        return sum(1 for error in self.errors.values() if isinstance(error,TimeoutError))
+
+    def summary(self)->dict:
+        """获取结果摘要(按异常类型统计失败数)"""
+        return {
+            'total':self.total,
+            'sent':self.sent,
+            'failed':self.failed,
+            'errors':dict(collections.Counter(type(error).__name__ for error in self.errors.values())),
+            'elapsed':self.elapsed
+        }
+
+    def __repr__(self)->str:
+        return f'BroadcastResult(total={self.total},sent={self.sent},failed={self.failed},elapsed={self.elapsed:.3f})'
+
+async def broadcast(connects:list,data:bytes,timeout:float=0,concurrency:int=256,raw:bool=False)->BroadcastResult:
+    """
+    向多个连接发送同一份数据
+
+    未使用AES加密的连接(包括SSL/TLS连接)按编码方式分组,每组只构建一次帧头/行模式编码,所有连接共用同一份缓冲区
+    使用AES加密的连接仍需要逐个加密
+    最多同时有concurrency个连接在等待发送(写缓冲区未满时发送不会挂起),不会一次性为每个连接创建任务
+
+    @param connects:目标连接
+    @param data:要发送的数据
+    @param timeout:单个连接的发送超时时间(秒,0表示不限制)
+    @param concurrency:最大并发数
+    @param raw:是否发送原始数据
+    """
+    if concurrency<=0:
+        raise ValueError('并发数必须大于0')
+    start=time.monotonic()
+    connects=list(connects)
+    result=BroadcastResult(len(connects))
+    # 编码方式->编码后的缓冲区列表
+    encoded={}
+    parts=[data]
+
+    async def send(connect:Connect)->None:
+        if connect.writer().is_closing():
+            raise ConnectionError('连接已关闭')
+        if raw:
+            if connect._batch:
+                # 先发送合并缓冲区中的消息,保证顺序
+                await connect._flush_batch()
+            await connect._send_parts(parts)
+            return
+        key=connect.encoding_key()
+        if key is None:
+            await connect._send(data)
+            return
+        shared=encoded.get(key)
+        if shared is None:
+            shared=encoded[key]=connect.encode(data)
+        await connect.send_encoded(shared,size=len(data))
+
+    async def worker(iterator)->None:
+        for connect in iterator:
+            try:
+                await _with_timeout(send(connect),timeout)
+                result.sent+=1
+            except Exception as e:
+                result.errors[connect]=e
+
+    iterator=iter(connects)
+    workers=min(concurrency,len(connects))
+    if workers==1:
+        await worker(iterator)
+    elif workers>1:
+        await asyncio.gather(*(worker(iterator) for _ in range(workers)))
+    result.elapsed=time.monotonic()-start
+    return result
+
+async def _with_timeout(coro,timeout:float)->None:
+    """带超时地等待协程(Python 3.11以上使用asyncio.timeout,不需要额外创建任务)"""
+    if not timeout:
+        await coro
+        return
+    try:
+        if hasattr(asyncio,'timeout'):
+            async with asyncio.timeout(timeout):
+                await coro
+        else:
+            await asyncio.wait_for(coro,timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError('发送数据超时')
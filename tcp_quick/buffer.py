@@ -0,0 +1,107 @@
+import re
+from typing import Optional
+
+class RecvBuffer:
+    """
+    接收缓冲区
+
+    使用可增长的bytearray保存数据,并通过读游标记录已消费的位置,避免每次读取都重新切片整个缓冲区
+    已消费的数据会在游标超过压缩阈值且超过缓冲区一半时统一移除
+    """
+    _eol_pattern=re.compile(b'\r\n|\n|\r')
+
+    def __init__(self,compact_threshold:int=65536)->None:
+        self._buffer=bytearray()
+        self._pos=0
+        self._compact_threshold=compact_threshold
+        self._skip_lf=False
+        # 已确认不包含换行符的位置,避免长行在多次写入后被重复扫描
+        self._scan_pos=0
+
+    def __len__(self)->int:
+        return len(self._buffer)-self._pos
+
+    def __bool__(self)->bool:
+        return len(self._buffer)>self._pos
+
+    def feed(self,data)->None:
+        """写入数据"""
+        if not self._pos and not self._buffer:
+            self._buffer=bytearray(data)
+            return
+        self._buffer+=data
+
+    def view(self)->memoryview:
+        """
+        获取未读数据的只读视图(零拷贝)
+
+        注意: 在视图释放前不能调用feed/read等会修改缓冲区的方法
+        """
+        return memoryview(self._buffer).toreadonly()[self._pos:]
+
+    def read(self,size:int=-1)->bytes:
+        """
+        读取数据(数据只会被复制一次)
+
+        @param size:读取大小(小于0时读取全部数据)
+        """
+        # 原始数据不受上一行结尾的影响
+        self._skip_lf=False
+        end=len(self._buffer)
+        if size>=0 and self._pos+size<end:
+            end=self._pos+size
+        data=self._copy(self._pos,end)
+        self._consume(end)
+        return data
+
+    def read_line(self)->Optional[bytes]:
+        """
+        读取一行数据(不包含换行符),单次扫描同时匹配“\\r\\n”,“\\n”和“\\r”
+
+        @return:没有完整的行时返回None
+        """
+        if self._skip_lf:
+            # 上一行以“\r”结尾,若紧跟“\n”则视为同一个“\r\n”
+            if not self:
+                return None
+            self._skip_lf=False
+            if self._buffer[self._pos]==0x0a:
+                self._consume(self._pos+1)
+        match=self._eol_pattern.search(self._buffer,max(self._pos,self._scan_pos))
+        if match is None:
+            self._scan_pos=len(self._buffer)
+            return None
+        start,end=match.span()
+        if end==len(self._buffer) and self._buffer[start]==0x0d:
+            # “\r”位于缓冲区末尾时无法确定后续是否为“\n”,记录下来在下一次读取行时跳过
+            self._skip_lf=True
+        data=self._copy(self._pos,start)
+        self._consume(end)
+        return data
+
+    def skip(self,size:int)->None:
+        """丢弃指定大小的数据(不复制)"""
+        self._skip_lf=False
+        self._consume(min(self._pos+size,len(self._buffer)))
+
+    def clear(self)->None:
+        """清空缓冲区"""
+        self._buffer=bytearray()
+        self._pos=0
+        self._scan_pos=0
+
+    def _copy(self,start:int,end:int)->bytes:
+        """通过memoryview复制指定区间的数据(避免bytearray切片产生的额外拷贝)"""
+        with memoryview(self._buffer) as view:
+            return bytes(view[start:end])
+
+    def _consume(self,end:int)->None:
+        """移动读游标并在必要时压缩缓冲区"""
+        if end>=len(self._buffer):
+            self.clear()
+            return
+        self._pos=end
+        if self._pos>=self._compact_threshold and self._pos*2>=len(self._buffer):
+            del self._buffer[:self._pos]
+            self._scan_pos=max(self._scan_pos-self._pos,0)
+            self._pos=0
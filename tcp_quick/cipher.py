@@ -0,0 +1,162 @@
+import hashlib,struct
+from Crypto.Cipher import AES
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM,ChaCha20Poly1305
+from .key import Key
+
+class Cipher:
+    """
+    数据加密套件基类
+
+    加密/解密分为两步: next_nonce/verify_nonce必须在事件循环中按发送/接收顺序调用,seal/open不依赖连接状态,可以在其他线程中执行
+    aad为参与认证但不加密的附加数据,解密时必须与加密时一致
+
+    @param key:密钥
+    @param is_server:是否为服务端(用于区分双方的nonce空间)
+    """
+    suite_id:int
+    name:str
+    overhead:int
+
+    def __init__(self,key:bytes,is_server:bool=False)->None:
+        self._key=key
+        self._is_server=is_server
+
+    def next_nonce(self)->bytes:
+        """获取下一个发送用的nonce"""
+        raise NotImplementedError
+
+    def verify_nonce(self,data:bytes)->bytes:
+        """校验接收数据中的nonce并返回"""
+        raise NotImplementedError
+
+    def seal(self,nonce:bytes,data:bytes,aad:bytes=None)->list:
+        """加密数据,返回需要依次发送的缓冲区列表"""
+        raise NotImplementedError
+
+    def open(self,nonce:bytes,data:bytes,aad:bytes=None)->bytes:
+        """解密并校验数据(data为包含nonce的完整数据)"""
+        raise NotImplementedError
+
+    def encrypt(self,data:bytes,aad:bytes=None)->list:
+        """加密数据,返回需要依次发送的缓冲区列表"""
+        return self.seal(self.next_nonce(),data,aad)
+
+    def decrypt(self,data:bytes,aad:bytes=None)->bytes:
+        """解密并校验数据"""
+        return self.open(self.verify_nonce(data),data,aad)
+
+class EaxCipher(Cipher):
+    """
+    AES-EAX(旧版本使用的加密方式)
+
+    格式: 16字节随机iv+16字节tag+密文
+    """
+    suite_id=0
+    name='aes-eax'
+    overhead=32
+
+    def next_nonce(self)->bytes:
+        return Key.rand_iv(16)
+
+    def verify_nonce(self,data:bytes)->bytes:
+        if len(data)<32:
+            raise ValueError('数据异常')
+        return data[:16]
+
+    def seal(self,nonce:bytes,data:bytes,aad:bytes=None)->list:
+        cipher=AES.new(self._key,AES.MODE_EAX,nonce)
+        if aad:
+            cipher.update(aad)
+        ciphertext,tag=cipher.encrypt_and_digest(data)
+        return [nonce,tag,ciphertext]
+
+    def open(self,nonce:bytes,data:bytes,aad:bytes=None)->bytes:
+        cipher=AES.new(self._key,AES.MODE_EAX,nonce)
+        if aad:
+            cipher.update(aad)
+        try:
+            return cipher.decrypt_and_verify(data[32:],data[16:32])
+        except ValueError:
+            raise ValueError('数据异常')
+
+class AeadCipher(Cipher):
+    """
+    基于计数器nonce的AEAD加密套件
+
+    12字节nonce由4字节方向前缀和8字节计数器组成,每条消息只需要发送8字节计数器,不再为每条消息生成随机数
+    接收时要求计数器严格递增,可以拒绝重放的数据
+    格式: 8字节计数器+密文+16字节tag
+    """
+    overhead=24
+    _counter_struct=struct.Struct('!Q')
+
+    def __init__(self,key:bytes,is_server:bool=False)->None:
+        super().__init__(key,is_server)
+        # 缓存已完成密钥扩展的加密对象
+        self._aead=self._create_aead(key)
+        self._send_prefix=b'\x00\x00\x00\x01' if is_server else b'\x00\x00\x00\x00'
+        self._recv_prefix=b'\x00\x00\x00\x00' if is_server else b'\x00\x00\x00\x01'
+        self._send_counter=0
+        self._recv_counter=0
+
+    def _create_aead(self,key:bytes):
+        raise NotImplementedError
+
+    def next_nonce(self)->bytes:
+        self._send_counter+=1
+        if self._send_counter>0xffffffffffffffff:
+            raise ValueError('nonce已耗尽,请重新进行密钥交换')
+        return self._send_prefix+self._counter_struct.pack(self._send_counter)
+
+    def verify_nonce(self,data:bytes)->bytes:
+        if len(data)<24:
+            raise ValueError('数据异常')
+        counter=self._counter_struct.unpack_from(data)[0]
+        if counter<=self._recv_counter:
+            raise ValueError('数据异常')
+        self._recv_counter=counter
+        return self._recv_prefix+data[:8]
+
+    def seal(self,nonce:bytes,data:bytes,aad:bytes=None)->list:
+        return [nonce[4:],self._aead.encrypt(nonce,data,aad)]
+
+    def open(self,nonce:bytes,data:bytes,aad:bytes=None)->bytes:
+        try:
+            return self._aead.decrypt(nonce,memoryview(data)[8:],aad)
+        except InvalidTag:
+            raise ValueError('数据异常')
+
+class GcmCipher(AeadCipher):
+    """AES-GCM(支持AES-NI时速度最快)"""
+    suite_id=1
+    name='aes-gcm'
+
+    def _create_aead(self,key:bytes):
+        return AESGCM(key)
+
+class ChaCha20Cipher(AeadCipher):
+    """ChaCha20-Poly1305(没有AES硬件加速时速度更快),密钥长度不足32字节时通过SHA-256扩展"""
+    suite_id=2
+    name='chacha20-poly1305'
+
+    def _create_aead(self,key:bytes):
+        if len(key)!=32:
+            key=hashlib.sha256(b'MCP-CHACHA20'+key).digest()
+        return ChaCha20Poly1305(key)
+
+CIPHER_SUITES={cipher.suite_id:cipher for cipher in (EaxCipher,GcmCipher,ChaCha20Cipher)}
+CIPHER_SUITE_NAMES={cipher.name:cipher for cipher in CIPHER_SUITES.values()}
+# 默认的加密套件优先级(协商失败或对端为旧版本时使用aes-eax)
+DEFAULT_CIPHER_SUITES=('aes-gcm','chacha20-poly1305','aes-eax')
+
+def get_cipher_suite(suite)->type:
+    """
+    根据名称或ID获取加密套件
+
+    @param suite:加密套件名称或ID
+    """
+    cipher=CIPHER_SUITE_NAMES.get(suite) if isinstance(suite,str) else CIPHER_SUITES.get(suite)
+    if cipher is None:
+        raise ValueError('不支持的加密套件')
+    return cipher
@@ -1,6 +1,12 @@
-import asyncio,re
+import asyncio,re,time
 from abc import ABC,abstractmethod
 from .connect import Connect
+from .ticket import SessionCache
+from .loop import LOOP_NAMES,run
+from .protocol import FrameProtocol
+from .rpc import RpcChannel
+from .mux import Multiplexer,MuxStream
+from .metrics import Metrics
 
 class Client(ABC):
     """
@@ -10,31 +16,84 @@ class Client(ABC):
     @param host:服务端地址(主机名称或ip地址)
     @param port:服务端端口
     @param use_line:是否使用行模式传输数据(仅支持以“\\n”,“\\r”或“\\r\\n”结尾的数据,开启后将自动在行尾添加“\\n”)
+    @param line_codec:行模式下发送数据的编码方式(escape:转义换行符,兼容旧版本,length:长度前缀行+原始数据,不改写数据,接收时兼容escape编码,需要与对端保持一致)
     @param ssl:SSL/TLS上下文(默认为None,即不使用SSL/TLS)
     @param use_aes:是否使用AES加密传输数据(默认为自动,即根据SSL/TLS上下文是否存在来决定是否使用AES加密)
+    @param cipher_suites:密钥交换时可协商的加密套件(按优先级排列,默认为aes-gcm,chacha20-poly1305,aes-eax,对端为旧版本时使用aes-eax)
+    @param key_exchange:密钥交换方式(rsa:RSA-OAEP,兼容旧版本,x25519:X25519+HKDF,服务端使用RSA身份私钥签名临时公钥,需要与对端保持一致)
+    @param session_ticket:是否使用会话票据(重新连接同一服务端时跳过RSA/X25519运算直接恢复会话,票据保存在进程内所有客户端共享的缓存中)
+    @param loop:事件循环实现(默认为None,即asyncio默认事件循环,uvloop:使用uvloop,未安装时回退到默认事件循环,auto:已安装uvloop时使用uvloop,也可以传入返回事件循环的可调用对象或asyncio.AbstractEventLoopPolicy实例)
+    @param engine:传输引擎(stream:基于StreamReader/StreamWriter,protocol:基于BufferedProtocol直接解析帧,适合大量小消息)
+    @param frame_version:发送数据时使用的帧格式版本(0:MCP-TCP0,1:MCP-TCP1二进制帧头,默认为自动,即收到对端的MCP-TCP1帧后切换,接收时总是自动识别)
+    @param max_frame_size:允许接收的最大帧大小(默认为0x7fffffff字节,MCP-TCP1帧可以超过该大小)
+    @param limit:限制连接默认的缓冲区大小(默认为65536字节,即64KiB)
+    @param compression:可协商的压缩算法(按优先级排列,例如['zlib'],默认为None,即不压缩,启用后需要与对端保持一致,不支持行模式)
+    @param compression_min_size:压缩的最小帧大小(默认为64字节)
+    @param compression_context:是否在帧之间保留压缩上下文(默认为True,大量相似的小消息也能得到较高的压缩率)
+    @param codecs:send_obj/recv_obj可协商的编码器(按优先级排列,例如['msgpack','json'],默认为None,即不协商,使用json,设置后需要与对端保持一致)
+    @param coalesce_delay:小消息合并窗口(秒,窗口内send发送的小消息合并为一个超级帧,默认为None,即不合并,对端接收时总是自动识别,不支持行模式)
+    @param coalesce_max_bytes:超级帧的最大数据大小(默认为16384字节)
+    @param metrics:是否记录每个连接的性能指标(帧数、字节数以及握手、加密/解密、等待drain等耗时的直方图,默认为False,即不记录)
     """
+    # 按(服务端地址,端口,密钥交换方式)保存的会话票据
+    _session_cache=SessionCache()
 
     def __init__(
             self,host:str='127.0.0.1',port:int=10901,use_line:bool=False,
-            ssl=None,use_aes=None
+            ssl=None,use_aes=None,cipher_suites=None,line_codec:str='escape',engine:str='stream',limit:int=65536,
+            frame_version:int=None,max_frame_size:int=0x7fffffff,key_exchange:str='rsa',
+            session_ticket:bool=True,loop=None,compression=None,compression_min_size:int=64,compression_context:bool=True,
+            codecs=None,coalesce_delay:float=None,coalesce_max_bytes:int=16384,metrics:bool=False
         )->None:
         self._validate_ip(host)
         self._validate_port(port)
         self._ip=host
         self._port=port
         self._use_line=use_line
+        if line_codec not in ('escape','length'):
+            raise ValueError('行模式编码方式不合法')
+        self._line_codec=line_codec
         self._ssl=ssl
         if use_aes is None:
             self._use_aes=False if ssl else True
         else:
             self._use_aes=use_aes
+        self._cipher_suites=cipher_suites
+        if key_exchange not in ('rsa','x25519'):
+            raise ValueError('密钥交换方式不合法')
+        self._key_exchange=key_exchange
+        self._session_ticket=session_ticket
+        if isinstance(loop,str) and loop not in LOOP_NAMES:
+            raise ValueError('事件循环不合法')
+        self._loop=loop
+        if engine not in ('stream','protocol'):
+            raise ValueError('传输引擎不合法')
+        self._engine=engine
+        self._limit=limit
+        if frame_version not in (None,0,1):
+            raise ValueError('帧格式版本不合法')
+        self._frame_version=frame_version
+        self._max_frame_size=max_frame_size
+        if compression is not None and use_line:
+            raise ValueError('行模式不支持压缩')
+        self._compression=compression
+        self._compression_min_size=compression_min_size
+        self._compression_context=compression_context
+        self._codecs=codecs
+        if coalesce_delay is not None and use_line:
+            raise ValueError('行模式不支持合并发送')
+        self._coalesce_delay=coalesce_delay
+        self._coalesce_max_bytes=coalesce_max_bytes
+        self._metrics=metrics
         self._connect:Connect
+        self._rpc:RpcChannel=None
+        self._mux:Multiplexer=None
         self._is_shutdown=False
 
     def run(self)->None:
         """运行客户端"""
         try:
-            asyncio.run(self._link())
+            run(self._link(),self._loop)
         except KeyboardInterrupt:
             pass
 
@@ -53,14 +112,8 @@ class Client(ABC):
 
     async def _link(self)->None:
         """连接服务端"""
-        writer=None
         try:
-            reader,writer=await asyncio.open_connection(self._ip,self._port,ssl=self._ssl)
-            self._connect=Connect(reader,writer,self._use_aes)
-            if self._use_line:
-                self._connect.use_line()
-            if self._use_aes:
-                await self.key_exchange_to_server(self._connect)
+            self._connect=await self.open_connect()
             await self._connection_made(self.connect())
             await self._handle(self.connect())
         except Exception as e:
@@ -68,7 +121,65 @@ class Client(ABC):
         finally:
             if self._is_shutdown:
                 self._is_shutdown=True
-            await self._connection_closed(self.connect())
+            # 建立连接或密钥交换失败时没有可关闭的连接
+            if getattr(self,'_connect',None) is not None:
+                await self._connection_closed(self.connect())
+
+    async def open_connect(self)->Connect:
+        """
+        按当前配置建立一个新的连接并完成密钥交换和压缩协商(不会调用_handle,也不会替换connect()返回的连接)
+
+        启用会话票据时会优先使用缓存的票据恢复会话,连接池等需要多个连接的场景可以跳过RSA/X25519运算
+        密钥交换失败时会关闭连接并抛出异常
+        """
+        if self._engine=='protocol':
+            loop=asyncio.get_running_loop()
+            _,reader=await loop.create_connection(
+                lambda:FrameProtocol(limit=self._limit),
+                self._ip,self._port,ssl=self._ssl
+            )
+            writer=reader.writer()
+        else:
+            reader,writer=await asyncio.open_connection(self._ip,self._port,ssl=self._ssl,limit=self._limit)
+        connect=Connect(reader,writer,self._use_aes)
+        try:
+            connect.set_frame_version(self._frame_version)
+            connect.set_max_frame_size(self._max_frame_size)
+            if self._cipher_suites is not None:
+                connect.set_cipher_suites(self._cipher_suites)
+            connect.set_key_exchange(self._key_exchange)
+            if self._use_line:
+                connect.use_line().set_line_codec(self._line_codec)
+            if self._metrics:
+                connect.set_metrics()
+            start=time.perf_counter_ns()
+            if self._use_aes:
+                session_key=(self._ip,self._port,self._key_exchange)
+                if self._session_ticket:
+                    connect.use_session_ticket(Client._session_cache.get(session_key))
+                await self.key_exchange_to_server(connect)
+                if self._session_ticket:
+                    session=connect.get_session_ticket()
+                    if session is not None:
+                        Client._session_cache.put(session_key,session)
+                    else:
+                        Client._session_cache.discard(session_key)
+            if self._compression is not None:
+                connect.set_compression(self._compression,min_size=self._compression_min_size,use_context=self._compression_context)
+                await connect.negotiate_compression(False)
+            if self._codecs is not None:
+                connect.set_codecs(self._codecs)
+                await connect.negotiate_codec(False)
+            if self._coalesce_delay is not None:
+                connect.set_coalesce(self._coalesce_delay,self._coalesce_max_bytes)
+            if self._metrics:
+                metrics=connect.get_metrics()
+                metrics.add('handshakes')
+                metrics.observe('handshake',time.perf_counter_ns()-start)
+        except BaseException:
+            await connect.close()
+            raise
+        return connect
 
     async def key_exchange_to_server(self,connect:Connect)->None:
         """与服务端进行密钥交换"""
@@ -78,6 +189,10 @@ class Client(ABC):
         """获取连接对象"""
         return self._connect
 
+    def get_metrics(self)->Metrics:
+        """获取当前连接的性能指标(未启用时返回None)"""
+        return self._connect.get_metrics()
+
     async def recv(self,timeout:int=0)->bytes:
         """接收数据"""
         data=await self.connect().recv(timeout)
@@ -98,12 +213,56 @@ class Client(ABC):
             raise ConnectionError('已关闭连接')
         await self.connect().send(data,timeout)
 
+    async def recv_obj(self,timeout:int=0):
+        """接收并解码一个对象"""
+        obj=await self.connect().recv_obj(timeout)
+        if self.is_shutdown():
+            raise ConnectionError('已关闭连接')
+        return obj
+
+    async def send_obj(self,obj,timeout:int=0)->None:
+        """编码并发送一个对象"""
+        if self.is_shutdown():
+            raise ConnectionError('已关闭连接')
+        await self.connect().send_obj(obj,timeout)
+
     async def send_raw(self,data:bytes,timeout:int=0)->None:
         """发送原始数据"""
         if self.is_shutdown():
             raise ConnectionError('已关闭连接')
         await self.connect().send_raw(data,timeout)
 
+    async def call(self,method:str,payload:bytes=b'',timeout:float=0)->bytes:
+        """
+        调用服务端注册的RPC方法
+
+        多个调用可以同时进行,响应由后台读取任务按请求ID分发(第一次调用后不能再直接调用recv)
+
+        @param method:方法名
+        @param payload:请求数据
+        @param timeout:超时时间(超时后会通知服务端取消处理)
+        @return:响应数据,服务端处理出错时抛出RpcError
+        """
+        if self.is_shutdown():
+            raise ConnectionError('已关闭连接')
+        if self._rpc is None:
+            self._rpc=RpcChannel(self.connect()).start()
+        return await self._rpc.call(method,payload,timeout)
+
+    def open_stream(self,window:int=256*1024)->MuxStream:
+        """
+        在当前连接上打开一个多路复用流(服务端需要使用serve_streams处理)
+
+        多个流共用同一个连接和密钥交换结果,各自有独立的流量控制窗口,第一次调用后不能再直接调用recv,也不能与call同时使用
+
+        @param window:每个流的流量控制窗口(只在第一次调用时生效,需要与服务端保持一致)
+        """
+        if self.is_shutdown():
+            raise ConnectionError('已关闭连接')
+        if self._mux is None:
+            self._mux=Multiplexer(self.connect(),is_client=True,window=window).start()
+        return self._mux.open_stream()
+
     def is_shutdown(self)->bool:
         """判断服务器是否已关闭"""
         return self._is_shutdown
@@ -111,6 +270,10 @@ class Client(ABC):
     async def close(self)->None:
         """关闭连接"""
         self._is_shutdown=True
+        if self._rpc is not None:
+            await self._rpc.close()
+        if self._mux is not None:
+            await self._mux.close()
         await self.connect().close()
 
     async def _connection_made(self,connect:Connect)->None:
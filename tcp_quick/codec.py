@@ -0,0 +1,131 @@
+import json
+try:
+    import msgpack
+except ImportError:
+    msgpack=None
+
+# 编码协商消息: 8字节魔数+按优先级排列的编码器ID
+CODEC_MAGIC=b'MCP-CODC'
+# 用户注册的编码器建议使用的最小ID(更小的ID保留给内置编码器)
+USER_CODEC_ID=64
+MAX_CODEC_ID=0x7f
+
+class Codec:
+    """
+    消息编码器基类(对象<->bytes)
+
+    编码器ID会写入MCP-TCP1帧头,接收方按帧头中的ID选择编码器,因此双方注册的同一ID必须是同一种编码
+    批量编码默认将对象列表作为一个整体编码(JSON数组/msgpack数组),解码时一次调用即可得到全部对象,不支持列表的编码器需要重写encode_batch和decode_batch
+    """
+    codec_id:int
+    name:str
+
+    def encode(self,obj)->bytes:
+        """编码一个对象"""
+        raise NotImplementedError
+
+    def decode(self,data)->object:
+        """解码一个对象"""
+        raise NotImplementedError
+
+    def encode_batch(self,objs)->bytes:
+        """将多个对象编码为一个帧"""
+        return self.encode(list(objs))
+
+    def decode_batch(self,data)->list:
+        """解码encode_batch编码的帧"""
+        objs=self.decode(data)
+        if not isinstance(objs,list):
+            raise ValueError('数据异常')
+        return objs
+
+    def is_available(self)->bool:
+        """编码器的依赖是否已安装"""
+        return True
+
+class JsonCodec(Codec):
+    """JSON(UTF-8,紧凑格式)"""
+    codec_id=1
+    name='json'
+
+    def __init__(self)->None:
+        self._encoder=json.JSONEncoder(ensure_ascii=False,separators=(',',':'))
+
+    def encode(self,obj)->bytes:
+        return self._encoder.encode(obj).encode()
+
+    def decode(self,data)->object:
+        try:
+            return json.loads(bytes(data))
+        except ValueError:
+            raise ValueError('数据异常')
+
+class MsgpackCodec(Codec):
+    """MessagePack二进制编码(需要安装msgpack),编码更紧凑,速度快于JSON,支持bytes"""
+    codec_id=2
+    name='msgpack'
+
+    def encode(self,obj)->bytes:
+        return msgpack.packb(obj,use_bin_type=True)
+
+    def decode(self,data)->object:
+        try:
+            return msgpack.unpackb(data,raw=False,strict_map_key=False)
+        except (ValueError,msgpack.UnpackException):
+            raise ValueError('数据异常')
+
+    def is_available(self)->bool:
+        return msgpack is not None
+
+_codecs={}
+_codec_names={}
+
+def register_codec(codec:Codec,replace:bool=False)->None:
+    """
+    注册编码器(进程内所有连接共用)
+
+    @param codec:编码器实例(codec_id为1~127的整数,用户编码器建议使用USER_CODEC_ID及以上的ID)
+    @param replace:是否替换已注册的同ID或同名编码器
+    """
+    if not isinstance(codec.codec_id,int) or not 0<codec.codec_id<=MAX_CODEC_ID:
+        raise ValueError('编码器ID不合法')
+    if not replace and (codec.codec_id in _codecs or codec.name in _codec_names):
+        raise ValueError('编码器已存在')
+    old=_codecs.pop(codec.codec_id,None)
+    if old is not None:
+        _codec_names.pop(old.name,None)
+    old=_codec_names.pop(codec.name,None)
+    if old is not None:
+        _codecs.pop(old.codec_id,None)
+    _codecs[codec.codec_id]=codec
+    _codec_names[codec.name]=codec
+
+def get_codec(codec)->Codec:
+    """
+    根据名称或ID获取已注册的编码器
+
+    @param codec:编码器名称(json,msgpack或用户注册的名称)、ID或已注册的编码器实例
+    """
+    if isinstance(codec,Codec):
+        codec=codec.codec_id
+    found=_codec_names.get(codec) if isinstance(codec,str) else _codecs.get(codec)
+    if found is None:
+        raise ValueError('不支持的编码器')
+    return found
+
+def pack_offer(codecs)->bytes:
+    """构建编码协商消息"""
+    return CODEC_MAGIC+bytes(codecs)
+
+def parse_offer(data:bytes)->bytes:
+    """
+    解析编码协商消息
+
+    @return:对端支持的编码器ID
+    """
+    if len(data)<8 or data[:8]!=CODEC_MAGIC:
+        raise ValueError('编码协商失败')
+    return bytes(data[8:])
+
+register_codec(JsonCodec())
+register_codec(MsgpackCodec())
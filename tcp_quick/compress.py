@@ -0,0 +1,227 @@
+import collections,struct,zlib
+from typing import Optional
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block=None
+
+# 压缩协商消息: 8字节魔数+1字节选项+按优先级排列的压缩算法ID
+COMPRESS_MAGIC=b'MCP-COMP'
+# 发送方在帧之间保留压缩上下文
+OPTION_CONTEXT=0x01
+# Z_SYNC_FLUSH总是以空的存储块结尾,发送时省略,解压时补回
+_SYNC_TAIL=b'\x00\x00\xff\xff'
+# 连续压缩率较差时最多跳过的帧数
+_MAX_BACKOFF=64
+
+class Compressor:
+    """
+    帧压缩算法基类
+
+    每个实例只用于一个方向: 发送方调用compress,接收方调用decompress,双方的use_context必须一致(由协商决定)
+    use_context为True时压缩上下文在帧之间保留,后续帧可以引用之前帧中的数据(大量相似的小消息也能得到较高的压缩率),要求解压顺序与压缩顺序一致
+    小于min_size的帧不压缩;压缩后大于原始大小*max_ratio的帧视为压缩率较差,之后的若干个帧直接发送原始数据(连续较差时加倍,最多_MAX_BACKOFF个)
+
+    @param use_context:是否在帧之间保留压缩上下文
+    @param level:压缩级别(None表示使用算法的默认级别)
+    @param min_size:压缩的最小帧大小(字节)
+    @param max_ratio:压缩后与原始大小的最大比值
+    """
+    algorithm_id:int
+    name:str
+
+    def __init__(self,use_context:bool=True,level:int=None,min_size:int=64,max_ratio:float=0.9)->None:
+        self._use_context=use_context
+        self._level=level
+        self._min_size=min_size
+        self._max_ratio=max_ratio
+        self._skip=0
+        self._backoff=1
+        self._stats=collections.Counter()
+
+    def use_context(self)->bool:
+        """是否在帧之间保留压缩上下文"""
+        return self._use_context
+
+    def compress(self,data)->Optional[bytes]:
+        """
+        压缩一个帧的数据
+
+        @return:压缩后的数据,不压缩时返回None(按原始数据发送)
+        """
+        size=len(data)
+        if size<self._min_size:
+            return None
+        if self._skip:
+            self._skip-=1
+            self._stats['skipped']+=1
+            return None
+        out=self._compress(data)
+        if len(out)<=size*self._max_ratio:
+            self._backoff=1
+        else:
+            self._skip=self._backoff
+            self._backoff=min(self._backoff*2,_MAX_BACKOFF)
+            self._stats['poor']+=1
+            if not self._absorbed():
+                return None
+        self._commit(data)
+        self._stats['frames']+=1
+        self._stats['bytes_in']+=size
+        self._stats['bytes_out']+=len(out)
+        return out
+
+    def decompress(self,data,max_size:int)->bytes:
+        """
+        解压一个帧的数据
+
+        @param max_size:解压后的最大字节数(超过时抛出ValueError)
+        """
+        out=self._decompress(data,max_size)
+        self._commit(out)
+        self._stats['frames']+=1
+        self._stats['bytes_in']+=len(out)
+        self._stats['bytes_out']+=len(data)
+        return out
+
+    def stats(self)->dict:
+        """获取统计信息(bytes_in为原始数据字节数,bytes_out为压缩后字节数)"""
+        return {
+            'algorithm':self.name,
+            'context':self._use_context,
+            'frames':self._stats['frames'],
+            'skipped':self._stats['skipped'],
+            'poor':self._stats['poor'],
+            'bytes_in':self._stats['bytes_in'],
+            'bytes_out':self._stats['bytes_out']
+        }
+
+    def _compress(self,data)->bytes:
+        raise NotImplementedError
+
+    def _decompress(self,data,max_size:int)->bytes:
+        raise NotImplementedError
+
+    def _absorbed(self)->bool:
+        """压缩结果是否已经改变了压缩上下文(此时即使压缩率较差也必须发送,否则对端的上下文会不一致)"""
+        return False
+
+    def _commit(self,data)->None:
+        """压缩/解压的帧被实际发送/接收后更新上下文"""
+
+class ZlibCompressor(Compressor):
+    """
+    zlib(raw deflate)
+
+    保留上下文时双方各维护一个deflate流,每个帧以Z_SYNC_FLUSH结束,对端可以立即解压(与WebSocket permessage-deflate相同)
+    """
+    algorithm_id=1
+    name='zlib'
+
+    def __init__(self,use_context:bool=True,level:int=None,min_size:int=64,max_ratio:float=0.9)->None:
+        super().__init__(use_context,level,min_size,max_ratio)
+        if level is None:
+            self._level=zlib.Z_DEFAULT_COMPRESSION
+        self._compressor=None
+        self._decompressor=None
+
+    def _compress(self,data)->bytes:
+        if not self._use_context:
+            compressor=zlib.compressobj(self._level,zlib.DEFLATED,-zlib.MAX_WBITS)
+            return compressor.compress(data)+compressor.flush()
+        if self._compressor is None:
+            self._compressor=zlib.compressobj(self._level,zlib.DEFLATED,-zlib.MAX_WBITS)
+        out=self._compressor.compress(data)+self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return out[:-4]
+
+    def _decompress(self,data,max_size:int)->bytes:
+        if not self._use_context:
+            decompressor=zlib.decompressobj(-zlib.MAX_WBITS)
+            out=decompressor.decompress(data,max_size)
+            if decompressor.unconsumed_tail or not decompressor.eof:
+                raise ValueError('数据异常')
+            return out
+        if self._decompressor is None:
+            self._decompressor=zlib.decompressobj(-zlib.MAX_WBITS)
+        try:
+            out=self._decompressor.decompress(bytes(data)+_SYNC_TAIL,max_size)
+        except zlib.error:
+            raise ValueError('数据异常')
+        if self._decompressor.unconsumed_tail:
+            raise ValueError('数据长度不合法')
+        return out
+
+    def _absorbed(self)->bool:
+        return self._use_context
+
+class Lz4Compressor(Compressor):
+    """
+    LZ4块格式(需要安装lz4),速度远快于zlib,压缩率较低
+
+    格式: 4字节原始大小(小端)+LZ4块
+    保留上下文时使用最近8KiB已压缩帧的原始数据作为字典
+    """
+    algorithm_id=2
+    name='lz4'
+    # 字典越大每个帧加载字典的开销越大,8KiB对相似的小消息已经足够
+    _HISTORY_SIZE=1<<13
+
+    def __init__(self,use_context:bool=True,level:int=None,min_size:int=64,max_ratio:float=0.9)->None:
+        super().__init__(use_context,level,min_size,max_ratio)
+        self._history=b''
+
+    def _compress(self,data)->bytes:
+        options={'mode':'high_compression','compression':self._level} if self._level else {}
+        if self._history:
+            options['dict']=self._history
+        return lz4_block.compress(data,store_size=True,**options)
+
+    def _decompress(self,data,max_size:int)->bytes:
+        if len(data)<4 or struct.unpack_from('<I',data)[0]>max_size:
+            raise ValueError('数据长度不合法')
+        try:
+            if self._history:
+                return lz4_block.decompress(data,dict=self._history)
+            return lz4_block.decompress(data)
+        except lz4_block.LZ4BlockError:
+            raise ValueError('数据异常')
+
+    def _absorbed(self)->bool:
+        # 没有足够的历史数据时压缩率较差,仍需要发送以积累字典
+        return self._use_context
+
+    def _commit(self,data)->None:
+        if self._use_context:
+            self._history=(self._history+bytes(data))[-self._HISTORY_SIZE:]
+
+COMPRESSORS={compressor.algorithm_id:compressor for compressor in (ZlibCompressor,Lz4Compressor)}
+COMPRESSOR_NAMES={compressor.name:compressor for compressor in COMPRESSORS.values()}
+
+def get_compressor(algorithm)->type:
+    """
+    根据名称或ID获取压缩算法
+
+    @param algorithm:算法名称(zlib,lz4)或ID
+    """
+    compressor=COMPRESSOR_NAMES.get(algorithm) if isinstance(algorithm,str) else COMPRESSORS.get(algorithm)
+    if compressor is None:
+        raise ValueError('不支持的压缩算法')
+    return compressor
+
+def is_available(algorithm)->bool:
+    """判断压缩算法的依赖是否已安装"""
+    return get_compressor(algorithm) is not Lz4Compressor or lz4_block is not None
+
+def pack_offer(algorithms,use_context:bool)->bytes:
+    """构建压缩协商消息"""
+    return COMPRESS_MAGIC+bytes([OPTION_CONTEXT if use_context else 0])+bytes(algorithms)
+
+def parse_offer(data:bytes)->tuple:
+    """
+    解析压缩协商消息
+
+    @return:(对端支持的算法ID,对端发送时是否保留压缩上下文)
+    """
+    if len(data)<9 or data[:8]!=COMPRESS_MAGIC:
+        raise ValueError('压缩协商失败')
+    return bytes(data[9:]),bool(data[8]&OPTION_CONTEXT)
@@ -1,19 +1,42 @@
-import asyncio,socket,hashlib,ssl
+import asyncio,socket,hashlib,hmac,ssl,os,mmap,collections,time
 # import ast
 from .key import Key
+from .key_provider import KeyProvider
+from .buffer import RecvBuffer
+from .protocol import FrameProtocol
+from .send_queue import SendQueue
+from .frame import FrameHeader,FLAG_ENCRYPTED,FLAG_COMPRESSED,FLAG_MORE,FLAG_CODEC,CODEC_BATCH,RAW_BATCH,MIN_HEADER_SIZE,TCP0_MAX_LENGTH,header_size,pack_header,parse_header
+from .frame import escape_line,unescape_line,pack_line_header,parse_line_header,pack_batch,unpack_batch
+from .cipher import Cipher,EaxCipher,DEFAULT_CIPHER_SUITES,get_cipher_suite
+from .compress import Compressor,get_compressor,is_available,pack_offer,parse_offer
+from .codec import Codec,get_codec,pack_offer as pack_codec_offer,parse_offer as parse_codec_offer
+from .metrics import Metrics
+from .ecdh import EphemeralKeyCache,create_private_key,shared_secret,derive_key
+from .ecdh import pack_client_hello,parse_client_hello,pack_server_hello,parse_server_hello
+from .ticket import TicketKeyCache,SessionTicket,RESUME_MAGIC,TICKET_REQUEST,derive_secret,derive_resumed_key
+from .ticket import pack_new_ticket,parse_new_ticket,pack_resume_request,parse_resume_request,pack_resume_reply,parse_resume_reply
 from Crypto.PublicKey import RSA
 from Crypto.Cipher import PKCS1_OAEP
-from Crypto.Cipher import AES
+
+# 设置FLAG_MORE的帧加密时使用的附加认证数据,篡改帧头中的FLAG_MORE会导致解密失败,无法截断或拼接分片消息
+MORE_AAD=b'MCP-MORE'
+# 设置FLAG_COMPRESSED的帧加密时使用的附加认证数据,篡改帧头中的FLAG_COMPRESSED会导致解密失败,避免双方的压缩上下文不一致
+COMPRESSED_AAD=b'MCP-COMP'
+# 设置FLAG_CODEC的帧加密时使用的附加认证数据(之后附加编码器ID),篡改帧头中的编码器ID会导致解密失败
+CODEC_AAD=b'MCP-CODC'
 
 class Connect:
     """
     连接管理类
 
-    注意: 如果你不希望每次连接都生成新的RSA密钥对,请重写get_public_key和get_private_key方法
+    注意: 如果你不希望每次启动都生成新的RSA密钥对,请通过set_key_provider设置密钥提供者(例如FileKeyProvider),或重写get_public_key和get_private_key方法
+    reader既可以是asyncio.StreamReader,也可以是FrameProtocol(此时writer为对应的ProtocolWriter)
     """
     _public_key:RSA.RsaKey
     _private_key:RSA.RsaKey
     _trust_public_key:list
+    # X25519密钥交换时服务端共用的已签名临时密钥
+    _ephemeral_cache=EphemeralKeyCache()
 
     def __init__(self,reader:asyncio.StreamReader,writer:asyncio.StreamWriter,use_aes:bool=False):
         self._reader=reader
@@ -23,15 +46,64 @@ class Connect:
         self._sock:socket.socket=writer.get_extra_info('socket')
         self._recv_buffer_size=self._sock.getsockopt(socket.SOL_SOCKET,socket.SO_RCVBUF)
         self._send_buffer_size=self._sock.getsockopt(socket.SOL_SOCKET,socket.SO_SNDBUF)
+        self._write_high_water=writer.transport.get_write_buffer_limits()[1]
         self._aes_key:bytes=b''
+        self._cipher:Cipher=None
+        self._cipher_suites:tuple=tuple(get_cipher_suite(suite).suite_id for suite in DEFAULT_CIPHER_SUITES)
+        self._key_provider:KeyProvider=None
+        self._key_exchange='rsa'
+        self._ticket_keys:TicketKeyCache=None
+        self._session_ticket:SessionTicket=None
+        self._request_ticket=False
+        self._resumed=False
+        self._crypto_executor=None
+        self._crypto_offload_threshold=1<<20
+        self._send_lock=asyncio.Lock()
+        self._send_queue:SendQueue=None
+        # 压缩配置(算法ID,选项),协商后分别创建发送和接收方向的压缩上下文
+        self._compression:tuple=None
+        self._compressor:Compressor=None
+        self._decompressor:Compressor=None
+        # 可协商的编码器ID,send_obj使用的编码器(未协商时为第一个可用的编码器),批量接收后尚未取出的对象
+        self._codecs:tuple=None
+        self._codec:Codec=get_codec('json')
+        self._recv_objs=collections.deque()
+        # 小消息合并(合并窗口为None表示不合并),合并缓冲区,定时发送的任务及其异常,收到超级帧后尚未取出的消息
+        self._coalesce_delay:float=None
+        self._coalesce_max_bytes=16384
+        self._batch=[]
+        self._batch_size=0
+        self._batch_timer:asyncio.TimerHandle=None
+        self._batch_task:asyncio.Task=None
+        self._batch_exception:Exception=None
+        self._recv_batch=collections.deque()
+        # 性能指标(None表示未启用)
+        self._metrics:Metrics=None
         self._use_line=False
-        self._buffer_temp=b''
+        self._line_codec='escape'
+        self._recv_buffer=RecvBuffer()
+        self._protocol=reader if isinstance(reader,FrameProtocol) else None
+        # 帧格式版本(None:自动,发送MCP-TCP0直到收到对端的MCP-TCP1帧)
+        self._frame_version=None
+        self._send_frame_version=0
+        self._max_frame_size=TCP0_MAX_LENGTH
 
     def use_line(self,use_line:bool=True)->'Connect':
         """设置是否使用行模式"""
         self._use_line=use_line
         return self
 
+    def set_line_codec(self,line_codec:str='escape')->'Connect':
+        """
+        设置行模式的编码方式
+
+        @param line_codec:escape:将换行符转义为“-MCP0-EOL-”(兼容旧版本),length:先发送“-MCP0-LEN<十六进制长度>-”前缀行,再发送原始数据和一个换行符(无需改写数据,接收时仍兼容escape编码的数据)
+        """
+        if line_codec not in ('escape','length'):
+            raise ValueError('行模式编码方式不合法')
+        self._line_codec=line_codec
+        return self
+
     def peername(self)->str:
         """获取对端地址"""
         return self._peername
@@ -44,6 +116,14 @@ class Connect:
         """获取StreamWriter"""
         return self._writer
 
+    def has_unread_data(self)->bool:
+        """判断是否有已接收但未读取的数据(包括传输引擎中缓冲的数据)"""
+        if self._recv_buffer:
+            return True
+        if self._protocol is not None:
+            return self._protocol.has_unread_data()
+        return _stream_buffered(self._reader)>0
+
     def set_recv_buffer_size(self,buffer_size:int)->None:
         """调整接收缓冲区大小"""
         if buffer_size<=0:
@@ -66,15 +146,392 @@ class Connect:
         """获取发送缓冲区大小"""
         return self._send_buffer_size
 
+    def set_frame_version(self,frame_version:int=None)->'Connect':
+        """
+        设置发送数据时使用的帧格式版本(接收时总是自动识别)
+
+        @param frame_version:0:MCP-TCP0(16字节文本帧头),1:MCP-TCP1(6字节起的二进制帧头,支持超过2GiB的数据),None:自动(收到对端的MCP-TCP1帧后切换到MCP-TCP1)
+        """
+        if frame_version not in (None,0,1):
+            raise ValueError('帧格式版本不合法')
+        self._frame_version=frame_version
+        self._send_frame_version=frame_version or 0
+        return self
+
+    def get_frame_version(self)->int:
+        """获取当前发送数据时使用的帧格式版本"""
+        return self._send_frame_version
+
+    def set_max_frame_size(self,max_frame_size:int)->None:
+        """
+        设置允许接收的最大帧大小(默认为0x7fffffff,需要接收超过2GiB的MCP-TCP1帧时请调大)
+        """
+        if max_frame_size<=0:
+            raise ValueError('最大帧大小必须大于0')
+        self._max_frame_size=max_frame_size
+        if self._protocol is not None:
+            self._protocol.set_max_frame_size(max_frame_size)
+
+    def set_write_buffer_limits(self,high:int=None,low:int=None)->None:
+        """
+        调整传输层写缓冲区的高低水位线
+
+        发送数据时只有当写缓冲区超过高水位线时才会等待drain
+        """
+        transport=self.writer().transport
+        transport.set_write_buffer_limits(high,low)
+        self._write_high_water=transport.get_write_buffer_limits()[1]
+
+    def set_send_queue(self,high_water:int,low_water:int=None,policy:str='block')->'Connect':
+        """
+        启用发送队列
+
+        启用后发送数据只会把帧放入队列,由专门的写入任务写入传输层,对端接收过慢时不会阻塞发送方(send返回时数据可能尚未写出,可通过flush等待)
+        队列中未写出的数据超过高水位线时按policy处理
+
+        @param high_water:高水位线(队列中未写出的字节数)
+        @param low_water:低水位线(默认为高水位线的一半,block策略下等待队列降到该值以下)
+        @param policy:block:等待,drop_oldest:丢弃最早的帧,drop_newest:丢弃新的帧,disconnect:断开连接
+        """
+        if self._send_queue is not None:
+            raise ValueError('发送队列已启用')
+        if policy.startswith('drop') and self._compressor is not None and self._compressor.use_context():
+            # 丢弃帧会导致对端的压缩上下文不一致
+            raise ValueError('保留压缩上下文时发送队列不能丢弃帧')
+        self._send_queue=SendQueue(self,high_water,low_water,policy)
+        return self
+
+    def get_send_queue_stats(self)->dict:
+        """获取发送队列统计信息(未启用发送队列时返回None)"""
+        if self._send_queue is None:
+            return None
+        return self._send_queue.stats()
+
+    async def flush(self,timeout:int=0)->None:
+        """立即发送合并缓冲区中的消息,并等待发送队列中的数据全部写入传输层(未启用合并和发送队列时立即返回)"""
+        try:
+            if timeout:
+                await asyncio.wait_for(self._flush(),timeout)
+            else:
+                await self._flush()
+        except asyncio.TimeoutError:
+            raise TimeoutError('发送数据超时')
+
+    async def _flush(self)->None:
+        await self._flush_batch()
+        if self._batch_task is not None:
+            await asyncio.wait((self._batch_task,))
+        if self._batch_exception is not None:
+            raise self._batch_exception
+        if self._send_queue is not None:
+            await self._send_queue.flush()
+
+    def set_coalesce(self,delay:float=0.0005,max_bytes:int=16384)->'Connect':
+        """
+        启用小消息合并(Nagle风格,对端接收时总是自动识别)
+
+        send发送的小消息先放入合并缓冲区,delay秒内的消息合并为一个超级帧,只加密一次、写入一次,对端的recv会透明地拆分为单独的消息
+        缓冲区将超过max_bytes时立即发送,不小于max_bytes的消息不合并;窗口内只有一条消息时按普通帧发送
+        消息放入缓冲区后send立即返回,定时发送失败时在下一次send或flush时抛出异常
+        其他发送方法(send_obj,send_raw,RPC,流式传输等)会先发送缓冲区中的消息以保证顺序
+
+        @param delay:合并窗口(秒,0表示只合并同一轮事件循环中发送的消息)
+        @param max_bytes:超级帧的最大数据大小(字节)
+        """
+        if self._use_line:
+            raise ValueError('行模式不支持合并发送')
+        if self._frame_version==0:
+            raise ValueError('合并发送需要使用MCP-TCP1帧格式')
+        if delay<0 or max_bytes<=0:
+            raise ValueError('合并参数不合法')
+        self._coalesce_delay=delay
+        self._coalesce_max_bytes=max_bytes
+        self._send_frame_version=1
+        return self
+
+    def set_compression(
+            self,algorithms=('zlib',),level:int=None,min_size:int=64,max_ratio:float=0.9,use_context:bool=True
+        )->'Connect':
+        """
+        启用帧压缩(需要通过negotiate_compression与对端协商后才会生效,对端也需要启用)
+
+        数据先压缩再加密,压缩后的帧设置FLAG_COMPRESSED,未压缩的帧与普通帧完全相同
+
+        @param algorithms:可协商的压缩算法(按优先级排列,zlib,lz4,未安装lz4时忽略lz4)
+        @param level:压缩级别(None表示使用算法的默认级别)
+        @param min_size:压缩的最小帧大小(字节,更小的帧直接发送)
+        @param max_ratio:压缩后与原始大小的最大比值(压缩率较差时之后的若干个帧直接发送)
+        @param use_context:是否在帧之间保留压缩上下文(大量相似的小消息也能得到较高的压缩率,每个连接额外占用约300KiB内存,发送队列使用会丢弃帧的策略时不保留)
+        """
+        if self._use_line:
+            raise ValueError('行模式不支持压缩')
+        if not algorithms:
+            raise ValueError('压缩算法不能为空')
+        if min_size<0 or not 0<max_ratio<=1:
+            raise ValueError('压缩参数不合法')
+        available=[]
+        for algorithm in algorithms:
+            compressor=get_compressor(algorithm)
+            if not is_available(compressor.algorithm_id):
+                print(f'未安装{compressor.name},将不使用{compressor.name}压缩')
+                continue
+            available.append(compressor.algorithm_id)
+        options={'level':level,'min_size':min_size,'max_ratio':max_ratio}
+        self._compression=(tuple(available),options,use_context)
+        return self
+
+    async def negotiate_compression(self,is_server:bool,timeout:int=120)->str:
+        """
+        与对端协商压缩算法(需要在密钥交换完成后、收发其他数据前由双方同时调用)
+
+        双方同时发送各自支持的算法,按服务端的优先级选择双方都支持的第一个算法,没有共同支持的算法时不压缩
+        压缩只对MCP-TCP1帧有效,协商成功后自动切换到MCP-TCP1(固定使用MCP-TCP0时不压缩)
+
+        @param is_server:是否为服务端
+        @return:协商的算法名称,不压缩时返回None
+        """
+        if self._compression is None:
+            raise ValueError('未启用压缩')
+        algorithms,options,use_context=self._compression
+        use_context=use_context and not self._drops_frames()
+        await self.send(pack_offer(algorithms,use_context),timeout)
+        offered,peer_context=parse_offer(await self.recv(timeout))
+        if is_server:
+            algorithm=next((algorithm for algorithm in algorithms if algorithm in offered),None)
+        else:
+            algorithm=next((algorithm for algorithm in offered if algorithm in algorithms),None)
+        if algorithm is None:
+            return None
+        compressor=get_compressor(algorithm)
+        self._compressor=compressor(use_context,**options)
+        self._decompressor=compressor(peer_context,**options)
+        if self._frame_version!=0:
+            self._send_frame_version=1
+        return compressor.name
+
+    def get_compression_stats(self)->dict:
+        """获取压缩统计信息(send:发送方向,recv:接收方向,未协商压缩时返回None)"""
+        if self._compressor is None:
+            return None
+        return {'send':self._compressor.stats(),'recv':self._decompressor.stats()}
+
+    def set_metrics(self,enable:bool=True)->'Connect':
+        """
+        设置是否记录性能指标(帧数、字节数以及握手、加密/解密、等待drain等耗时的直方图)
+
+        未启用时各处只多一次判断,几乎没有额外开销;重新启用时会清空之前的数据
+
+        @param enable:是否启用
+        """
+        self._metrics=Metrics() if enable else None
+        return self
+
+    def get_metrics(self)->Metrics:
+        """获取性能指标(未启用时返回None)"""
+        return self._metrics
+
+    def set_codecs(self,codecs=('msgpack','json'))->'Connect':
+        """
+        设置send_obj/recv_obj可使用的编码器(按优先级排列,未安装依赖的编码器会被忽略)
+
+        设置后立即使用第一个可用的编码器,可通过negotiate_codec与对端协商双方都支持的编码器
+        接收时总是按帧头中的编码器ID解码,行模式和MCP-TCP0帧没有编码器ID,使用当前的编码器解码
+
+        @param codecs:编码器名称(json,msgpack或通过register_codec注册的名称)、ID或已注册的编码器实例
+        """
+        available=[]
+        for codec in codecs:
+            codec=get_codec(codec)
+            if not codec.is_available():
+                print(f'未安装{codec.name},将不使用{codec.name}编码')
+                continue
+            available.append(codec.codec_id)
+        if not available:
+            raise ValueError('没有可用的编码器')
+        self._codecs=tuple(available)
+        self._codec=get_codec(available[0])
+        return self
+
+    async def negotiate_codec(self,is_server:bool,timeout:int=120)->str:
+        """
+        与对端协商send_obj使用的编码器(需要在收发其他数据前由双方同时调用)
+
+        双方同时发送各自支持的编码器,按服务端的优先级选择双方都支持的第一个编码器,没有共同支持的编码器时抛出ValueError
+
+        @param is_server:是否为服务端
+        @return:协商的编码器名称
+        """
+        if self._codecs is None:
+            raise ValueError('未设置编码器')
+        await self.send(pack_codec_offer(self._codecs),timeout)
+        offered=parse_codec_offer(await self.recv(timeout))
+        if is_server:
+            codec_id=next((codec_id for codec_id in self._codecs if codec_id in offered),None)
+        else:
+            codec_id=next((codec_id for codec_id in offered if codec_id in self._codecs),None)
+        if codec_id is None:
+            raise ValueError('编码协商失败')
+        self._codec=get_codec(codec_id)
+        return self._codec.name
+
+    def get_codec(self)->Codec:
+        """获取send_obj使用的编码器"""
+        return self._codec
+
+    async def send_obj(self,obj,timeout:int=0)->None:
+        """使用当前的编码器编码并发送一个对象"""
+        await self._send_encoded_obj(self._codec.encode(obj),0,timeout)
+
+    async def send_objs(self,objs,timeout:int=0)->None:
+        """
+        将多个对象批量编码为一个帧发送(大量小对象时可以显著减少帧数和编码/解码调用次数)
+
+        对端通过recv_obj逐个取出或通过recv_objs一次性取出,批量帧需要MCP-TCP1帧头,行模式和固定使用MCP-TCP0时不支持
+        """
+        if self._use_line:
+            raise ValueError('行模式不支持批量发送')
+        if self._frame_version==0:
+            raise ValueError('批量发送需要使用MCP-TCP1帧格式')
+        await self._send_encoded_obj(self._codec.encode_batch(objs),CODEC_BATCH,timeout)
+
+    async def _send_encoded_obj(self,data:bytes,batch:int,timeout:int)->None:
+        # 帧头中携带编码器ID,对端不需要事先知道协商结果(自动模式下切换到MCP-TCP1)
+        flags=0
+        if not self._use_line and self._frame_version!=0:
+            self._send_frame_version=1
+            flags=FLAG_CODEC
+        codec=self._codec.codec_id|batch
+        try:
+            if timeout:
+                await asyncio.wait_for(self._send(data,flags,codec=codec),timeout)
+            else:
+                await self._send(data,flags,codec=codec)
+        except asyncio.TimeoutError:
+            raise TimeoutError('发送数据超时')
+
+    async def recv_obj(self,timeout:int=0):
+        """接收并解码一个对象(收到批量帧时逐个返回其中的对象)"""
+        while not self._recv_objs:
+            self._recv_objs.extend(await self._recv_decoded_objs(timeout))
+        return self._recv_objs.popleft()
+
+    async def recv_objs(self,timeout:int=0)->list:
+        """接收并解码一个帧中的所有对象(有尚未通过recv_obj取出的对象时直接返回这些对象)"""
+        if self._recv_objs:
+            objs=list(self._recv_objs)
+            self._recv_objs.clear()
+            return objs
+        return await self._recv_decoded_objs(timeout)
+
+    async def _recv_decoded_objs(self,timeout:int)->list:
+        header,data=await self._recv_decoded(timeout,-1,0)
+        if not header.flags&FLAG_CODEC:
+            return [self._codec.decode(data)]
+        if header.codec==RAW_BATCH:
+            return [self._codec.decode(message) for message in unpack_batch(data)]
+        codec=get_codec(header.codec&~CODEC_BATCH)
+        if header.codec&CODEC_BATCH:
+            return codec.decode_batch(data)
+        return [codec.decode(data)]
+
+    def _drops_frames(self)->bool:
+        """发送队列是否会丢弃帧"""
+        return self._send_queue is not None and self._send_queue.policy().startswith('drop')
+
     def set_aes_key(self,aes_key:bytes)->None:
-        """设置AES密钥"""
+        """设置AES密钥(使用旧版本的aes-eax加密套件)"""
         self._aes_key=aes_key
+        self._cipher=EaxCipher(aes_key)
+
+    def set_cipher(self,cipher:Cipher)->None:
+        """设置加密套件实例"""
+        self._aes_key=cipher._key
+        self._cipher=cipher
+
+    def get_cipher(self)->Cipher:
+        """获取当前使用的加密套件实例"""
+        return self._cipher
+
+    def set_key_provider(self,key_provider:KeyProvider)->None:
+        """设置密钥交换时使用的RSA密钥提供者(None表示使用get_public_key和get_private_key)"""
+        self._key_provider=key_provider
+
+    def set_key_exchange(self,key_exchange:str='rsa')->'Connect':
+        """
+        设置密钥交换方式(需要与对端保持一致)
+
+        @param key_exchange:rsa:服务端发送RSA公钥,客户端使用RSA-OAEP加密AES密钥(兼容旧版本),x25519:客户端先发送临时公钥,双方通过X25519+HKDF派生会话密钥,服务端使用RSA身份私钥签名临时公钥(一次往返,二进制传输)
+        """
+        if key_exchange not in ('rsa','x25519'):
+            raise ValueError('密钥交换方式不合法')
+        self._key_exchange=key_exchange
+        return self
+
+    def set_ticket_keys(self,ticket_keys:TicketKeyCache)->None:
+        """设置服务端签发/解密会话票据使用的票据密钥缓存(None表示不签发票据)"""
+        self._ticket_keys=ticket_keys
+
+    def use_session_ticket(self,session:SessionTicket=None)->'Connect':
+        """
+        客户端启用会话票据
+
+        密钥交换时会请求服务端签发票据,完成后可通过get_session_ticket获取,下次连接同一服务端时传入即可跳过RSA/X25519运算直接恢复会话
+        票据无效或已过期时会自动进行完整的密钥交换
+
+        @param session:上次连接获取的票据(None表示仅请求签发票据)
+        """
+        self._request_ticket=True
+        self._session_ticket=session
+        return self
+
+    def get_session_ticket(self)->SessionTicket:
+        """获取当前的会话票据(没有可用的票据时返回None)"""
+        return self._session_ticket
+
+    def is_resumed(self)->bool:
+        """判断本次连接是否通过会话票据恢复"""
+        return self._resumed
+
+    def set_crypto_executor(self,executor,offload_threshold:int=1<<20)->None:
+        """
+        设置加密/解密大数据时使用的执行器
+
+        数据大小不小于offload_threshold时,加密/解密将在执行器中进行,避免阻塞事件循环(小数据仍在事件循环中处理)
+        启用后发送数据会按顺序串行化,以保证nonce的顺序与实际发送顺序一致
+
+        @param executor:concurrent.futures.ThreadPoolExecutor等执行器(None表示不使用)
+        @param offload_threshold:使用执行器的数据大小阈值(字节)
+        """
+        if offload_threshold<0:
+            raise ValueError('阈值不能小于0')
+        self._crypto_executor=executor
+        self._crypto_offload_threshold=offload_threshold
+
+    def set_cipher_suites(self,cipher_suites)->'Connect':
+        """
+        设置密钥交换时可协商的加密套件(按优先级排列)
+
+        @param cipher_suites:加密套件名称列表(aes-gcm,chacha20-poly1305,aes-eax),对端为旧版本时总是使用aes-eax
+        """
+        cipher_suites=tuple(get_cipher_suite(suite).suite_id for suite in cipher_suites)
+        if not cipher_suites:
+            raise ValueError('加密套件不能为空')
+        self._cipher_suites=cipher_suites
+        return self
 
     async def key_exchange_to_client(self)->None:
         """
         与客户端进行密钥交换
         """
-        public_key=await Connect.get_public_key()
+        if self._key_exchange=='x25519':
+            await self._x25519_key_exchange_to_client()
+            return
+        if self._key_provider is not None:
+            # 同时获取公钥和私钥,避免密钥交换过程中密钥被轮换
+            public_key,private_key=await self._key_provider.get_key_pair()
+        else:
+            public_key=await Connect.get_public_key()
+            private_key=await Connect.get_private_key()
         public_key=public_key.export_key()
         public_key_fingerprint=hashlib.sha256(public_key).hexdigest()
         print(f'向 {self.peername()} 发送公钥\n{public_key.decode()}\n指纹:{public_key_fingerprint}')
@@ -82,8 +539,17 @@ class Connect:
         await self.send_raw(public_key+b'\n',120)
         pack=await self.recv_raw_line(120)
         pack=bytes.fromhex(pack.decode())
+        if pack.startswith(RESUME_MAGIC):
+            # 客户端在收到公钥前就发送了恢复请求
+            client_random,ticket=parse_resume_request(pack)
+            session=self._open_ticket(ticket)
+            if session is not None:
+                await self.send_raw(self._resume_to_client(client_random,*session).hex().encode()+b'\n',120)
+                return
+            await self.send_raw(pack_resume_reply().hex().encode()+b'\n',120)
+            pack=await self.recv_raw_line(120)
+            pack=bytes.fromhex(pack.decode())
         sign=pack[:32]
-        private_key=await Connect.get_private_key()
         cipher=PKCS1_OAEP.new(private_key)
         data=cipher.decrypt(pack[32:])
         aes_key_length_hex=data[:3]
@@ -93,28 +559,52 @@ class Connect:
         pack=aes_key_length_hex+aes_key+random_bytes
         if hashlib.sha256(pack).digest()!=sign:
             raise ValueError('秘钥交换失败')
-        self.set_aes_key(aes_key)
-        await self.send(random_bytes,120)
+        # 随机字节之后附带客户端支持的加密套件,旧版本客户端不会附带
+        suite=EaxCipher.suite_id
+        if len(random_bytes)>32 and random_bytes[32:41]==b'MCP-SUITE':
+            # 加密套件之后可能附带票据请求
+            offered,ticket_request,_=random_bytes[41:].partition(TICKET_REQUEST)
+            suite=next((suite for suite in self._cipher_suites if suite in offered),EaxCipher.suite_id)
+            new_ticket=b''
+            if ticket_request and self._ticket_keys is not None:
+                new_ticket=self._issue_ticket(derive_secret(aes_key,random_bytes),suite)
+            # 确认消息仍使用aes-eax加密,并在末尾附带选择的加密套件和新票据
+            self.set_aes_key(aes_key)
+            await self.send(random_bytes+bytes([suite])+new_ticket,120)
+        else:
+            self.set_aes_key(aes_key)
+            await self.send(random_bytes,120)
+        self.set_cipher(get_cipher_suite(suite)(aes_key,is_server=True))
 
     async def key_exchange_to_server(self,aes_key_length:int=16)->None:
         """
         与服务器进行密钥交换
         """
+        if self._key_exchange=='x25519':
+            await self._x25519_key_exchange_to_server()
+            return
+        session=self._usable_session()
+        if session is not None:
+            # 不等待服务端公钥,直接发送恢复请求
+            client_random=Key.rand_bytes(32)
+            await self.send_raw(pack_resume_request(client_random,session.ticket).hex().encode()+b'\n',120)
         public_key_text=await self.recv_raw_line(120)
+        if session is not None:
+            reply=await self.recv_raw_line(120)
+            reply=parse_resume_reply(bytes.fromhex(reply.decode()))
+            if reply is not None:
+                self._resume_to_server(session,client_random,*reply)
+                return
+            self._session_ticket=None
         public_key_text=bytes.fromhex(public_key_text.decode()).decode()
         public_key=RSA.import_key(public_key_text)
-        public_key_fingerprint=hashlib.sha256(public_key_text.encode()).hexdigest()
-        print(f'接收到服务器公钥\n{public_key_text}\n指纹:{public_key_fingerprint}')
-        if public_key_text not in await Connect.get_trust_public_key():
-            input_data=input('该公钥来源未知,请确认是否信任该公钥(y/N):')
-            if input_data.lower()=='y':
-                await Connect.save_trust_public_key(public_key_text)
-            else:
-                raise ValueError('公钥认证失败')
+        await self._verify_server_public_key(public_key_text)
         aes_key=Key.create_aes_key(aes_key_length)
         cipher=PKCS1_OAEP.new(public_key)
         aes_key_length_hex=hex(len(aes_key))[2:].zfill(3).encode()
-        random_bytes=Key.rand_bytes(32)
+        random_bytes=Key.rand_bytes(32)+b'MCP-SUITE'+bytes(self._cipher_suites)
+        if self._request_ticket:
+            random_bytes+=TICKET_REQUEST
         pack=aes_key_length_hex+aes_key+random_bytes
         sign=hashlib.sha256(pack).digest()
         pack=cipher.encrypt(pack)
@@ -123,10 +613,149 @@ class Connect:
         self.set_aes_key(aes_key)
         try:
             server_random_bytes=await self.recv(120)
-            if server_random_bytes!=random_bytes:
+            new_ticket=b''
+            if server_random_bytes==random_bytes:
+                # 旧版本服务端会原样返回,使用aes-eax
+                suite=EaxCipher.suite_id
+            elif server_random_bytes.startswith(random_bytes) and server_random_bytes[len(random_bytes)] in self._cipher_suites:
+                suite=server_random_bytes[len(random_bytes)]
+                new_ticket=server_random_bytes[len(random_bytes)+1:]
+            else:
                 raise ValueError('秘钥交换失败')
+            if new_ticket and self._request_ticket:
+                self._session_ticket=parse_new_ticket(new_ticket,derive_secret(aes_key,random_bytes),suite)
         except ValueError:
             raise ValueError('秘钥交换失败')
+        self.set_cipher(get_cipher_suite(suite)(aes_key,is_server=False))
+
+    async def _verify_server_public_key(self,public_key_text:str)->None:
+        """确认服务器公钥是否受信任"""
+        public_key_fingerprint=hashlib.sha256(public_key_text.encode()).hexdigest()
+        print(f'接收到服务器公钥\n{public_key_text}\n指纹:{public_key_fingerprint}')
+        if public_key_text not in await Connect.get_trust_public_key():
+            input_data=input('该公钥来源未知,请确认是否信任该公钥(y/N):')
+            if input_data.lower()=='y':
+                await Connect.save_trust_public_key(public_key_text)
+            else:
+                raise ValueError('公钥认证失败')
+
+    async def _x25519_key_exchange_to_client(self)->None:
+        """通过X25519与客户端进行密钥交换"""
+        client_hello=await self._recv_handshake(120)
+        client_public_bytes,client_random,offered,ticket=parse_client_hello(client_hello)
+        if ticket:
+            session=self._open_ticket(ticket,offered)
+            if session is not None:
+                await self._send_handshake(self._resume_to_client(client_random,*session),120)
+                return
+        if self._key_provider is not None:
+            _,private_key=await self._key_provider.get_key_pair()
+        else:
+            private_key=await Connect.get_private_key()
+        ephemeral=await Connect._ephemeral_cache.get(private_key)
+        suite=next((suite for suite in self._cipher_suites if suite in offered),None)
+        if suite is None:
+            raise ValueError('没有可用的加密套件')
+        server_random=Key.rand_bytes(32)
+        shared=shared_secret(ephemeral.private_key,client_public_bytes)
+        new_ticket=b''
+        if ticket is not None and self._ticket_keys is not None:
+            new_ticket=self._issue_ticket(derive_secret(shared,client_hello+server_random),suite)
+        signature=await asyncio.to_thread(ephemeral.sign,server_random,suite,client_public_bytes,client_random)
+        server_hello=pack_server_hello(ephemeral,server_random,suite,signature,new_ticket)
+        key=derive_key(shared,client_hello,server_hello)
+        await self._send_handshake(server_hello,120)
+        self.set_cipher(get_cipher_suite(suite)(key,is_server=True))
+
+    async def _x25519_key_exchange_to_server(self)->None:
+        """通过X25519与服务器进行密钥交换"""
+        session=self._usable_session()
+        ticket=None
+        if session is not None:
+            ticket=session.ticket
+        elif self._request_ticket:
+            ticket=b''
+        private_key=create_private_key()
+        client_random=Key.rand_bytes(32)
+        public_bytes=private_key.public_key().public_bytes_raw()
+        client_hello=pack_client_hello(public_bytes,client_random,self._cipher_suites,ticket)
+        await self._send_handshake(client_hello,120)
+        server_hello=await self._recv_handshake(120)
+        if server_hello.startswith(RESUME_MAGIC):
+            reply=parse_resume_reply(server_hello)
+            if session is None or reply is None:
+                raise ValueError('秘钥交换失败')
+            self._resume_to_server(session,client_random,*reply)
+            return
+        # 服务端拒绝恢复时直接返回完整的ServerHello
+        self._session_ticket=None
+        server_public_bytes,server_random,suite,identity,new_ticket=parse_server_hello(server_hello,public_bytes,client_random)
+        if suite not in self._cipher_suites:
+            raise ValueError('秘钥交换失败')
+        await self._verify_server_public_key(identity.export_key().decode())
+        shared=shared_secret(private_key,server_public_bytes)
+        if new_ticket and self._request_ticket:
+            self._session_ticket=parse_new_ticket(new_ticket,derive_secret(shared,client_hello+server_random),suite)
+        key=derive_key(shared,client_hello,server_hello)
+        self.set_cipher(get_cipher_suite(suite)(key,is_server=False))
+
+    def _usable_session(self)->SessionTicket:
+        """获取可用于恢复会话的票据"""
+        session=self._session_ticket
+        if session is None or not session.is_valid() or session.suite not in self._cipher_suites:
+            return None
+        return session
+
+    def _issue_ticket(self,secret:bytes,suite:int)->bytes:
+        """签发新票据并构建新票据消息"""
+        return pack_new_ticket(self._ticket_keys.lifetime(),self._ticket_keys.issue(secret,suite))
+
+    def _open_ticket(self,ticket:bytes,offered:bytes=None)->tuple:
+        """
+        解密客户端提交的票据
+
+        @param offered:客户端支持的加密套件(None表示不检查)
+        @return:(恢复密钥,加密套件),无法恢复时返回None
+        """
+        if self._ticket_keys is None:
+            return None
+        session=self._ticket_keys.open(ticket)
+        if session is None:
+            return None
+        suite=session[1]
+        if suite not in self._cipher_suites or (offered is not None and suite not in offered):
+            return None
+        return session
+
+    def _resume_to_client(self,client_random:bytes,secret:bytes,suite:int)->bytes:
+        """服务端恢复会话并返回恢复响应"""
+        server_random=Key.rand_bytes(32)
+        key,mac=derive_resumed_key(secret,client_random,server_random)
+        self.set_cipher(get_cipher_suite(suite)(key,is_server=True))
+        self._resumed=True
+        return pack_resume_reply(server_random,mac)
+
+    def _resume_to_server(self,session:SessionTicket,client_random:bytes,server_random:bytes,mac:bytes)->None:
+        """客户端校验恢复响应并恢复会话"""
+        key,expected_mac=derive_resumed_key(session.secret,client_random,server_random)
+        if not hmac.compare_digest(mac,expected_mac):
+            raise ValueError('秘钥交换失败')
+        self.set_cipher(get_cipher_suite(session.suite)(key,is_server=False))
+        self._resumed=True
+
+    async def _send_handshake(self,data:bytes,timeout:int=0)->None:
+        """发送未加密的握手消息"""
+        try:
+            await asyncio.wait_for(self._send_data(data,False),timeout or None)
+        except asyncio.TimeoutError:
+            raise TimeoutError('发送数据超时')
+
+    async def _recv_handshake(self,timeout:int=0)->bytes:
+        """接收未加密的握手消息"""
+        try:
+            return await asyncio.wait_for(self._recv(),timeout or None)
+        except asyncio.TimeoutError:
+            raise TimeoutError('接收数据超时')
 
     async def recv(self,timeout:int=0,fill_byte:int=64,fill_byte_timeout:float=10)->bytes:
         """
@@ -139,47 +768,171 @@ class Connect:
         @param timeout:超时时间
         @param fill_byte:填充字节次数(当读取到的数据不足时,继续进行读取的次数,如果不合理设置,缓冲区没有数据时会尝试等待)
         @param fille_byte_timeout:填充超时时间(如果缓冲区没有数据时,等待的时间,超时不会抛出异常,但会立即返回已有数据)
+        @return:接收到的数据(一般为bytes,使用protocol引擎时未加密、未压缩的大帧为bytearray,避免再复制一次)
         """
+        if self._recv_batch:
+            return self._recv_batch.popleft()
+        header,data=await self._recv_decoded(timeout,fill_byte,fill_byte_timeout)
+        if header.flags&FLAG_CODEC and header.codec==RAW_BATCH:
+            # 对端合并发送的超级帧
+            messages=unpack_batch(data)
+            self._recv_batch.extend(messages[1:])
+            return messages[0]
+        return data
+
+    async def _recv_decoded(self,timeout:int=0,fill_byte:int=64,fill_byte_timeout:float=10)->tuple:
+        """接收一条消息并完成解密和解压(帧头,数据)"""
         try:
             if timeout:
-                data=await asyncio.wait_for(self._recv(fill_byte,fill_byte_timeout),timeout)
+                header,data=await asyncio.wait_for(self._recv_message(fill_byte,fill_byte_timeout),timeout)
             else:
-                data=await self._recv(fill_byte,fill_byte_timeout)
+                header,data=await self._recv_message(fill_byte,fill_byte_timeout)
         except asyncio.TimeoutError:
             raise TimeoutError('接收数据超时')
-        if not self._use_aes:
-            return data
-        if len(data)<32:
-            raise ValueError('数据异常')
-        iv=data[:16]
-        tag=data[16:32]
-        data=data[32:]
-        cipher=AES.new(self._aes_key,AES.MODE_EAX,iv)
-        try:
-            data=cipher.decrypt_and_verify(data,tag)
-        except ValueError:
-            raise ValueError('数据异常')
+        if self._use_aes:
+            data=await self._decrypt(data,_frame_aad(header.flags,header.codec))
+        if header.flags&FLAG_COMPRESSED:
+            data=await self._decompress(data)
+        return header,data
+
+    async def _decrypt(self,data:bytes,aad:bytes=None)->bytes:
+        """解密数据(大数据交由执行器处理)"""
+        cipher=self._cipher
+        if cipher is None:
+            raise ValueError('尚未完成密钥交换')
+        metrics=self._metrics
+        start=time.perf_counter_ns() if metrics is not None else 0
+        if self._crypto_executor is None or len(data)<self._crypto_offload_threshold:
+            data=cipher.decrypt(data,aad)
+        else:
+            nonce=cipher.verify_nonce(data)
+            loop=asyncio.get_running_loop()
+            data=await loop.run_in_executor(self._crypto_executor,cipher.open,nonce,data,aad)
+        if metrics is not None:
+            metrics.observe('decrypt',time.perf_counter_ns()-start)
         return data
 
+    async def _encrypt(self,data:bytes,aad:bytes=None)->list:
+        """加密数据(大数据交由执行器处理)"""
+        cipher=self._cipher
+        if cipher is None:
+            raise ValueError('尚未完成密钥交换')
+        metrics=self._metrics
+        start=time.perf_counter_ns() if metrics is not None else 0
+        if self._crypto_executor is None or len(data)<self._crypto_offload_threshold:
+            parts=cipher.encrypt(data,aad)
+        else:
+            nonce=cipher.next_nonce()
+            loop=asyncio.get_running_loop()
+            parts=await loop.run_in_executor(self._crypto_executor,cipher.seal,nonce,data,aad)
+        if metrics is not None:
+            metrics.observe('encrypt',time.perf_counter_ns()-start)
+        return parts
+
+    async def _compress(self,data)->tuple:
+        """
+        压缩数据(大数据交由执行器处理)
+
+        @return:(数据,是否已压缩)
+        """
+        compressor=self._compressor
+        if self._crypto_executor is None or len(data)<self._crypto_offload_threshold:
+            compressed=compressor.compress(data)
+        else:
+            loop=asyncio.get_running_loop()
+            compressed=await loop.run_in_executor(self._crypto_executor,compressor.compress,data)
+        if compressed is None:
+            return data,False
+        return compressed,True
+
+    async def _decompress(self,data)->bytes:
+        """解压设置了FLAG_COMPRESSED的帧(大数据交由执行器处理)"""
+        decompressor=self._decompressor
+        if decompressor is None:
+            raise ValueError('数据异常')
+        if self._crypto_executor is None or len(data)<self._crypto_offload_threshold:
+            return decompressor.decompress(data,self._max_frame_size)
+        loop=asyncio.get_running_loop()
+        return await loop.run_in_executor(self._crypto_executor,decompressor.decompress,data,self._max_frame_size)
+
     async def _recv(self,fill_byte:int=0,fill_byte_timeout:float=0.1)->bytes:
         """底层接收数据"""
+        _,data=await self._recv_message(fill_byte,fill_byte_timeout)
+        return data
+
+    async def _recv_message(self,fill_byte:int=0,fill_byte_timeout:float=0.1)->tuple:
+        """底层接收一条消息(帧头,数据),行模式下返回没有标志位的MCP-TCP0帧头"""
         if self._use_line:
             data=await self.recv_raw_line()
-            # 将data中的“-MCP0-EOL-”替换为换行符
-            data=data.replace(b'-MCP0-EOL0-',b'\r\n').replace(b'-MCP0-EOL1-',b'\n').replace(b'-MCP0-EOL2-',b'\r')
-            # 下面这种方法会大量替换字符,效率较低以及在某些情况下大幅度增加数据长度
-            # data=ast.literal_eval(data.decode())
+            # 只有length编码会识别长度前缀行,保证escape编码下的行为与旧版本完全一致
+            data_len=parse_line_header(data) if self._line_codec=='length' else None
+            if data_len is None:
+                # 将data中的“-MCP0-EOL-”替换为换行符
+                data=unescape_line(data)
+                # 下面这种方法会大量替换字符,效率较低以及在某些情况下大幅度增加数据长度
+                # data=ast.literal_eval(data.decode())
+            else:
+                # 长度前缀行之后是原始数据和一个换行符
+                if data_len>self._max_frame_size:
+                    raise ValueError('数据长度不合法')
+                data=await self.recv_raw(data_len,fill_byte=fill_byte,fill_byte_timeout=fill_byte_timeout)
+                if len(data)!=data_len:
+                    raise ValueError('数据异常')
+                if await self.recv_raw_line():
+                    raise ValueError('行数据异常')
+            if self._metrics is not None:
+                self._count_frame('in',len(data))
+            return FrameHeader(0,len(data)),data
+        return await self._recv_frame(fill_byte,fill_byte_timeout)
+
+    async def _recv_frame(self,fill_byte:int=0,fill_byte_timeout:float=0.1)->tuple:
+        """底层接收一个完整的帧(帧头,数据)"""
+        if self._protocol is not None:
+            # 由传输引擎直接完成帧解析,剩余的原始数据交由传输引擎重新解析
+            pending=self._recv_buffer.read() if self._recv_buffer else b''
+            self._protocol.set_frame_mode(True,pending)
+            header,data=await self._protocol.recv_frame()
         else:
-            data=await self.recv_raw(16,fill_byte=fill_byte,fill_byte_timeout=fill_byte_timeout)
-            if data[:8]!=b'MCP-TCP0':
+            data=await self.recv_raw(MIN_HEADER_SIZE,fill_byte=fill_byte,fill_byte_timeout=fill_byte_timeout)
+            if len(data)<MIN_HEADER_SIZE:
                 raise ValueError('响应异常')
-            data_len=int(data[8:16].decode(),16)
-            if data_len<=0 or data_len>0x7fffffff:
+            size=header_size(data)
+            if size>MIN_HEADER_SIZE:
+                data+=await self.recv_raw(size-MIN_HEADER_SIZE,fill_byte=fill_byte,fill_byte_timeout=fill_byte_timeout)
+                if len(data)!=size:
+                    raise ValueError('响应异常')
+            header=parse_header(data)
+            if header.length>self._max_frame_size:
                 raise ValueError('数据长度不合法')
-            data=await self.recv_raw(data_len,fill_byte=fill_byte,fill_byte_timeout=fill_byte_timeout)
-            if len(data)!=data_len:
+            data=await self.recv_raw(header.length,fill_byte=fill_byte,fill_byte_timeout=fill_byte_timeout)
+            if len(data)!=header.length:
+                raise ValueError('数据异常')
+        self._check_frame(header)
+        if self._metrics is not None:
+            self._count_frame('in',header.length)
+        return header,data
+
+    async def _read_frame(self)->tuple:
+        """
+        接收并解密一个完整的帧(帧头,数据),供RPC/多路复用等后台读取任务使用
+
+        与recv不同,总是等待帧数据全部到达,不会因为缓冲区暂时没有数据而返回不完整的帧
+        """
+        header,data=await self._recv_frame(-1,0)
+        if self._use_aes:
+            data=await self._decrypt(data,_frame_aad(header.flags,header.codec))
+        if header.flags&FLAG_COMPRESSED:
+            data=await self._decompress(data)
+        return header,data
+
+    def _check_frame(self,header:FrameHeader)->None:
+        """校验帧头并完成帧格式版本协商"""
+        if header.version==1:
+            if self._frame_version is None:
+                self._send_frame_version=1
+            # 完成密钥交换后不再接受未加密的帧
+            if self._use_aes and self._cipher is not None and not header.flags&FLAG_ENCRYPTED:
                 raise ValueError('数据异常')
-        return data
 
     async def recv_raw(self,byte:int,timeout:int=0,fill_byte:int=0,fill_byte_timeout:float=0.1)->bytes:
         """
@@ -190,7 +943,7 @@ class Connect:
 
         @param byte:指定的读取大小
         @param timeout:超时时间
-        @param fill_byte:填充字节次数(当读取到的数据不足时,继续进行读取的次数,如果不合理设置,缓冲区没有数据时会尝试等待)
+        @param fill_byte:填充字节次数(当读取到的数据不足时,继续进行读取的次数,如果不合理设置,缓冲区没有数据时会尝试等待,小于0时不限制次数)
         @param fille_byte_timeout:填充超时时间(如果缓冲区没有数据时,等待的时间,超时不会抛出异常,但会立即返回已有数据)
         """
         try:
@@ -205,24 +958,16 @@ class Connect:
     async def _recv_raw(self,byte:int,fill_byte:int=0,fill_byte_timeout:float=0.1)->bytes:
         """底层接收原始数据"""
         reader=self.reader()
-        data=b''
+        buffer=self._recv_buffer
+        if self._protocol is not None:
+            self._protocol.set_frame_mode(False)
         # 优先读取缓冲区中的数据
-        if self._buffer_temp:
-            bufer_temp_len=len(self._buffer_temp)
-            if bufer_temp_len>=byte:
-                data=self._buffer_temp[:byte]
-                self._buffer_temp=self._buffer_temp[byte:]
-                return data
-            else:
-                data=self._buffer_temp
-                byte-=bufer_temp_len
-                self._buffer_temp=b''
+        need=byte-len(buffer)
         is_fill_byte=False
-        while byte>0:
-            temp=b''
-            # read_size=min(byte,self._recv_buffer_size)
+        while need>0:
+            # read_size=min(need,self._recv_buffer_size)
             # 下面的代码实测效率更高
-            read_size=byte if byte<self._recv_buffer_size else self._recv_buffer_size
+            read_size=need if need<self._recv_buffer_size else self._recv_buffer_size
             try:
                 if is_fill_byte and fill_byte_timeout>0:
                     temp=await asyncio.wait_for(reader.read(read_size),fill_byte_timeout)
@@ -233,14 +978,15 @@ class Connect:
             if not temp:
                 break
             temp_len=len(temp)
-            byte-=temp_len
-            data+=temp
+            need-=temp_len
+            buffer.feed(temp)
             if temp_len<read_size:
-                if fill_byte<=0:
+                if fill_byte==0:
                     break
                 is_fill_byte=True
-                fill_byte-=1
-        return data
+                if fill_byte>0:
+                    fill_byte-=1
+        return buffer.read(byte)
 
     async def recv_raw_line(self,timeout:int=0)->bytes:
         """接收原始行数据"""
@@ -256,35 +1002,26 @@ class Connect:
     async def _recv_raw_line(self)->bytes:
         """底层接收原始行数据"""
         reader=self.reader()
-        eol_list=[b'\r\n',b'\n',b'\r']
-        data=bytearray()
-        # 优先读取缓冲区中的数据
-        if self._buffer_temp:
-            for eol in eol_list:
-                index=self._buffer_temp.find(eol)
-                if index>=0:
-                    data.extend(self._buffer_temp[:index])
-                    self._buffer_temp=self._buffer_temp[index+len(eol):]
-                    return bytes(data)
-            data.extend(self._buffer_temp)
-            self._buffer_temp=b''
+        buffer=self._recv_buffer
+        if self._protocol is not None:
+            self._protocol.set_frame_mode(False)
         while True:
+            # 优先读取缓冲区中的数据
+            data=buffer.read_line()
+            if data is not None:
+                return data
             # 读取一个缓冲区片的数据
             temp=await reader.read(self._recv_buffer_size)
             if not temp:
                 break
-            # 查找换行符
-            for eol in eol_list:
-                index=temp.find(eol)
-                if index>=0:
-                    data.extend(temp[:index])
-                    self._buffer_temp=temp[index+len(eol):]
-                    return bytes(data)
-            data.extend(temp)
+            buffer.feed(temp)
         raise ValueError('行数据异常')
 
     async def send(self,data:bytes,timeout:int=0)->None:
-        """发送数据"""
+        """发送数据(启用小消息合并时可能只放入合并缓冲区)"""
+        if self._coalesce_delay is not None and len(data)<self._coalesce_max_bytes:
+            await self._coalesce(data,timeout)
+            return
         try:
             if timeout:
                 await asyncio.wait_for(self._send(data),timeout)
@@ -293,28 +1030,317 @@ class Connect:
         except asyncio.TimeoutError:
             raise TimeoutError('发送数据超时')
 
-    async def _send(self,data:bytes)->None:
-        """底层发送数据"""
-        if self._use_aes:
-            iv=Key.rand_iv(16)
-            cipher=AES.new(self._aes_key,AES.MODE_EAX,iv)
-            ciphertext,tag=cipher.encrypt_and_digest(data)
-            data=iv+tag+ciphertext
+    async def _send(self,data:bytes,flags:int=0,request_id:int=0,stream_id:int=0,codec:int=0)->None:
+        """
+        底层发送数据
+
+        @param flags:附加的帧标志位(仅MCP-TCP1有效)
+        @param request_id:RPC请求ID(设置FLAG_REQUEST或FLAG_RESPONSE时有效)
+        @param stream_id:流ID(设置FLAG_STREAM时有效)
+        @param codec:编码器ID(设置FLAG_CODEC时有效)
+        """
+        if self._batch:
+            # 先发送合并缓冲区中的消息,保证顺序(必须在加密之前,nonce顺序需要与发送顺序一致)
+            await self._flush_batch()
+        if self._crypto_executor is not None and (self._use_aes or self._compressor is not None):
+            # 加密/压缩可能在执行器中进行,需要保证加密/压缩顺序与发送顺序一致
+            async with self._send_lock:
+                await self._send_data(data,True,flags,request_id,stream_id,codec)
+        else:
+            await self._send_data(data,True,flags,request_id,stream_id,codec)
+
+    async def _coalesce(self,data:bytes,timeout:int)->None:
+        """放入合并缓冲区(缓冲区将超过max_bytes时先发送缓冲区中的消息)"""
+        if self._batch_exception is not None:
+            raise self._batch_exception
+        if not isinstance(data,bytes):
+            # send返回后调用方可能修改可变的缓冲区
+            data=bytes(data)
+        size=len(data)+4
+        if self._batch and self._batch_size+size>self._coalesce_max_bytes:
+            try:
+                if timeout:
+                    await asyncio.wait_for(self._flush_batch(),timeout)
+                else:
+                    await self._flush_batch()
+            except asyncio.TimeoutError:
+                raise TimeoutError('发送数据超时')
+        self._batch.append(data)
+        self._batch_size+=size
+        if self._batch_timer is None:
+            loop=asyncio.get_running_loop()
+            if self._coalesce_delay:
+                self._batch_timer=loop.call_later(self._coalesce_delay,self._batch_timeout)
+            else:
+                self._batch_timer=loop.call_soon(self._batch_timeout)
+
+    def _batch_timeout(self)->None:
+        """合并窗口结束,在后台任务中发送合并缓冲区中的消息"""
+        self._batch_timer=None
+        if self._batch and self._batch_task is None:
+            self._batch_task=asyncio.get_running_loop().create_task(self._flush_batch())
+            self._batch_task.add_done_callback(self._batch_sent)
+
+    def _batch_sent(self,task:asyncio.Task)->None:
+        self._batch_task=None
+        if not task.cancelled() and task.exception() is not None and self._batch_exception is None:
+            self._batch_exception=task.exception()
+        if self._batch and self._batch_timer is None:
+            # 发送期间窗口已经结束的消息
+            self._batch_timer=asyncio.get_running_loop().call_soon(self._batch_timeout)
+
+    async def _flush_batch(self)->None:
+        """发送合并缓冲区中的消息(只有一条时按普通帧发送)"""
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer=None
+        batch=self._batch
+        if not batch:
+            return
+        self._batch=[]
+        self._batch_size=0
+        if len(batch)==1:
+            await self._send(batch[0])
+        else:
+            await self._send(pack_batch(batch),FLAG_CODEC,codec=RAW_BATCH)
+
+    async def _send_data(self,data:bytes,encrypt:bool=True,flags:int=0,request_id:int=0,stream_id:int=0,codec:int=0)->None:
+        """压缩、加密并发送一个帧(不加密的握手消息也不压缩)"""
+        if encrypt and self._compressor is not None and self._send_frame_version==1:
+            data,compressed=await self._compress(data)
+            if compressed:
+                flags|=FLAG_COMPRESSED
+        parts=[data]
+        encrypt=encrypt and self._use_aes
+        if encrypt:
+            parts=await self._encrypt(data,_frame_aad(flags,codec))
+        if self._metrics is not None:
+            self._count_frame('out',sum(len(part) for part in parts))
+        await self._send_parts(self._frame(parts,encrypt,flags,request_id,stream_id,codec))
+
+    def _frame(self,parts:list,encrypted:bool=False,flags:int=0,request_id:int=0,stream_id:int=0,codec:int=0)->list:
+        """为数据添加帧头(或进行行模式编码),返回需要依次发送的缓冲区列表"""
+        if self._use_line and self._line_codec=='length':
+            data_len=sum(len(part) for part in parts)
+            return [pack_line_header(data_len),*parts,b'\n']
         if self._use_line:
+            data=b''.join(parts) if len(parts)>1 else parts[0]
             # 将data中的换行符替换为“-MCP0-EOL-”
-            data=data.replace(b'\r\n',b'-MCP0-EOL0-').replace(b'\n',b'-MCP0-EOL1-').replace(b'\r',b'-MCP0-EOL2-')
+            data=escape_line(data)
             # 下面这种方法会大量替换字符,效率较低以及在某些情况下大幅度增加数据长度
             # data=repr(data).encode()
-            data=data+b'\n'
-            await self.send_raw(data)
-        else:
-            data_len=len(data)
-            if data_len<=0 or data_len>0x7fffffff:
-                raise ValueError('数据长度不合法')
-            data_len=hex(data_len)[2:]
-            data_len=data_len.zfill(8)
-            data=b'MCP-TCP0'+data_len.encode()+data
-            await self.send_raw(data)
+            return [data,b'\n']
+        data_len=sum(len(part) for part in parts)
+        if encrypted:
+            flags|=FLAG_ENCRYPTED
+        return [pack_header(data_len,self._send_frame_version,flags,stream_id,request_id,codec),*parts]
+
+    async def send_stream(self,source,timeout:int=0,chunk_size:int=1<<16)->int:
+        """
+        流式发送数据(不需要一次性准备好全部数据,内存占用只与分片大小有关)
+
+        每个分片单独作为一个MCP-TCP1帧发送(使用AES时单独加密和认证),除最后一个分片外都设置FLAG_MORE,最后一个分片即结束标记
+        对端使用recv_stream接收,最后一个分片与普通帧完全相同,因此对端也可以用recv一次性接收(仅适合较小的数据)
+        发送期间不要在同一连接上同时发送其他数据,否则分片之间会插入其他帧
+
+        @param source:数据来源(bytes,可迭代对象或异步可迭代对象,每次产生一段bytes,超过chunk_size的数据会被拆分)
+        @param timeout:单个分片的发送超时时间
+        @param chunk_size:单个分片的最大字节数
+        @return:发送的总字节数
+        """
+        if self._use_line:
+            raise ValueError('行模式不支持流式传输')
+        if chunk_size<=0:
+            raise ValueError('分片大小必须大于0')
+        if self._drops_frames():
+            # 丢弃分片会导致对端收到不完整的数据
+            raise ValueError('流式传输不支持会丢弃数据的发送队列策略')
+        self._use_stream_frames()
+        total=0
+        pending=None
+        async for chunk in _iter_chunks(source,chunk_size):
+            if pending is not None:
+                await self._send_chunk(pending,True,timeout)
+            pending=chunk
+            total+=len(chunk)
+        await self._send_chunk(pending if pending is not None else b'',False,timeout)
+        return total
+
+    async def _send_chunk(self,data,more:bool,timeout:int)->None:
+        try:
+            if timeout:
+                await asyncio.wait_for(self._send(data,FLAG_MORE if more else 0),timeout)
+            else:
+                await self._send(data,FLAG_MORE if more else 0)
+        except asyncio.TimeoutError:
+            raise TimeoutError('发送数据超时')
+
+    async def recv_stream(self,timeout:int=0):
+        """
+        流式接收数据(异步生成器,逐个产生分片,直到收到最后一个分片)
+
+        用法: async for chunk in connect.recv_stream(): ...
+
+        @param timeout:单个分片的接收超时时间
+        """
+        if self._use_line:
+            raise ValueError('行模式不支持流式传输')
+        while True:
+            try:
+                if timeout:
+                    header,data=await asyncio.wait_for(self._read_frame(),timeout)
+                else:
+                    header,data=await self._read_frame()
+            except asyncio.TimeoutError:
+                raise TimeoutError('接收数据超时')
+            if data:
+                yield data
+            if not header.flags&FLAG_MORE:
+                return
+
+    async def send_file(self,file,offset:int=0,count:int=None,timeout:int=0,chunk_size:int=1<<23)->int:
+        """
+        发送文件(分片格式与send_stream相同,对端使用recv_file或recv_stream接收)
+
+        未加密的连接通过loop.sendfile由内核直接发送文件内容(每个分片先写入帧头),不经过Python内存(也不会压缩)
+        使用SSL/TLS或AES加密时通过mmap映射文件,按分片加密/发送,不会一次性读入整个文件
+        发送期间不要在同一连接上同时发送其他数据
+
+        @param file:文件路径或以二进制模式打开的文件对象(没有fileno的文件对象会按分片读取)
+        @param offset:起始位置
+        @param count:发送的字节数(默认为None,即发送到文件末尾)
+        @param timeout:单个分片的发送超时时间
+        @param chunk_size:单个分片的最大字节数
+        @return:发送的总字节数
+        """
+        if self._use_line:
+            raise ValueError('行模式不支持发送文件')
+        if offset<0 or chunk_size<=0:
+            raise ValueError('参数不合法')
+        if isinstance(file,(str,bytes,os.PathLike)):
+            with open(file,'rb') as f:
+                return await self.send_file(f,offset,count,timeout,chunk_size)
+        try:
+            fileno=file.fileno()
+        except (AttributeError,OSError):
+            fileno=None
+        if fileno is None:
+            file.seek(offset)
+            return await self.send_stream(_read_chunks(file,count,chunk_size),timeout,chunk_size)
+        size=os.fstat(fileno).st_size
+        if count is None:
+            count=max(size-offset,0)
+        elif offset+count>size:
+            raise ValueError('超出文件大小')
+        if not self._use_aes and self._writer.get_extra_info('sslcontext') is None:
+            return await self._sendfile(file,offset,count,timeout,chunk_size)
+        if not count:
+            return await self.send_stream(b'',timeout,chunk_size)
+        # mmap的偏移量需要按分配粒度对齐
+        start=offset-offset%mmap.ALLOCATIONGRANULARITY
+        mapped=mmap.mmap(fileno,offset-start+count,access=mmap.ACCESS_READ,offset=start)
+        try:
+            with memoryview(mapped) as view:
+                return await self.send_stream(view[offset-start:],timeout,chunk_size)
+        finally:
+            try:
+                mapped.close()
+            except BufferError:
+                # 仍有分片在发送队列中引用映射,交由垃圾回收关闭
+                pass
+
+    async def _sendfile(self,file,offset:int,count:int,timeout:int,chunk_size:int)->int:
+        """通过loop.sendfile发送文件(帧头直接写入传输层,文件内容由内核发送)"""
+        self._use_stream_frames()
+        # sendfile直接写入套接字,需要先写出发送队列中的数据以保证顺序
+        await self.flush()
+        loop=asyncio.get_running_loop()
+        transport=self._writer.transport
+        sent=0
+        while True:
+            size=min(count-sent,chunk_size)
+            more=sent+size<count
+            self._write_parts([pack_header(size,1,FLAG_MORE if more else 0)])
+            if self._metrics is not None:
+                self._count_frame('out',size)
+            if size:
+                coro=loop.sendfile(transport,file,offset+sent,size)
+                try:
+                    await (asyncio.wait_for(coro,timeout) if timeout else coro)
+                except asyncio.TimeoutError:
+                    raise TimeoutError('发送数据超时')
+            else:
+                await self._drain_if_needed()
+            sent+=size
+            if not more:
+                return sent
+
+    async def recv_file(self,file,timeout:int=0)->int:
+        """
+        接收send_file/send_stream发送的数据并写入文件(每个分片到达后直接写入,不会在内存中拼接完整的数据)
+
+        @param file:文件路径或以二进制模式打开的文件对象(路径对应的文件会被覆盖)
+        @param timeout:单个分片的接收超时时间
+        @return:接收的总字节数
+        """
+        if isinstance(file,(str,bytes,os.PathLike)):
+            with open(file,'wb') as f:
+                return await self.recv_file(f,timeout)
+        total=0
+        async for chunk in self.recv_stream(timeout):
+            # 写入磁盘可能阻塞,交由线程执行
+            await asyncio.to_thread(file.write,chunk)
+            total+=len(chunk)
+        return total
+
+    def _use_stream_frames(self)->None:
+        """分片需要使用MCP-TCP1帧(自动模式下直接切换,对端接收时总是自动识别)"""
+        if self._send_frame_version==1:
+            return
+        if self._frame_version==0:
+            raise ValueError('流式传输需要使用MCP-TCP1帧格式')
+        self._send_frame_version=1
+
+    def encoding_key(self)->tuple:
+        """
+        获取发送数据时的编码方式(编码方式相同的连接可以共用同一份编码后的数据)
+
+        @return:使用AES加密时每个连接的数据都不同,返回None
+        """
+        if self._use_aes:
+            return None
+        return (self._use_line,self._line_codec,self._send_frame_version)
+
+    def encode(self,data:bytes)->list:
+        """按当前连接的编码方式为未加密的数据添加帧头,返回可以通过send_encoded发送的缓冲区列表"""
+        return self._frame([data])
+
+    async def send_encoded(self,parts:list,timeout:int=0,size:int=None)->None:
+        """
+        发送已编码的数据(通常由encode或其他编码方式相同的连接生成,用于广播时共用同一份数据)
+
+        @param parts:需要依次发送的缓冲区列表
+        @param size:编码前的数据长度(仅用于性能指标,默认为None即从缓冲区列表中扣除帧头/行结束符计算)
+        """
+        if self._batch:
+            await self._flush_batch()
+        if self._metrics is not None:
+            self._count_frame('out',self._encoded_size(parts) if size is None else size)
+        try:
+            if timeout:
+                await asyncio.wait_for(self._send_parts(parts),timeout)
+            else:
+                await self._send_parts(parts)
+        except asyncio.TimeoutError:
+            raise TimeoutError('发送数据超时')
+
+    def _encoded_size(self,parts:list)->int:
+        """获取encode生成的缓冲区列表中帧数据的长度(不含帧头,行模式转义后的长度可能略大于原始数据)"""
+        if self._use_line:
+            if self._line_codec=='length':
+                return sum(len(part) for part in parts[1:-1])
+            return sum(len(part) for part in parts[:-1])
+        return sum(len(part) for part in parts[1:])
 
     async def send_raw(self,data:bytes,timeout:int=0)->None:
         """发送原始数据"""
@@ -328,19 +1354,66 @@ class Connect:
 
     async def _send_raw(self,data:bytes)->None:
         """底层发送原始数据"""
+        if self._batch:
+            await self._flush_batch()
+        await self._send_parts([data])
+
+    async def _send_parts(self,parts:list)->None:
+        """
+        批量发送多个缓冲区(不拼接数据)
+
+        小数据通过writelines合并为一次写入,大数据逐个交给传输层避免整体复制
+        只有当写缓冲区超过高水位线或连接正在关闭时才会等待drain
+        启用发送队列时只放入队列,由写入任务完成写入和drain
+        """
+        if self._send_queue is not None:
+            await self._send_queue.put(parts)
+            return
+        self._write_parts(parts)
+        await self._drain_if_needed()
+
+    def _write_parts(self,parts:list)->None:
+        """将缓冲区列表写入传输层"""
         writer=self.writer()
-        while data:
-            # write_size=min(len(data),self._send_buffer_size)
-            # 下面的代码实测效率更高
-            data_length=len(data)
-            write_size=data_length if data_length<self._send_buffer_size else self._send_buffer_size
-            writer.write(data[:write_size])
-            data=data[write_size:]
-            await writer.drain()
+        if len(parts)==1:
+            writer.write(parts[0])
+        elif sum(len(part) for part in parts)<=self._send_buffer_size:
+            writer.writelines(parts)
+        else:
+            for part in parts:
+                writer.write(part)
+
+    async def _drain_if_needed(self)->None:
+        """写缓冲区超过高水位线或连接正在关闭时等待drain"""
+        writer=self.writer()
+        transport=writer.transport
+        if transport.get_write_buffer_size()>self._write_high_water or transport.is_closing():
+            metrics=self._metrics
+            if metrics is None:
+                await writer.drain()
+                return
+            start=time.perf_counter_ns()
+            try:
+                await writer.drain()
+            finally:
+                metrics.observe('drain',time.perf_counter_ns()-start)
+
+    def _count_frame(self,direction:str,size:int)->None:
+        """记录收发的帧数和帧数据字节数(direction为in或out)"""
+        counters=self._metrics.counters
+        counters['frames_'+direction]+=1
+        counters['bytes_'+direction]+=size
 
     async def close(self)->None:
         """关闭连接"""
         try:
+            if self._batch:
+                try:
+                    await self._flush_batch()
+                except Exception:
+                    pass
+            if self._send_queue is not None:
+                self._send_queue.close()
             writer=self.writer()
             if writer.is_closing():
                 return
@@ -349,6 +1422,34 @@ class Connect:
         except (ConnectionResetError,ssl.SSLError):
             pass
 
+    async def wait_eof(self)->None:
+        """
+        等待对端关闭连接或半关闭(已到达的数据会保留给之后的读取)
+
+        FrameProtocol收到EOF后会直接关闭连接,StreamReader则会保持半关闭状态,需要预读数据直到读取到EOF
+        """
+        # wait_closed等待的是连接共享的Future,需要shield避免取消时影响后续的关闭操作
+        closed=asyncio.shield(self.writer().wait_closed())
+        if self._protocol is not None:
+            await closed
+            return
+        reader=self._reader
+        buffer=self._recv_buffer
+        try:
+            while len(buffer)<self._recv_buffer_size:
+                # 预读的数据放入接收缓冲区,之后的读取会优先使用
+                data=await reader.read(self._recv_buffer_size)
+                if not data:
+                    return
+                buffer.feed(data)
+            # 预读的数据已达上限,不再继续接收,只等待连接关闭
+            await closed
+        except OSError:
+            # 连接异常断开,异常会在之后的读取中再次抛出
+            pass
+        finally:
+            closed.cancel()
+
     @staticmethod
     async def get_trust_public_key()->list:
         """获取受到信任的公钥"""
@@ -377,19 +1478,68 @@ class Connect:
     @staticmethod
     async def get_public_key()->RSA.RsaKey:
         """获取RSA公钥"""
-        if hasattr(Connect,'_public_key'):
-            return Connect._public_key
-        public_key,private_key=Key.create_rsa_key(1024)
-        Connect._public_key=public_key
-        Connect._private_key=private_key
-        return public_key
+        if not hasattr(Connect,'_public_key'):
+            await Connect._create_rsa_key()
+        return Connect._public_key
 
     @staticmethod
     async def get_private_key()->RSA.RsaKey:
         """获取RSA私钥"""
-        if hasattr(Connect,'_private_key'):
-            return Connect._private_key
-        public_key,private_key=Key.create_rsa_key(1024)
-        Connect._public_key=public_key
-        Connect._private_key=private_key
-        return private_key
\ No newline at end of file
+        if not hasattr(Connect,'_private_key'):
+            await Connect._create_rsa_key()
+        return Connect._private_key
+
+    @staticmethod
+    async def _create_rsa_key()->None:
+        """在线程中生成默认的RSA密钥对,避免阻塞事件循环"""
+        public_key,private_key=await asyncio.to_thread(Key.create_rsa_key,1024)
+        # 并发生成时只保留第一个完成的密钥对
+        if not hasattr(Connect,'_private_key'):
+            Connect._public_key=public_key
+            Connect._private_key=private_key
+
+def _frame_aad(flags:int,codec:int=0)->bytes:
+    """根据帧标志位获取加密时使用的附加认证数据(没有需要认证的标志位时返回None,与旧版本兼容)"""
+    aad=(MORE_AAD if flags&FLAG_MORE else b'')+(COMPRESSED_AAD if flags&FLAG_COMPRESSED else b'')
+    if flags&FLAG_CODEC:
+        aad+=CODEC_AAD+bytes([codec])
+    return aad or None
+
+async def _iter_chunks(source,chunk_size:int):
+    """将bytes,可迭代对象或异步可迭代对象转换为不超过chunk_size的分片(大数据通过memoryview切分,不复制)"""
+    if isinstance(source,(bytes,bytearray,memoryview)):
+        source=(source,)
+    if hasattr(source,'__aiter__'):
+        async for chunk in source:
+            for part in _split(chunk,chunk_size):
+                yield part
+    else:
+        for chunk in source:
+            for part in _split(chunk,chunk_size):
+                yield part
+
+def _split(chunk,chunk_size:int):
+    if len(chunk)<=chunk_size:
+        if chunk:
+            yield chunk
+        return
+    view=memoryview(chunk)
+    for pos in range(0,len(view),chunk_size):
+        yield view[pos:pos+chunk_size]
+
+def _read_chunks(file,count:int,chunk_size:int):
+    """从不支持fileno的文件对象中按分片读取数据"""
+    remaining=count
+    while remaining is None or remaining>0:
+        size=chunk_size if remaining is None else min(chunk_size,remaining)
+        chunk=file.read(size)
+        if not chunk:
+            return
+        if remaining is not None:
+            remaining-=len(chunk)
+        yield chunk
+
+def _stream_buffered(reader:asyncio.StreamReader)->int:
+    """获取StreamReader中已接收但未读取的字节数(StreamReader没有提供公开接口,只在这里访问其内部缓冲区)"""
+    buffer=getattr(reader,'_buffer',None)
+    return len(buffer) if buffer is not None else 0
@@ -0,0 +1,192 @@
+import asyncio,hashlib,struct,time
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey,X25519PublicKey
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import pss
+
+# X25519密钥交换消息格式(均为二进制,通过帧传输)
+# ClientHello: 魔数+版本+客户端临时公钥(32)+客户端随机数(32)+加密套件数量(1)+加密套件列表[+票据长度(2)+票据]
+# ServerHello: 魔数+版本+服务端临时公钥(32)+服务端随机数(32)+加密套件(1)+签名过期时间(8)+身份公钥长度(2)+身份公钥(DER)+签名长度(2)+签名[+新票据长度(2)+新票据]
+# 签名覆盖服务端临时公钥、过期时间(Unix时间戳,秒)、加密套件以及双方的随机数和客户端临时公钥,每个连接单独签名,无法被重放到其他连接
+# 客户端附带长度为0的票据表示请求服务端签发票据
+ECDH_MAGIC=b'MCP-ECDH'
+ECDH_VERSION=2
+# 客户端校验签名过期时间时允许的时钟偏差(秒)
+CLOCK_SKEW=300
+_prefix_struct=struct.Struct('!8sB32s32s')
+_u16_struct=struct.Struct('!H')
+_u64_struct=struct.Struct('!Q')
+
+class EphemeralKey:
+    """
+    服务端临时密钥
+
+    @param identity:签名使用的身份私钥
+    @param lifetime:有效期(秒)
+    """
+    __slots__=('identity','private_key','public_bytes','identity_der','expires','valid_until')
+
+    def __init__(self,identity:RSA.RsaKey,lifetime:float)->None:
+        self.identity=identity
+        self.private_key=X25519PrivateKey.generate()
+        self.public_bytes=self.private_key.public_key().public_bytes_raw()
+        self.identity_der=identity.publickey().export_key('DER')
+        # 过期时间(time.monotonic),用于缓存淘汰
+        self.expires=time.monotonic()+lifetime
+        # 签名中的过期时间(Unix时间戳),不大于0的有效期只需要覆盖本次握手
+        self.valid_until=int(time.time()+max(lifetime,0))+1
+
+    def sign(self,server_random:bytes,suite:int,client_public_bytes:bytes,client_random:bytes)->bytes:
+        """为本次握手签名(RSA运算较慢,应在线程中调用)"""
+        data=_signed_data(self.public_bytes,server_random,suite,self.valid_until,client_public_bytes,client_random)
+        return pss.new(self.identity).sign(SHA256.new(data))
+
+class EphemeralKeyCache:
+    """
+    服务端临时密钥缓存
+
+    在有效期内所有连接共用同一个临时公钥,签名则绑定每个连接的随机数和客户端临时公钥,需要逐个进行
+    每个连接仍使用客户端的临时公钥和双方的随机数派生独立的会话密钥
+
+    @param lifetime:临时密钥有效期(秒),不大于0时每个连接都会生成新的临时密钥
+    """
+
+    def __init__(self,lifetime:float=60)->None:
+        self._lifetime=lifetime
+        self._key:EphemeralKey=None
+
+    async def get(self,identity:RSA.RsaKey)->EphemeralKey:
+        """获取使用指定身份私钥签名的临时密钥(导出身份公钥在线程中进行)"""
+        key=self._key
+        if key is not None and key.identity is identity and key.expires>time.monotonic():
+            return key
+        key=await asyncio.to_thread(EphemeralKey,identity,self._lifetime)
+        if self._lifetime>0:
+            self._key=key
+        return key
+
+def _signed_data(public_bytes:bytes,server_random:bytes,suite:int,valid_until:int,client_public_bytes:bytes,client_random:bytes)->bytes:
+    return b''.join((
+        ECDH_MAGIC,b'-SIG',bytes([ECDH_VERSION,suite]),_u64_struct.pack(valid_until),
+        public_bytes,server_random,client_public_bytes,client_random
+    ))
+
+def create_private_key()->X25519PrivateKey:
+    """生成客户端临时私钥"""
+    return X25519PrivateKey.generate()
+
+def pack_client_hello(public_bytes:bytes,client_random:bytes,suites:tuple,ticket:bytes=None)->bytes:
+    """
+    构建ClientHello
+
+    @param ticket:用于恢复会话的票据(b''表示仅请求签发票据,None表示不使用票据)
+    """
+    data=_prefix_struct.pack(ECDH_MAGIC,ECDH_VERSION,public_bytes,client_random)+bytes([len(suites)])+bytes(suites)
+    if ticket is None:
+        return data
+    return data+_u16_struct.pack(len(ticket))+ticket
+
+def parse_client_hello(data:bytes)->tuple:
+    """
+    解析ClientHello
+
+    @return:(客户端临时公钥,客户端随机数,加密套件列表,票据(未附带时为None))
+    """
+    try:
+        magic,version,public_bytes,client_random=_prefix_struct.unpack_from(data)
+        pos=_prefix_struct.size
+        count=data[pos]
+        suites=data[pos+1:pos+1+count]
+        pos+=1+count
+        ticket=None
+        if len(data)>pos:
+            ticket_len=_u16_struct.unpack_from(data,pos)[0]
+            ticket=data[pos+2:pos+2+ticket_len]
+            if len(ticket)!=ticket_len:
+                raise ValueError('秘钥交换失败')
+    except (struct.error,IndexError):
+        raise ValueError('秘钥交换失败')
+    if magic!=ECDH_MAGIC or version!=ECDH_VERSION or len(suites)!=count:
+        raise ValueError('秘钥交换失败')
+    return public_bytes,client_random,suites,ticket
+
+def pack_server_hello(ephemeral:EphemeralKey,server_random:bytes,suite:int,signature:bytes,new_ticket:bytes=b'')->bytes:
+    """
+    构建ServerHello
+
+    @param signature:EphemeralKey.sign生成的签名
+    @param new_ticket:签发给客户端的新票据消息(为空则不签发)
+    """
+    data=b''.join((
+        _prefix_struct.pack(ECDH_MAGIC,ECDH_VERSION,ephemeral.public_bytes,server_random),
+        bytes([suite]),
+        _u64_struct.pack(ephemeral.valid_until),
+        _u16_struct.pack(len(ephemeral.identity_der)),ephemeral.identity_der,
+        _u16_struct.pack(len(signature)),signature
+    ))
+    if not new_ticket:
+        return data
+    return data+_u16_struct.pack(len(new_ticket))+new_ticket
+
+def parse_server_hello(data:bytes,client_public_bytes:bytes,client_random:bytes)->tuple:
+    """
+    解析ServerHello并校验签名(签名需要覆盖本次ClientHello中的临时公钥和随机数且未过期)
+
+    @param client_public_bytes:客户端临时公钥
+    @param client_random:客户端随机数
+    @return:(服务端临时公钥,服务端随机数,加密套件,身份公钥,新票据消息(未签发时为空))
+    """
+    try:
+        magic,version,public_bytes,server_random=_prefix_struct.unpack_from(data)
+        pos=_prefix_struct.size
+        suite=data[pos]
+        pos+=1
+        valid_until=_u64_struct.unpack_from(data,pos)[0]
+        pos+=8
+        identity_len=_u16_struct.unpack_from(data,pos)[0]
+        pos+=2
+        identity_der=data[pos:pos+identity_len]
+        pos+=identity_len
+        signature_len=_u16_struct.unpack_from(data,pos)[0]
+        pos+=2
+        signature=data[pos:pos+signature_len]
+        pos+=signature_len
+        new_ticket=b''
+        if len(data)>pos:
+            new_ticket_len=_u16_struct.unpack_from(data,pos)[0]
+            new_ticket=data[pos+2:pos+2+new_ticket_len]
+            if len(new_ticket)!=new_ticket_len:
+                raise ValueError('秘钥交换失败')
+        identity=RSA.import_key(identity_der)
+    except (struct.error,IndexError,ValueError):
+        raise ValueError('秘钥交换失败')
+    if magic!=ECDH_MAGIC or version!=ECDH_VERSION or len(signature)!=signature_len:
+        raise ValueError('秘钥交换失败')
+    if valid_until+CLOCK_SKEW<time.time():
+        raise ValueError('服务端签名已过期')
+    try:
+        signed=_signed_data(public_bytes,server_random,suite,valid_until,client_public_bytes,client_random)
+        pss.new(identity).verify(SHA256.new(signed),signature)
+    except ValueError:
+        raise ValueError('秘钥交换失败')
+    return public_bytes,server_random,suite,identity,new_ticket
+
+def shared_secret(private_key:X25519PrivateKey,peer_public_bytes:bytes)->bytes:
+    """计算X25519共享密钥"""
+    try:
+        return private_key.exchange(X25519PublicKey.from_public_bytes(peer_public_bytes))
+    except ValueError:
+        raise ValueError('秘钥交换失败')
+
+def derive_key(shared:bytes,client_hello:bytes,server_hello:bytes)->bytes:
+    """
+    通过HKDF派生会话密钥
+
+    salt为双方随机数,info包含完整的握手记录,任何一方的消息被篡改都会导致双方密钥不一致
+    """
+    pos=_prefix_struct.size
+    salt=client_hello[pos-32:pos]+server_hello[pos-32:pos]
+    transcript=hashlib.sha256(client_hello+server_hello).digest()
+    return HKDF(hashes.SHA256(),32,salt,ECDH_MAGIC+transcript).derive(shared)
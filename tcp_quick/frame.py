@@ -0,0 +1,206 @@
+import re,struct
+from functools import lru_cache
+from typing import Optional
+
+# MCP-TCP0: 8字节魔数+8位十六进制长度
+TCP0_MAGIC=b'MCP-TCP0'
+TCP0_HEADER_SIZE=16
+TCP0_MAX_LENGTH=0x7fffffff
+# MCP-TCP1: 1字节魔数+1字节标志位+u32长度(设置FLAG_LONG时为u64)+按标志位顺序追加的扩展字段
+TCP1_MAGIC=0xa1
+TCP1_MIN_HEADER_SIZE=6
+TCP1_MAX_LENGTH=0xffffffffffffffff
+# 接收任意版本帧头时至少需要读取的字节数
+MIN_HEADER_SIZE=TCP1_MIN_HEADER_SIZE
+
+FLAG_LONG=0x01
+FLAG_ENCRYPTED=0x02
+FLAG_COMPRESSED=0x04
+FLAG_STREAM=0x08
+# RPC请求/响应(同时设置表示取消请求),共用request_id扩展字段
+FLAG_REQUEST=0x10
+FLAG_RESPONSE=0x20
+# 消息未结束,后续帧(同一个流ID)是同一条消息的后续分片
+FLAG_MORE=0x40
+# 数据由codec扩展字段指定的编码器编码
+FLAG_CODEC=0x80
+# codec扩展字段的最高位,表示数据是批量编码的多个对象
+CODEC_BATCH=0x80
+# 编码器ID为0的批量帧是合并发送的多条原始消息(超级帧),数据为依次排列的u32长度+消息
+RAW_BATCH=CODEC_BATCH
+_batch_length=struct.Struct('!I')
+
+# 扩展字段(标志位,struct格式,属性名),按顺序排列在长度字段之后,设置了任意一个对应标志位时存在
+_EXTENSIONS=(
+    (FLAG_STREAM,'I','stream_id'),
+    (FLAG_REQUEST|FLAG_RESPONSE,'I','request_id'),
+    (FLAG_CODEC,'B','codec'),
+)
+_EXTENSION_FLAGS=FLAG_STREAM|FLAG_REQUEST|FLAG_RESPONSE|FLAG_CODEC
+_KNOWN_FLAGS=FLAG_LONG|FLAG_ENCRYPTED|FLAG_COMPRESSED|FLAG_STREAM|FLAG_REQUEST|FLAG_RESPONSE|FLAG_MORE|FLAG_CODEC
+
+class FrameHeader:
+    """
+    帧头
+
+    @param version:帧格式版本(0:MCP-TCP0,1:MCP-TCP1)
+    @param length:数据长度
+    @param flags:标志位(仅MCP-TCP1有效)
+    @param stream_id:流ID(仅设置FLAG_STREAM时有效)
+    @param request_id:RPC请求ID(仅设置FLAG_REQUEST或FLAG_RESPONSE时有效)
+    @param codec:编码器ID(仅设置FLAG_CODEC时有效,最高位为CODEC_BATCH)
+    """
+    __slots__=('version','length','flags','stream_id','request_id','codec')
+
+    def __init__(self,version:int,length:int,flags:int=0,stream_id:int=0,request_id:int=0,codec:int=0)->None:
+        self.version=version
+        self.length=length
+        self.flags=flags
+        self.stream_id=stream_id
+        self.request_id=request_id
+        self.codec=codec
+
+    def __repr__(self)->str:
+        return f'FrameHeader(version={self.version},length={self.length},flags={self.flags:#04x},stream_id={self.stream_id},request_id={self.request_id},codec={self.codec:#04x})'
+
+@lru_cache(maxsize=None)
+def _tcp1_struct(flags:int)->struct.Struct:
+    """根据标志位获取MCP-TCP1帧头结构"""
+    fmt='!BB'+('Q' if flags&FLAG_LONG else 'I')
+    for flag,field_fmt,_ in _EXTENSIONS:
+        if flags&flag:
+            fmt+=field_fmt
+    return struct.Struct(fmt)
+
+def header_size(data,pos:int=0)->int:
+    """
+    根据帧头的前MIN_HEADER_SIZE个字节计算完整帧头的大小
+
+    @param data:至少包含MIN_HEADER_SIZE字节的数据
+    @param pos:帧头起始位置
+    """
+    if data[pos]==TCP1_MAGIC:
+        flags=data[pos+1]
+        if flags&~_KNOWN_FLAGS:
+            raise ValueError('不支持的帧标志')
+        return _tcp1_struct(flags).size
+    if data[pos:pos+2]==TCP0_MAGIC[:2]:
+        return TCP0_HEADER_SIZE
+    raise ValueError('响应异常')
+
+def pack_header(length:int,version:int=0,flags:int=0,stream_id:int=0,request_id:int=0,codec:int=0)->bytes:
+    """
+    构建帧头
+
+    @param length:数据长度
+    @param version:帧格式版本
+    @param flags:标志位(仅MCP-TCP1有效,FLAG_LONG会根据长度自动设置)
+    @param stream_id:流ID(仅设置FLAG_STREAM时有效)
+    @param request_id:RPC请求ID(仅设置FLAG_REQUEST或FLAG_RESPONSE时有效)
+    @param codec:编码器ID(仅设置FLAG_CODEC时有效)
+    """
+    if version==0:
+        if length<=0 or length>TCP0_MAX_LENGTH:
+            raise ValueError('数据长度不合法')
+        return TCP0_MAGIC+hex(length)[2:].zfill(8).encode()
+    if length<0 or length>TCP1_MAX_LENGTH:
+        raise ValueError('数据长度不合法')
+    if length>0xffffffff:
+        flags|=FLAG_LONG
+    else:
+        flags&=~FLAG_LONG
+    if flags&_EXTENSION_FLAGS:
+        fields={'stream_id':stream_id,'request_id':request_id,'codec':codec}
+        values=[fields[name] for flag,_,name in _EXTENSIONS if flags&flag]
+        return _tcp1_struct(flags).pack(TCP1_MAGIC,flags,length,*values)
+    return _tcp1_struct(flags).pack(TCP1_MAGIC,flags,length)
+
+def parse_header(data,pos:int=0)->FrameHeader:
+    """
+    解析完整的帧头
+
+    @param data:包含完整帧头的数据(大小可通过header_size获取)
+    @param pos:帧头起始位置
+    """
+    if data[pos]==TCP1_MAGIC:
+        flags=data[pos+1]
+        if flags&~_KNOWN_FLAGS:
+            raise ValueError('不支持的帧标志')
+        values=_tcp1_struct(flags).unpack_from(data,pos)
+        header=FrameHeader(1,values[2],flags)
+        index=3
+        for flag,_,name in _EXTENSIONS:
+            if flags&flag:
+                setattr(header,name,values[index])
+                index+=1
+        return header
+    if data[pos:pos+8]!=TCP0_MAGIC:
+        raise ValueError('响应异常')
+    try:
+        length=int(bytes(data[pos+8:pos+16]),16)
+    except ValueError:
+        raise ValueError('响应异常')
+    if length<=0 or length>TCP0_MAX_LENGTH:
+        raise ValueError('数据长度不合法')
+    return FrameHeader(0,length)
+
+def pack_batch(messages:list)->bytes:
+    """将多条消息打包为超级帧的数据"""
+    pack=_batch_length.pack
+    parts=[]
+    for message in messages:
+        parts.append(pack(len(message)))
+        parts.append(message)
+    return b''.join(parts)
+
+def unpack_batch(data)->list:
+    """拆分超级帧的数据"""
+    messages=[]
+    unpack_from=_batch_length.unpack_from
+    pos=0
+    end=len(data)
+    while pos<end:
+        if pos+4>end:
+            raise ValueError('数据异常')
+        length=unpack_from(data,pos)[0]
+        pos+=4
+        if pos+length>end:
+            raise ValueError('数据异常')
+        messages.append(data[pos:pos+length])
+        pos+=length
+    if not messages:
+        raise ValueError('数据异常')
+    return messages
+
+# 行模式长度前缀(独占一行,其后紧跟原始数据和一个换行符)
+LINE_LENGTH_PREFIX=b'-MCP0-LEN'
+_line_header_pattern=re.compile(rb'-MCP0-LEN([0-9a-f]{1,16})-')
+
+def escape_line(data:bytes)->bytes:
+    """将数据中的换行符替换为“-MCP0-EOL-”(行模式escape编码)"""
+    if b'\n' not in data and b'\r' not in data:
+        return data
+    return data.replace(b'\r\n',b'-MCP0-EOL0-').replace(b'\n',b'-MCP0-EOL1-').replace(b'\r',b'-MCP0-EOL2-')
+
+def unescape_line(data:bytes)->bytes:
+    """将数据中的“-MCP0-EOL-”还原为换行符(行模式escape解码)"""
+    if b'-MCP0-EOL' not in data:
+        return data
+    return data.replace(b'-MCP0-EOL0-',b'\r\n').replace(b'-MCP0-EOL1-',b'\n').replace(b'-MCP0-EOL2-',b'\r')
+
+def pack_line_header(length:int)->bytes:
+    """构建行模式长度前缀行(行模式length编码)"""
+    return LINE_LENGTH_PREFIX+hex(length)[2:].encode()+b'-\n'
+
+def parse_line_header(line:bytes)->Optional[int]:
+    """
+    解析行模式长度前缀行
+
+    @return:不是长度前缀行时返回None
+    """
+    if not line.startswith(LINE_LENGTH_PREFIX):
+        return None
+    match=_line_header_pattern.fullmatch(line)
+    if match is None:
+        return None
+    return int(match.group(1),16)
@@ -0,0 +1,112 @@
+import asyncio,os
+from .key import Key
+from Crypto.PublicKey import RSA
+
+class KeyProvider:
+    """
+    RSA密钥提供者基类
+
+    服务端在开始监听前调用prepare完成密钥加载/生成,之后每次密钥交换通过get_key_pair获取当前的密钥对
+    get_key_pair总是返回同一时刻的公钥和私钥,轮换密钥时正在进行的密钥交换不受影响
+    """
+
+    def __init__(self)->None:
+        self._key_pair:tuple=None
+
+    async def prepare(self)->None:
+        """加载或生成密钥(不会阻塞事件循环)"""
+        if self._key_pair is None:
+            self._key_pair=await self._load()
+
+    async def get_key_pair(self)->tuple:
+        """获取当前的密钥对(公钥,私钥)"""
+        if self._key_pair is None:
+            await self.prepare()
+        return self._key_pair
+
+    async def get_public_key(self)->RSA.RsaKey:
+        """获取当前的RSA公钥"""
+        return (await self.get_key_pair())[0]
+
+    async def get_private_key(self)->RSA.RsaKey:
+        """获取当前的RSA私钥"""
+        return (await self.get_key_pair())[1]
+
+    async def rotate(self)->None:
+        """轮换密钥(新密钥准备完成后才会替换,期间仍使用旧密钥)"""
+        self._key_pair=await self._rotate()
+
+    async def _load(self)->tuple:
+        """加载密钥对"""
+        raise NotImplementedError
+
+    async def _rotate(self)->tuple:
+        """生成用于替换的新密钥对"""
+        return await self._load()
+
+class GeneratedKeyProvider(KeyProvider):
+    """
+    在线程中生成RSA密钥对的密钥提供者(仅保存在内存中,重启后会变化)
+
+    @param bits:密钥长度
+    """
+
+    def __init__(self,bits:int=2048)->None:
+        super().__init__()
+        self._bits=bits
+
+    async def _load(self)->tuple:
+        return await asyncio.to_thread(Key.create_rsa_key,self._bits)
+
+class FileKeyProvider(KeyProvider):
+    """
+    从文件加载RSA私钥的密钥提供者(重启后身份不变,客户端无需重新确认公钥)
+
+    @param private_key_path:私钥文件路径
+    @param public_key_path:公钥文件路径(为空则不保存公钥文件)
+    @param bits:私钥文件不存在或轮换密钥时生成的密钥长度
+    @param create:私钥文件不存在时是否自动生成
+    """
+
+    def __init__(self,private_key_path:str,public_key_path:str='',bits:int=2048,create:bool=True)->None:
+        super().__init__()
+        self._private_key_path=private_key_path
+        self._public_key_path=public_key_path
+        self._bits=bits
+        self._create=create
+
+    async def reload(self)->None:
+        """重新从文件加载密钥(用于外部替换密钥文件后热更新)"""
+        self._key_pair=await asyncio.to_thread(self._read)
+
+    async def _load(self)->tuple:
+        if not Key.exists_key(self._private_key_path):
+            if not self._create:
+                raise FileNotFoundError(f"私钥文件{self._private_key_path}不存在")
+            return await self._rotate()
+        return await asyncio.to_thread(self._read)
+
+    async def _rotate(self)->tuple:
+        return await asyncio.to_thread(self._generate)
+
+    def _read(self)->tuple:
+        private_key=Key.get_rsa_private_key(self._private_key_path)
+        return private_key.publickey(),private_key
+
+    def _generate(self)->tuple:
+        public_key,private_key=Key.create_rsa_key(self._bits)
+        self._write(self._private_key_path,private_key.export_key())
+        if self._public_key_path:
+            self._write(self._public_key_path,public_key.export_key())
+        return public_key,private_key
+
+    @staticmethod
+    def _write(path:str,data:bytes)->None:
+        """写入临时文件后替换,保证其他进程不会读取到不完整的密钥文件"""
+        directory=os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path=path+'.tmp'
+        with open(os.open(temp_path,os.O_WRONLY|os.O_CREAT|os.O_TRUNC,0o600),"wb") as file:
+            file.write(data)
+        os.replace(temp_path,path)
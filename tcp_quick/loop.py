@@ -0,0 +1,54 @@
+import asyncio
+
+# 可选的事件循环实现
+LOOP_NAMES=('asyncio','uvloop','auto')
+
+def get_loop_factory(loop=None):
+    """
+    获取事件循环工厂
+
+    @param loop:None/asyncio:默认事件循环,uvloop:使用uvloop(未安装时回退到默认事件循环),auto:已安装uvloop时使用uvloop,也可以传入返回事件循环的可调用对象
+    @return:事件循环工厂,使用默认事件循环时返回None
+    """
+    if loop is None or loop=='asyncio':
+        return None
+    if callable(loop):
+        return loop
+    if loop not in LOOP_NAMES:
+        raise ValueError('事件循环不合法')
+    try:
+        import uvloop
+    except ImportError:
+        if loop=='uvloop':
+            print('未安装uvloop,将使用默认事件循环')
+        return None
+    return uvloop.new_event_loop
+
+def run(main,loop=None):
+    """
+    在指定的事件循环中运行协程(与asyncio.run一致)
+
+    @param main:协程
+    @param loop:事件循环(见get_loop_factory),也可以传入asyncio.AbstractEventLoopPolicy实例
+    """
+    if isinstance(loop,asyncio.AbstractEventLoopPolicy):
+        asyncio.set_event_loop_policy(loop)
+        return asyncio.run(main)
+    factory=get_loop_factory(loop)
+    if factory is None:
+        return asyncio.run(main)
+    if hasattr(asyncio,'Runner'):
+        with asyncio.Runner(loop_factory=factory) as runner:
+            return runner.run(main)
+    # Python 3.11以下没有asyncio.Runner
+    event_loop=factory()
+    try:
+        asyncio.set_event_loop(event_loop)
+        return event_loop.run_until_complete(main)
+    finally:
+        try:
+            event_loop.run_until_complete(event_loop.shutdown_asyncgens())
+            event_loop.run_until_complete(event_loop.shutdown_default_executor())
+        finally:
+            asyncio.set_event_loop(None)
+            event_loop.close()
@@ -0,0 +1,183 @@
+import collections,json
+
+# 直方图每个2的幂次区间划分的子区间数(2^4=16,相对误差不超过1/16)
+_SUB_BITS=4
+_SUB_COUNT=1<<_SUB_BITS
+# 导出时计算的分位数
+QUANTILES=(0.5,0.9,0.99,0.999)
+
+class Histogram:
+    """
+    HDR风格的延迟直方图(对数-线性分桶,只保存非空的桶)
+
+    记录的值为非负整数(通常为纳秒),任意大小的值相对误差都不超过1/16,记录只需要常数时间
+    """
+    __slots__=('_buckets','_count','_sum','_min','_max')
+
+    def __init__(self)->None:
+        self._buckets={}
+        self._count=0
+        self._sum=0
+        self._min=0
+        self._max=0
+
+    def record(self,value:int)->None:
+        """记录一个值"""
+        if value<0:
+            value=0
+        shift=value.bit_length()-_SUB_BITS-1
+        index=value if shift<=0 else (shift<<_SUB_BITS)+(value>>shift)
+        buckets=self._buckets
+        buckets[index]=buckets.get(index,0)+1
+        if not self._count or value<self._min:
+            self._min=value
+        if value>self._max:
+            self._max=value
+        self._count+=1
+        self._sum+=value
+
+    def count(self)->int:
+        """获取记录的值的数量"""
+        return self._count
+
+    def percentile(self,quantile:float)->int:
+        """
+        获取分位数(返回所在桶的上界,不超过记录的最大值)
+
+        @param quantile:0~1之间的分位数
+        """
+        if not self._count:
+            return 0
+        target=max(1,-int(-quantile*self._count//1))
+        seen=0
+        for index in sorted(self._buckets):
+            seen+=self._buckets[index]
+            if seen>=target:
+                return min(_bucket_upper(index),self._max)
+        return self._max
+
+    def merge(self,other:'Histogram')->None:
+        """合并另一个直方图"""
+        if not other._count:
+            return
+        buckets=self._buckets
+        for index,count in other._buckets.items():
+            buckets[index]=buckets.get(index,0)+count
+        if not self._count or other._min<self._min:
+            self._min=other._min
+        self._max=max(self._max,other._max)
+        self._count+=other._count
+        self._sum+=other._sum
+
+    def snapshot(self,unit:int=10**9)->dict:
+        """
+        获取统计信息
+
+        @param unit:输出时除以的系数(默认将纳秒转换为秒)
+        """
+        count=self._count
+        stats={
+            'count':count,
+            'sum':self._sum/unit,
+            'min':self._min/unit,
+            'max':self._max/unit,
+            'mean':self._sum/count/unit if count else 0
+        }
+        for quantile in QUANTILES:
+            stats[f'p{quantile*100:g}']=self.percentile(quantile)/unit
+        return stats
+
+def _bucket_upper(index:int)->int:
+    """获取桶内的最大值"""
+    if index<_SUB_COUNT*2:
+        return index
+    shift=(index>>_SUB_BITS)-1
+    top=index-(shift<<_SUB_BITS)
+    return ((top+1)<<shift)-1
+
+class Metrics:
+    """
+    性能指标(计数器、瞬时值和延迟直方图)
+
+    每个连接各自记录,服务端通过merge汇总,未启用时连接只保存None,热路径上只多一次判断
+    计数器: frames_in/frames_out(帧数),bytes_in/bytes_out(帧数据字节数,不含帧头,为压缩/加密后、行模式转义前的长度,原始数据不计入),handshakes
+    直方图(纳秒): handshake(密钥交换及协商),admission_wait(排队等待),send_queue_wait(发送队列阻塞),encrypt/decrypt(单个帧的加密/解密),drain(发送时等待写缓冲区排空)
+    """
+    __slots__=('counters','gauges','histograms')
+
+    def __init__(self)->None:
+        self.counters=collections.Counter()
+        self.gauges={}
+        self.histograms={}
+
+    def add(self,name:str,value:int=1)->None:
+        """增加计数器"""
+        self.counters[name]+=value
+
+    def set_gauge(self,name:str,value)->None:
+        """设置瞬时值"""
+        self.gauges[name]=value
+
+    def observe(self,name:str,value:int)->None:
+        """记录一个值到直方图(耗时以纳秒为单位)"""
+        histogram=self.histograms.get(name)
+        if histogram is None:
+            histogram=self.histograms[name]=Histogram()
+        histogram.record(value)
+
+    def merge(self,other:'Metrics')->'Metrics':
+        """合并另一个指标(瞬时值相加)"""
+        self.counters.update(other.counters)
+        for name,value in other.gauges.items():
+            self.gauges[name]=self.gauges.get(name,0)+value
+        for name,histogram in other.histograms.items():
+            if name not in self.histograms:
+                self.histograms[name]=Histogram()
+            self.histograms[name].merge(histogram)
+        return self
+
+    def snapshot(self)->dict:
+        """获取所有指标(直方图的耗时单位为秒)"""
+        return {
+            'counters':dict(self.counters),
+            'gauges':dict(self.gauges),
+            'histograms':{name:histogram.snapshot() for name,histogram in self.histograms.items()}
+        }
+
+    def to_json(self)->str:
+        """导出为JSON"""
+        return json.dumps(self.snapshot(),ensure_ascii=False)
+
+    def to_prometheus(self,prefix:str='tcp_quick',labels:dict=None)->str:
+        """
+        导出为Prometheus文本格式(计数器为counter,瞬时值为gauge,直方图为以秒为单位的summary)
+
+        @param prefix:指标名前缀
+        @param labels:附加到每个指标的标签
+        """
+        label_text=','.join(f'{key}="{_escape_label(value)}"' for key,value in (labels or {}).items())
+        lines=[]
+        for name,value in sorted(self.counters.items()):
+            metric=f'{prefix}_{name}_total'
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric}{_labels(label_text)} {value}')
+        for name,value in sorted(self.gauges.items()):
+            metric=f'{prefix}_{name}'
+            lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric}{_labels(label_text)} {value}')
+        for name,histogram in sorted(self.histograms.items()):
+            metric=f'{prefix}_{name}_seconds'
+            lines.append(f'# TYPE {metric} summary')
+            for quantile in QUANTILES:
+                quantile_label=f'quantile="{quantile:g}"'
+                lines.append(f'{metric}{_labels(label_text,quantile_label)} {histogram.percentile(quantile)/1e9:.9g}')
+            lines.append(f'{metric}_sum{_labels(label_text)} {histogram._sum/1e9:.9g}')
+            lines.append(f'{metric}_count{_labels(label_text)} {histogram.count()}')
+        return '\n'.join(lines)+'\n'
+
+def _escape_label(value)->str:
+    return str(value).replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')
+
+def _labels(*parts)->str:
+    text=','.join(part for part in parts if part)
+    return '{'+text+'}' if text else ''
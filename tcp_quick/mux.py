@@ -0,0 +1,417 @@
+import asyncio,collections,struct
+from .connect import Connect
+from .frame import FLAG_STREAM,FLAG_MORE
+
+# 控制帧(流ID为0): 1字节类型+u32流ID+u32参数
+_control_struct=struct.Struct('!BII')
+CONTROL_OPEN=1
+CONTROL_FIN=2
+CONTROL_RESET=3
+CONTROL_WINDOW=4
+
+class MuxStream:
+    """
+    多路复用的逻辑流
+
+    提供与Connect一致的send/recv接口,每次recv返回对端一次send的完整数据
+    发送受对端授予的流量控制窗口限制,窗口耗尽时send会等待对端读取数据后再继续,不会影响其他流
+    接收时对端超出窗口发送或消息超过最大长度会重置该流
+    超过窗口的消息需要在分片到达时归还窗口才能接收,因此只在没有未读取的消息时立即归还,否则推迟到调用方读取后归还,未读取的数据最多约为窗口+最大消息长度
+
+    @param mux:所属的多路复用器
+    @param stream_id:流ID
+    @param window:初始流量控制窗口(字节)
+    """
+
+    def __init__(self,mux:'Multiplexer',stream_id:int,window:int)->None:
+        self._mux=mux
+        self._stream_id=stream_id
+        self._window=window
+        # 对端授予的剩余发送窗口
+        self._send_window=window
+        # [数据,已发送的字节数,完成时通知的Future]
+        self._outgoing=collections.deque()
+        # (完整的消息,读取后需要归还的窗口)
+        self._messages=collections.deque()
+        self._partial=[]
+        self._partial_size=0
+        # 未完成的消息中推迟归还的窗口
+        self._partial_credit=0
+        # 对端剩余可发送的字节数
+        self._recv_window=window
+        # 已交付给调用方但尚未归还给对端的窗口
+        self._unacked=0
+        self._waiter=None
+        self._drained=asyncio.Event()
+        self._drained.set()
+        self._local_closed=False
+        self._remote_closed=False
+        self._exception=None
+
+    @property
+    def stream_id(self)->int:
+        """流ID"""
+        return self._stream_id
+
+    def is_closed(self)->bool:
+        """判断流是否已完全关闭(双方都已关闭或已重置)"""
+        return self._exception is not None or (self._local_closed and self._remote_closed)
+
+    async def send(self,data:bytes,timeout:int=0)->None:
+        """发送数据(数据较大时会被拆分为多个帧,与其他流的帧交替发送)"""
+        try:
+            if timeout:
+                await asyncio.wait_for(self._send(data),timeout)
+            else:
+                await self._send(data)
+        except asyncio.TimeoutError:
+            raise TimeoutError('发送数据超时')
+
+    async def _send(self,data:bytes)->None:
+        if self._exception is not None:
+            raise self._exception
+        if self._local_closed:
+            raise ConnectionError('流已关闭')
+        future=asyncio.get_running_loop().create_future()
+        self._outgoing.append([memoryview(data),0,future])
+        self._drained.clear()
+        self._mux._schedule(self)
+        await future
+
+    async def recv(self,timeout:int=0)->bytes:
+        """接收数据(对端关闭流且没有剩余数据时抛出ConnectionError)"""
+        try:
+            if timeout:
+                return await asyncio.wait_for(self._recv(),timeout)
+            return await self._recv()
+        except asyncio.TimeoutError:
+            raise TimeoutError('接收数据超时')
+
+    async def _recv(self)->bytes:
+        while not self._messages:
+            if self._exception is not None:
+                raise self._exception
+            if self._remote_closed:
+                raise ConnectionError('流已关闭')
+            if self._waiter is not None:
+                raise RuntimeError('不允许同时进行多个读取操作')
+            self._waiter=asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter=None
+        data,size=self._messages.popleft()
+        if not self._messages and self._partial_credit:
+            # 已读取完所有消息,未完成的消息的分片可以归还窗口了
+            size+=self._partial_credit
+            self._partial_credit=0
+        self._ack(size)
+        return data
+
+    async def close(self)->None:
+        """关闭发送方向(等待已提交的数据发送完成后通知对端,仍可以继续接收数据)"""
+        if self._local_closed or self._exception is not None:
+            return
+        self._local_closed=True
+        await self._drained.wait()
+        if self._exception is None:
+            self._mux._control(CONTROL_FIN,self._stream_id)
+            self._mux._release(self)
+
+    def reset(self)->None:
+        """立即重置流(丢弃未发送和未读取的数据,并通知对端)"""
+        if self._exception is not None:
+            return
+        self._mux._control(CONTROL_RESET,self._stream_id)
+        self._fail(ConnectionError('流已重置'))
+
+    def _ack(self,size:int)->None:
+        """归还已读取数据占用的窗口(累计超过一半窗口时通知对端)"""
+        self._unacked+=size
+        if self._unacked>=self._window//2 and not self._remote_closed and self._exception is None:
+            self._mux._control(CONTROL_WINDOW,self._stream_id,self._unacked)
+            self._recv_window+=self._unacked
+            self._unacked=0
+
+    def _feed(self,data:bytes,more:bool)->None:
+        """接收到数据帧"""
+        if self._remote_closed or self._exception is not None:
+            return
+        size=len(data)
+        if size>self._recv_window:
+            self._abort(ValueError('对端超出流量控制窗口'))
+            return
+        if self._partial_size+size>self._mux._max_message_size:
+            self._abort(ValueError('数据长度不合法'))
+            return
+        self._recv_window-=size
+        if more:
+            # 未完成的消息无法交付,没有未读取的消息时立即归还窗口,避免超过窗口大小的消息无法接收
+            self._partial.append(data)
+            self._partial_size+=size
+            if self._messages:
+                self._partial_credit+=size
+            else:
+                self._ack(size)
+            return
+        if self._partial:
+            # 已归还过窗口的分片不再计入
+            self._partial.append(data)
+            data=b''.join(self._partial)
+            self._partial=[]
+            self._partial_size=0
+        self._messages.append((data,size+self._partial_credit))
+        self._partial_credit=0
+        self._wake()
+
+    def _abort(self,exc:Exception)->None:
+        """对端违反协议时重置流"""
+        self._mux._control(CONTROL_RESET,self._stream_id)
+        self._fail(exc)
+
+    def _feed_fin(self)->None:
+        self._remote_closed=True
+        self._wake()
+        self._mux._release(self)
+
+    def _wake(self)->None:
+        waiter=self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _fail(self,exc:Exception)->None:
+        if self._exception is None:
+            self._exception=exc
+        for _,_,future in self._outgoing:
+            if not future.done():
+                future.set_exception(self._exception)
+                future.exception()
+        self._outgoing.clear()
+        self._drained.set()
+        self._wake()
+        self._mux._release(self)
+
+class Multiplexer:
+    """
+    在一个Connect上承载多个逻辑流
+
+    数据帧使用MCP-TCP1帧头中的stream_id区分所属的流,流ID为0的帧是控制帧(打开/关闭/重置/窗口更新)
+    客户端打开的流ID为奇数,服务端打开的流ID为偶数,双方可以同时打开流
+    写入任务在有数据且窗口未耗尽的流之间轮转,每次只发送一个不超过chunk_size的分片,大数据流不会阻塞其他流
+    启动后连接上的所有帧都由读取任务接收,不能再直接调用Connect.recv,且不支持行模式
+
+    @param connect:连接
+    @param is_client:是否为客户端
+    @param window:每个流的初始流量控制窗口(字节,需要与对端保持一致)
+    @param chunk_size:每个分片的最大字节数
+    @param max_message_size:接收的单个消息的最大字节数(超过时重置该流)
+    """
+
+    def __init__(self,connect:Connect,is_client:bool=True,window:int=256*1024,chunk_size:int=16*1024,max_message_size:int=64*1024*1024)->None:
+        if connect._use_line:
+            raise ValueError('多路复用不支持行模式')
+        if window<=0 or chunk_size<=0:
+            raise ValueError('窗口和分片大小必须大于0')
+        if max_message_size<=0:
+            raise ValueError('最大消息长度必须大于0')
+        self._connect=connect
+        self._window=window
+        self._chunk_size=chunk_size
+        self._max_message_size=max_message_size
+        self._next_id=1 if is_client else 2
+        self._streams={}
+        self._accept=collections.deque()
+        self._accept_waiter=None
+        # 等待写入的控制帧和流(轮转)
+        self._controls=collections.deque()
+        self._ready=collections.deque()
+        self._wakeup=None
+        self._reader=None
+        self._writer=None
+        self._exception=None
+        # 流ID放在MCP-TCP1帧头中
+        connect.set_frame_version(1)
+
+    def start(self)->'Multiplexer':
+        """启动后台读取和写入任务"""
+        if self._reader is None:
+            loop=asyncio.get_running_loop()
+            self._reader=loop.create_task(self._read())
+            self._writer=loop.create_task(self._write())
+        return self
+
+    def open_stream(self)->MuxStream:
+        """打开一个新的流"""
+        if self._exception is not None:
+            raise self._exception
+        self.start()
+        stream_id=self._next_id
+        self._next_id+=2
+        if self._next_id>0xffffffff:
+            raise ValueError('流ID已耗尽')
+        stream=self._streams[stream_id]=MuxStream(self,stream_id,self._window)
+        self._control(CONTROL_OPEN,stream_id)
+        return stream
+
+    async def accept(self)->MuxStream:
+        """等待对端打开的流(连接关闭时抛出异常)"""
+        self.start()
+        while not self._accept:
+            if self._exception is not None:
+                raise self._exception
+            self._accept_waiter=asyncio.get_running_loop().create_future()
+            try:
+                await self._accept_waiter
+            finally:
+                self._accept_waiter=None
+        return self._accept.popleft()
+
+    def streams(self)->list:
+        """获取所有未关闭的流"""
+        return list(self._streams.values())
+
+    async def close(self)->None:
+        """停止读取和写入任务并重置所有流"""
+        self._fail(ConnectionError('连接已关闭'))
+        tasks=[task for task in (self._reader,self._writer) if task is not None and not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks,return_exceptions=True)
+
+    async def wait_closed(self)->None:
+        """等待读取任务结束(对端关闭连接或出现错误)"""
+        self.start()
+        await asyncio.wait((self._reader,))
+
+    def _peer_closed(self)->bool:
+        return self._connect.reader().at_eof() or self._connect.writer().is_closing()
+
+    def _schedule(self,stream:MuxStream)->None:
+        """流有新的数据需要发送"""
+        if stream not in self._ready:
+            self._ready.append(stream)
+        self._notify()
+
+    def _control(self,kind:int,stream_id:int,value:int=0)->None:
+        if self._exception is not None:
+            return
+        self._controls.append(_control_struct.pack(kind,stream_id,value))
+        self._notify()
+
+    def _release(self,stream:MuxStream)->None:
+        if stream.is_closed() and self._streams.get(stream.stream_id) is stream:
+            del self._streams[stream.stream_id]
+
+    def _notify(self)->None:
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    async def _write(self)->None:
+        """写入任务: 优先发送控制帧,再在可以发送的流之间轮转"""
+        connect=self._connect
+        loop=asyncio.get_running_loop()
+        try:
+            while True:
+                if self._controls:
+                    await connect._send(self._controls.popleft(),FLAG_STREAM,stream_id=0)
+                    continue
+                stream=self._next_ready()
+                if stream is None:
+                    self._wakeup=loop.create_future()
+                    try:
+                        await self._wakeup
+                    finally:
+                        self._wakeup=None
+                    continue
+                item=stream._outgoing[0]
+                data,sent,future=item
+                size=min(len(data)-sent,self._chunk_size,stream._send_window)
+                end=sent+size
+                more=end<len(data)
+                # 先更新状态再发送,发送期间窗口更新或新的数据不会被重复计算
+                stream._send_window-=size
+                item[1]=end
+                if not more:
+                    stream._outgoing.popleft()
+                await connect._send(data[sent:end],FLAG_STREAM|FLAG_MORE if more else FLAG_STREAM,stream_id=stream.stream_id)
+                if not more:
+                    if not future.done():
+                        future.set_result(None)
+                    if not stream._outgoing:
+                        stream._drained.set()
+                if stream._outgoing and stream not in self._ready:
+                    self._ready.append(stream)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(e)
+
+    def _next_ready(self)->MuxStream:
+        """获取下一个可以发送的流(窗口耗尽的流会在收到窗口更新后重新加入)"""
+        while self._ready:
+            stream=self._ready.popleft()
+            if not stream._outgoing:
+                continue
+            data,sent,_=stream._outgoing[0]
+            if stream._send_window>0 or sent==len(data):
+                return stream
+        return None
+
+    async def _read(self)->None:
+        """读取任务"""
+        connect=self._connect
+        try:
+            while True:
+                header,data=await connect._read_frame()
+                if not header.flags&FLAG_STREAM:
+                    raise ValueError('数据异常')
+                if header.stream_id==0:
+                    self._on_control(data)
+                    continue
+                stream=self._streams.get(header.stream_id)
+                if stream is not None:
+                    stream._feed(data,bool(header.flags&FLAG_MORE))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if self._peer_closed():
+                # 对端关闭连接时流式引擎会读取到不完整的帧头
+                e=ConnectionError('连接已关闭')
+            self._fail(e)
+
+    def _on_control(self,data:bytes)->None:
+        if len(data)!=_control_struct.size:
+            raise ValueError('数据异常')
+        kind,stream_id,value=_control_struct.unpack(data)
+        if kind==CONTROL_OPEN:
+            if stream_id in self._streams or stream_id%2==self._next_id%2:
+                raise ValueError('流ID不合法')
+            stream=self._streams[stream_id]=MuxStream(self,stream_id,self._window)
+            self._accept.append(stream)
+            if self._accept_waiter is not None and not self._accept_waiter.done():
+                self._accept_waiter.set_result(None)
+            return
+        stream=self._streams.get(stream_id)
+        if stream is None:
+            # 已关闭或已重置的流
+            return
+        if kind==CONTROL_WINDOW:
+            stream._send_window+=value
+            if stream._outgoing:
+                self._schedule(stream)
+        elif kind==CONTROL_FIN:
+            stream._feed_fin()
+        elif kind==CONTROL_RESET:
+            stream._fail(ConnectionError('流已被对端重置'))
+        else:
+            raise ValueError('数据异常')
+
+    def _fail(self,exc:Exception)->None:
+        if self._exception is None:
+            self._exception=exc
+        for stream in list(self._streams.values()):
+            stream._fail(self._exception)
+        self._streams.clear()
+        self._controls.clear()
+        if self._accept_waiter is not None and not self._accept_waiter.done():
+            self._accept_waiter.set_result(None)
@@ -0,0 +1,297 @@
+import asyncio,collections,time
+from .connect import Connect
+from .client import Client
+
+class PooledConnect:
+    """
+    连接池中的连接
+
+    @param connect:连接
+    """
+    __slots__=('connect','created','last_used','uses')
+
+    def __init__(self,connect:Connect)->None:
+        self.connect=connect
+        self.created=time.monotonic()
+        self.last_used=self.created
+        self.uses=0
+
+class ClientPool:
+    """
+    客户端连接池
+
+    按Client的配置建立连接并完成密钥交换,使用完毕后放回池中复用,避免每次请求都重新建立TCP连接和进行密钥交换
+    新建的连接会通过会话票据恢复会话(Client启用session_ticket且使用AES时),只有第一个连接需要完整的RSA/X25519运算
+    后台维护任务会淘汰空闲过久的连接,检查空闲连接是否仍然可用,并保持至少min_size个连接
+
+    用法:
+        pool=ClientPool(MyClient(...),min_size=2,max_size=10)
+        await pool.start()
+        async with pool.acquire() as connect:
+            await connect.send(data)
+            data=await connect.recv()
+        await pool.close()
+
+    @param client:提供连接配置的客户端(不会调用其_handle)
+    @param min_size:最少保持的连接数
+    @param max_size:最多同时存在的连接数(所有连接都在使用中时acquire会排队等待)
+    @param idle_timeout:空闲连接的最长保留时间(秒,0表示不淘汰,不会淘汰到min_size以下)
+    @param ping_interval:检查空闲连接的间隔(秒,0表示只在取出连接时检查)
+    @param ping:检查连接是否可用的协程函数(参数为connect,抛出异常表示不可用,默认为None,即只检查连接是否已被对端关闭)
+    @param max_lifetime:连接的最长使用时间(秒,0表示不限制,超过后放回时关闭)
+    """
+
+    def __init__(
+            self,client:Client,min_size:int=0,max_size:int=10,
+            idle_timeout:float=300,ping_interval:float=30,ping=None,max_lifetime:float=0
+        )->None:
+        if max_size<=0:
+            raise ValueError('最大连接数必须大于0')
+        if not 0<=min_size<=max_size:
+            raise ValueError('最少连接数不合法')
+        self._client=client
+        self._min_size=min_size
+        self._max_size=max_size
+        self._idle_timeout=idle_timeout
+        self._ping_interval=ping_interval
+        self._ping=ping
+        self._max_lifetime=max_lifetime
+        # 空闲连接(最近放回的在右侧,优先复用)
+        self._idle=collections.deque()
+        self._in_use={}
+        # 正在建立的连接数
+        self._opening=0
+        self._waiters=collections.deque()
+        self._maintainer=None
+        self._closed=False
+        self._stats=collections.Counter()
+
+    def size(self)->int:
+        """获取当前连接数(包括空闲、使用中和正在建立的连接)"""
+        return len(self._idle)+len(self._in_use)+self._opening
+
+    async def start(self)->'ClientPool':
+        """预先建立min_size个连接并启动维护任务"""
+        if self._closed:
+            raise ConnectionError('连接池已关闭')
+        await self._fill()
+        if self._maintainer is None and (self._ping_interval or self._idle_timeout):
+            self._maintainer=asyncio.get_running_loop().create_task(self._maintain())
+        return self
+
+    def acquire(self,timeout:float=0)->'_Checkout':
+        """
+        取出一个连接(async with退出时自动放回,退出时出现异常则关闭该连接)
+
+        @param timeout:排队等待的超时时间(秒,0表示不限制)
+        """
+        return _Checkout(self,timeout)
+
+    async def get(self,timeout:float=0)->Connect:
+        """取出一个连接(使用完毕后需要调用put放回)"""
+        try:
+            if timeout:
+                return await asyncio.wait_for(self._get(),timeout)
+            return await self._get()
+        except asyncio.TimeoutError:
+            self._stats['timeout']+=1
+            raise TimeoutError('获取连接超时')
+
+    async def put(self,connect:Connect,discard:bool=False)->None:
+        """
+        放回连接
+
+        @param discard:是否关闭该连接而不是放回池中(连接状态未知时使用,例如收发过程中出现异常)
+        """
+        item=self._in_use.pop(connect,None)
+        if item is None:
+            return
+        now=time.monotonic()
+        expired=self._max_lifetime and now-item.created>self._max_lifetime
+        if discard or expired or self._closed or not self._is_alive(connect):
+            await self._discard(item)
+            if not self._closed:
+                self._wake()
+            return
+        item.last_used=now
+        self._idle.append(item)
+        self._wake()
+
+    async def close(self)->None:
+        """关闭连接池和所有空闲连接(使用中的连接在放回时关闭)"""
+        self._closed=True
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+            await asyncio.gather(self._maintainer,return_exceptions=True)
+            self._maintainer=None
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_exception(ConnectionError('连接池已关闭'))
+                waiter.exception()
+        idle=list(self._idle)
+        self._idle.clear()
+        for item in idle:
+            await self._discard(item)
+
+    def stats(self)->dict:
+        """获取连接池统计信息"""
+        return {
+            'size':self.size(),
+            'idle':len(self._idle),
+            'in_use':len(self._in_use),
+            'opening':self._opening,
+            'waiting':len(self._waiters),
+            'min_size':self._min_size,
+            'max_size':self._max_size,
+            'opened':self._stats['opened'],
+            'resumed':self._stats['resumed'],
+            'reused':self._stats['reused'],
+            'closed':self._stats['closed'],
+            'evicted':self._stats['evicted'],
+            'ping_failed':self._stats['ping_failed'],
+            'timeout':self._stats['timeout']
+        }
+
+    async def _get(self)->Connect:
+        while True:
+            if self._closed:
+                raise ConnectionError('连接池已关闭')
+            while self._idle:
+                item=self._idle.pop()
+                if not self._is_alive(item.connect):
+                    await self._discard(item)
+                    continue
+                self._stats['reused']+=1
+                return self._checkout(item)
+            if self.size()<self._max_size:
+                return self._checkout(await self._open())
+            waiter=asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if not waiter.done():
+                    waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+
+    def _checkout(self,item:PooledConnect)->Connect:
+        item.uses+=1
+        self._in_use[item.connect]=item
+        return item.connect
+
+    def _wake(self)->None:
+        """唤醒一个排队等待的调用方"""
+        while self._waiters:
+            waiter=self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    async def _open(self)->PooledConnect:
+        """建立新的连接(占用一个连接名额)"""
+        self._opening+=1
+        try:
+            connect=await self._client.open_connect()
+        except BaseException:
+            self._wake()
+            raise
+        finally:
+            self._opening-=1
+        self._stats['opened']+=1
+        if connect.is_resumed():
+            self._stats['resumed']+=1
+        return PooledConnect(connect)
+
+    async def _fill(self)->None:
+        """补充连接到min_size(第一个连接完成后再并发建立其他连接,使它们可以通过会话票据恢复会话)"""
+        need=self._min_size-self.size()
+        if need<=0 or self._closed:
+            return
+        if not self.size():
+            self._idle.append(await self._open())
+            need-=1
+        if need>0:
+            items=await asyncio.gather(*(self._open() for _ in range(need)),return_exceptions=True)
+            for item in items:
+                if isinstance(item,PooledConnect):
+                    self._idle.appendleft(item)
+            for item in items:
+                if isinstance(item,BaseException):
+                    raise item
+        self._wake()
+
+    def _is_alive(self,connect:Connect)->bool:
+        """检查连接是否已被关闭(空闲连接上有未读取的数据也视为不可用)"""
+        if connect.writer().is_closing():
+            return False
+        reader=connect.reader()
+        if reader.at_eof():
+            return False
+        return not connect.has_unread_data()
+
+    async def _discard(self,item:PooledConnect)->None:
+        self._stats['closed']+=1
+        try:
+            await asyncio.wait_for(item.connect.close(),5)
+        except Exception:
+            pass
+
+    async def _maintain(self)->None:
+        """维护任务: 淘汰空闲过久的连接,检查空闲连接是否可用,补充连接到min_size"""
+        intervals=[interval for interval in (self._ping_interval,self._idle_timeout/2) if interval]
+        interval=min(intervals)
+        while True:
+            await asyncio.sleep(interval)
+            now=time.monotonic()
+            keep=collections.deque()
+            while self._idle:
+                item=self._idle.popleft()
+                if not self._is_alive(item.connect):
+                    await self._discard(item)
+                elif self._idle_timeout and now-item.last_used>self._idle_timeout and self.size()+len(keep)>=self._min_size:
+                    self._stats['evicted']+=1
+                    await self._discard(item)
+                else:
+                    keep.append(item)
+            self._idle.extend(keep)
+            if self._ping_interval and self._ping is not None:
+                await self._ping_idle(now)
+            try:
+                await self._fill()
+            except Exception:
+                # 服务端暂时不可用时等待下一次维护
+                pass
+
+    async def _ping_idle(self,now:float)->None:
+        """检查空闲超过ping_interval的连接(检查期间连接不会被取出)"""
+        items=[item for item in self._idle if now-item.last_used>=self._ping_interval]
+        for item in items:
+            self._idle.remove(item)
+            self._in_use[item.connect]=item
+        for item in items:
+            try:
+                await asyncio.wait_for(self._ping(item.connect),self._ping_interval)
+            except Exception:
+                self._stats['ping_failed']+=1
+                await self.put(item.connect,discard=True)
+                continue
+            await self.put(item.connect)
+
+class _Checkout:
+    """ClientPool.acquire返回的异步上下文管理器"""
+    __slots__=('_pool','_timeout','_connect')
+
+    def __init__(self,pool:ClientPool,timeout:float)->None:
+        self._pool=pool
+        self._timeout=timeout
+        self._connect=None
+
+    async def __aenter__(self)->Connect:
+        self._connect=await self._pool.get(self._timeout)
+        return self._connect
+
+    async def __aexit__(self,exc_type,exc,tb)->None:
+        await self._pool.put(self._connect,discard=exc_type is not None)
@@ -0,0 +1,327 @@
+import asyncio,collections
+from .buffer import RecvBuffer
+from .frame import FrameHeader,MIN_HEADER_SIZE,TCP0_MAX_LENGTH,header_size,parse_header
+
+# 大帧缓冲区的最大初始大小,之后随数据到达按倍数扩大(帧头声明的长度未经认证,不能据此直接分配内存)
+_INITIAL_PAYLOAD_SIZE=1<<22
+
+class FrameProtocol(asyncio.BufferedProtocol):
+    """
+    基于BufferedProtocol的传输引擎
+
+    帧模式下有recv_frame在等待时直接在get_buffer/buffer_updated中解析“MCP-TCP0”/“MCP-TCP1”帧头和数据,每次只解析调用方需要的一个帧
+    其余数据留在接收缓冲区中,与StreamReader一样按需解析,因此帧之后紧跟的原始数据(send+send_raw)仍可以通过read读取
+    小帧会从共享的接收缓冲区中一次性复制出来(bytes),大帧会分配专用的缓冲区由内核直接写入(最多预先分配4MiB,随数据到达扩大),完整后直接以bytearray交给Connect,不再复制
+    原始模式下的数据会进入同一个接收缓冲区,提供与StreamReader.read一致的读取接口,用于密钥交换和原始数据读写
+
+    @param on_connection:连接建立后调用的协程函数,参数为(reader,writer),与asyncio.start_server的回调一致
+    @param limit:接收缓冲区大小,已接收但未读取的数据超过两倍该大小时将暂停读取
+    """
+
+    def __init__(self,on_connection=None,limit:int=65536)->None:
+        self._loop=asyncio.get_running_loop()
+        self._on_connection=on_connection
+        self._limit=limit
+        self._transport=None
+        self._writer=None
+        self._task=None
+        self._scratch=bytearray(limit)
+        self._scratch_view=memoryview(self._scratch)
+        self._raw=RecvBuffer()
+        self._frames=collections.deque()
+        self._frames_size=0
+        self._frame_mode=False
+        self._payload=None
+        self._payload_view=None
+        self._payload_filled=0
+        self._payload_size=0
+        self._payload_header=None
+        self._max_frame_size=TCP0_MAX_LENGTH
+        self._waiter=None
+        self._eof=False
+        self._exception=None
+        self._paused_reading=False
+        self._paused_writing=False
+        self._drain_waiters=collections.deque()
+        self._connection_lost=False
+        self._closed=self._loop.create_future()
+
+    def connection_made(self,transport:asyncio.BaseTransport)->None:
+        self._transport=transport
+        self._writer=ProtocolWriter(transport,self)
+        if self._on_connection is not None:
+            self._task=self._loop.create_task(self._on_connection(self,self._writer))
+
+    def connection_lost(self,exc)->None:
+        self._connection_lost=True
+        self._eof=True
+        if exc is not None and self._exception is None:
+            self._exception=exc
+        self._wake()
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                if exc is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(exc)
+        self._drain_waiters.clear()
+        if not self._closed.done():
+            self._closed.set_result(None)
+
+    def eof_received(self)->bool:
+        self._eof=True
+        self._wake()
+        return False
+
+    def get_buffer(self,sizehint:int)->memoryview:
+        if self._payload is not None:
+            if self._payload_filled==len(self._payload):
+                # 在这里扩大而不是在buffer_updated中,此时传输层已不再引用上一次返回的缓冲区
+                self._grow_payload()
+            return self._payload_view[self._payload_filled:]
+        return self._scratch_view
+
+    def buffer_updated(self,nbytes:int)->None:
+        if self._payload is not None:
+            self._payload_filled+=nbytes
+            if self._payload_filled==self._payload_size:
+                payload=self._payload
+                self._payload=None
+                self._payload_view.release()
+                self._payload_view=None
+                self._push_frame(self._payload_header,payload)
+            return
+        data=self._scratch_view[:nbytes]
+        if self._frame_mode and self._waiter is not None and not self._frames and not self._raw:
+            # recv_frame正在等待,直接从共享缓冲区中解析,剩余的数据留给之后的读取
+            data=data[self._parse(data):]
+        if data:
+            self._raw.feed(data)
+            if self._frame_mode and self._waiter is not None and not self._frames and self._payload is None:
+                self._parse_raw()
+            self._maybe_pause()
+        self._wake()
+
+    def pause_writing(self)->None:
+        self._paused_writing=True
+
+    def resume_writing(self)->None:
+        self._paused_writing=False
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._drain_waiters.clear()
+
+    def writer(self)->'ProtocolWriter':
+        """获取写入器"""
+        return self._writer
+
+    def at_eof(self)->bool:
+        """判断对端是否已关闭且所有数据都已读取(与StreamReader.at_eof一致)"""
+        return self._eof and not self.has_unread_data()
+
+    def has_unread_data(self)->bool:
+        """判断是否有已接收但未读取的数据(包括未完整的帧)"""
+        return bool(self._frames or self._raw) or self._payload is not None
+
+    def set_max_frame_size(self,max_frame_size:int)->None:
+        """设置允许接收的最大帧大小"""
+        self._max_frame_size=max_frame_size
+
+    def set_frame_mode(self,frame_mode:bool,pending:bytes=b'')->None:
+        """
+        切换帧模式/原始模式
+
+        @param frame_mode:是否使用帧模式
+        @param pending:切换到帧模式时需要优先解析的数据(通常为Connect接收缓冲区中剩余的数据)
+        """
+        if frame_mode==self._frame_mode:
+            return
+        if frame_mode:
+            self._frame_mode=True
+            if pending:
+                data=pending+self._raw.read()
+                self._raw.feed(data)
+            return
+        if self._frames or self._payload is not None:
+            raise ValueError('存在未读取的帧数据,无法切换到原始模式')
+        self._frame_mode=False
+
+    async def recv_frame(self)->tuple:
+        """
+        接收一个完整的帧(帧头,数据)
+
+        @return:数据为bytes,大帧为专用缓冲区本身(bytearray,避免复制)
+        """
+        while not self._frames:
+            if self._payload is None and self._raw and self._parse_raw():
+                break
+            if self._exception is not None:
+                raise self._exception
+            if self._eof:
+                raise ConnectionError('连接已关闭')
+            await self._wait()
+        header,data=self._frames.popleft()
+        self._frames_size-=len(data)
+        self._maybe_resume()
+        return header,data
+
+    async def read(self,n:int=-1)->bytes:
+        """读取原始数据(与StreamReader.read一致,连接关闭时返回空字节)"""
+        while not self._raw:
+            if self._exception is not None:
+                raise self._exception
+            if self._eof:
+                return b''
+            await self._wait()
+        data=self._raw.read(n)
+        self._maybe_resume()
+        return data
+
+    def _parse(self,data:memoryview)->int:
+        """
+        解析一个帧(帧数据不完整时分配帧缓冲区,后续数据由内核直接写入)
+
+        @return:已使用的字节数(帧头不完整时为0)
+        """
+        end=len(data)
+        if end<MIN_HEADER_SIZE:
+            return 0
+        try:
+            size=header_size(data)
+            if end<size:
+                return 0
+            header=parse_header(data)
+        except ValueError as e:
+            self._fail(e)
+            return 0
+        if header.length>self._max_frame_size:
+            self._fail(ValueError('数据长度不合法'))
+            return 0
+        data_len=header.length
+        if end-size>=data_len:
+            self._push_frame(header,bytes(data[size:size+data_len]))
+            return size+data_len
+        # 剩余数据不足一个帧,分配帧缓冲区,后续数据由内核直接写入
+        self._payload=bytearray(max(min(data_len,_INITIAL_PAYLOAD_SIZE),end-size))
+        self._payload_view=memoryview(self._payload)
+        self._payload_header=header
+        self._payload_size=data_len
+        self._payload_filled=end-size
+        self._payload_view[:self._payload_filled]=data[size:end]
+        return end
+
+    def _parse_raw(self)->bool:
+        """
+        从接收缓冲区中解析一个帧
+
+        @return:是否得到了完整的帧
+        """
+        with self._raw.view() as view:
+            used=self._parse(view)
+        if used:
+            self._raw.skip(used)
+            self._maybe_resume()
+        return bool(self._frames)
+
+    def _grow_payload(self)->None:
+        """帧缓冲区已写满但帧尚未完整时扩大为两倍(不超过帧长度)"""
+        self._payload_view.release()
+        size=len(self._payload)
+        self._payload.extend(bytes(min(size,self._payload_size-size)))
+        self._payload_view=memoryview(self._payload)
+
+    def _push_frame(self,header:FrameHeader,data:bytes)->None:
+        self._frames.append((header,data))
+        self._frames_size+=len(data)
+        self._maybe_pause()
+        self._wake()
+
+    def _fail(self,exc:Exception)->None:
+        self._exception=exc
+        self._wake()
+        if self._transport is not None:
+            self._transport.close()
+
+    async def _wait(self)->None:
+        if self._waiter is not None:
+            raise RuntimeError('不允许同时进行多个读取操作')
+        self._waiter=self._loop.create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter=None
+
+    def _wake(self)->None:
+        waiter=self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _maybe_pause(self)->None:
+        if self._paused_reading or self._transport is None:
+            return
+        if self._frames_size+len(self._raw)>2*self._limit:
+            try:
+                self._transport.pause_reading()
+                self._paused_reading=True
+            except NotImplementedError:
+                pass
+
+    def _maybe_resume(self)->None:
+        if self._paused_reading and self._frames_size+len(self._raw)<=self._limit:
+            self._paused_reading=False
+            self._transport.resume_reading()
+
+    async def _drain_helper(self)->None:
+        if self._connection_lost:
+            raise ConnectionResetError('连接已断开')
+        if not self._paused_writing:
+            return
+        waiter=self._loop.create_future()
+        self._drain_waiters.append(waiter)
+        await waiter
+
+class ProtocolWriter:
+    """
+    FrameProtocol的写入器
+
+    提供与StreamWriter一致的常用接口,使Connect可以在两种传输引擎之间无感切换
+    """
+
+    def __init__(self,transport:asyncio.BaseTransport,protocol:FrameProtocol)->None:
+        self._transport=transport
+        self._protocol=protocol
+
+    @property
+    def transport(self)->asyncio.BaseTransport:
+        return self._transport
+
+    def write(self,data)->None:
+        self._transport.write(data)
+
+    def writelines(self,data)->None:
+        self._transport.writelines(data)
+
+    def can_write_eof(self)->bool:
+        return self._transport.can_write_eof()
+
+    def write_eof(self)->None:
+        self._transport.write_eof()
+
+    def get_extra_info(self,name:str,default=None):
+        return self._transport.get_extra_info(name,default)
+
+    def is_closing(self)->bool:
+        return self._transport.is_closing()
+
+    def close(self)->None:
+        self._transport.close()
+
+    async def wait_closed(self)->None:
+        await self._protocol._closed
+
+    async def drain(self)->None:
+        if self._transport.is_closing():
+            # 让出一次事件循环,使connection_lost有机会被调用
+            await asyncio.sleep(0)
+        await self._protocol._drain_helper()
@@ -0,0 +1,220 @@
+import asyncio
+from .connect import Connect
+from .frame import FLAG_REQUEST,FLAG_RESPONSE
+
+# 响应状态(响应数据的第一个字节)
+STATUS_OK=0
+STATUS_ERROR=1
+STATUS_NOT_FOUND=2
+_FLAG_CANCEL=FLAG_REQUEST|FLAG_RESPONSE
+_MAX_REQUEST_ID=0xffffffff
+
+class RpcError(Exception):
+    """
+    对端处理RPC请求时出现的错误
+
+    @param status:响应状态
+    @param message:错误信息
+    """
+
+    def __init__(self,status:int,message:str)->None:
+        super().__init__(message)
+        self.status=status
+
+def pack_request(method:str,payload:bytes)->bytes:
+    """构建请求数据(1字节方法名长度+方法名+请求数据)"""
+    method=method.encode()
+    if not method or len(method)>255:
+        raise ValueError('方法名不合法')
+    return bytes([len(method)])+method+payload
+
+def parse_request(data:bytes)->tuple:
+    """
+    解析请求数据
+
+    @return:(方法名,请求数据)
+    """
+    if not data or len(data)<1+data[0]:
+        raise ValueError('数据异常')
+    end=1+data[0]
+    return data[1:end].decode(),data[end:]
+
+class RpcChannel:
+    """
+    基于Connect帧的RPC通道
+
+    请求和响应通过MCP-TCP1帧头中的request_id对应,同一连接上可以同时有任意多个未完成的请求,响应可以乱序到达
+    后台读取任务接收所有的帧: 响应会完成对应调用的Future,请求会交给注册的处理函数并在独立的任务中执行
+    调用超时或被取消时会通知对端取消对应的处理任务,迟到的响应会被忽略
+    通道启动后连接上的所有帧都由读取任务接收,不能再直接调用Connect.recv,且不支持行模式
+
+    @param connect:连接
+    @param handlers:方法名->处理函数(协程函数,参数为(connect,payload),返回响应数据)
+    """
+
+    def __init__(self,connect:Connect,handlers:dict=None)->None:
+        if connect._use_line:
+            raise ValueError('RPC不支持行模式')
+        self._connect=connect
+        self._handlers=handlers if handlers is not None else {}
+        # 请求ID->等待响应的Future
+        self._pending={}
+        # 请求ID->处理请求的任务
+        self._serving={}
+        self._tasks=set()
+        self._next_id=0
+        self._reader=None
+        self._exception=None
+        # 请求ID放在MCP-TCP1帧头中
+        connect.set_frame_version(1)
+
+    def register(self,method:str,handler)->None:
+        """注册处理函数"""
+        self._handlers[method]=handler
+
+    def start(self)->'RpcChannel':
+        """启动后台读取任务"""
+        if self._reader is None:
+            self._reader=asyncio.get_running_loop().create_task(self._read())
+        return self
+
+    async def serve(self)->None:
+        """启动并等待读取任务结束(对端正常关闭连接时直接返回)"""
+        self.start()
+        await asyncio.wait((self._reader,))
+        if self._exception is not None and not self._peer_closed():
+            raise self._exception
+
+    async def call(self,method:str,payload:bytes=b'',timeout:float=0)->bytes:
+        """
+        调用对端注册的方法
+
+        @param method:方法名
+        @param payload:请求数据
+        @param timeout:超时时间(秒,0表示不限制)
+        @return:响应数据
+        """
+        if self._exception is not None:
+            raise self._exception
+        self.start()
+        request_id=self._new_id()
+        future=asyncio.get_running_loop().create_future()
+        self._pending[request_id]=future
+        try:
+            await self._connect._send(pack_request(method,payload),FLAG_REQUEST,request_id)
+            if timeout:
+                return await asyncio.wait_for(future,timeout)
+            return await future
+        except asyncio.TimeoutError:
+            self._cancel_remote(request_id)
+            raise TimeoutError('RPC调用超时')
+        except asyncio.CancelledError:
+            self._cancel_remote(request_id)
+            raise
+        finally:
+            self._pending.pop(request_id,None)
+
+    async def close(self)->None:
+        """停止读取任务并取消所有未完成的调用和处理任务"""
+        self._fail(ConnectionError('RPC通道已关闭'))
+        tasks=[task for task in (self._reader,*self._tasks) if task is not None and not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks,return_exceptions=True)
+
+    def pending(self)->int:
+        """获取未完成的调用数"""
+        return len(self._pending)
+
+    def _new_id(self)->int:
+        while True:
+            self._next_id=self._next_id+1 if self._next_id<_MAX_REQUEST_ID else 1
+            if self._next_id not in self._pending:
+                return self._next_id
+
+    def _peer_closed(self)->bool:
+        return self._connect.reader().at_eof() or self._connect.writer().is_closing()
+
+    async def _read(self)->None:
+        """读取任务"""
+        connect=self._connect
+        try:
+            while True:
+                header,data=await connect._read_frame()
+                kind=header.flags&_FLAG_CANCEL
+                if kind==FLAG_RESPONSE:
+                    future=self._pending.get(header.request_id)
+                    if future is not None and not future.done():
+                        self._resolve(future,data)
+                elif kind==FLAG_REQUEST:
+                    self._spawn(self._serve_request(header.request_id,data),header.request_id)
+                elif kind==_FLAG_CANCEL:
+                    task=self._serving.get(header.request_id)
+                    if task is not None:
+                        task.cancel()
+                else:
+                    raise ValueError('数据异常')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(e)
+
+    def _resolve(self,future:asyncio.Future,data:bytes)->None:
+        if not data:
+            future.set_exception(ValueError('数据异常'))
+        elif data[0]==STATUS_OK:
+            future.set_result(data[1:])
+        else:
+            future.set_exception(RpcError(data[0],bytes(data[1:]).decode(errors='replace')))
+
+    def _spawn(self,coro,request_id:int)->None:
+        task=asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        self._serving[request_id]=task
+
+        def done(task:asyncio.Task)->None:
+            self._tasks.discard(task)
+            if self._serving.get(request_id) is task:
+                del self._serving[request_id]
+        task.add_done_callback(done)
+
+    async def _serve_request(self,request_id:int,data:bytes)->None:
+        """执行处理函数并发送响应(被取消时不发送响应)"""
+        try:
+            method,payload=parse_request(data)
+            handler=self._handlers.get(method)
+            if handler is None:
+                reply=bytes([STATUS_NOT_FOUND])+f'方法不存在: {method}'.encode()
+            else:
+                result=await handler(self._connect,payload)
+                reply=bytes([STATUS_OK])+(result or b'')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            reply=bytes([STATUS_ERROR])+str(e).encode()
+        try:
+            await self._connect._send(reply,FLAG_RESPONSE,request_id)
+        except Exception as e:
+            self._fail(e)
+
+    def _cancel_remote(self,request_id:int)->None:
+        """通知对端取消请求(不等待发送完成)"""
+        if self._exception is not None:
+            return
+        task=asyncio.get_running_loop().create_task(self._connect._send(b'',_FLAG_CANCEL,request_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._cancel_sent)
+
+    def _cancel_sent(self,task:asyncio.Task)->None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self._fail(task.exception())
+
+    def _fail(self,exc:Exception)->None:
+        if self._exception is None:
+            self._exception=exc
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(self._exception)
+        for task in list(self._serving.values()):
+            task.cancel()
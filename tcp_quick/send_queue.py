@@ -0,0 +1,209 @@
+import asyncio,collections,time
+
+SEND_QUEUE_POLICIES=('block','drop_oldest','drop_newest','disconnect')
+
+class SendQueue:
+    """
+    连接的发送队列
+
+    发送数据时只把编码好的帧放入队列,由专门的写入任务按顺序写入传输层并等待drain,对端接收过慢时不会阻塞发送方
+    放入队列的bytearray/memoryview会被复制一份,send返回后调用方可以立即修改或复用自己的缓冲区
+    队列中未写出的数据超过高水位线时按策略处理:
+    block:等待队列降到低水位线以下(等待期间新的发送也会排在后面,保证帧的顺序与nonce顺序一致)
+    drop_oldest:丢弃队列中最早的帧直到可以放入新的帧
+    drop_newest:丢弃新的帧
+    disconnect:断开连接并抛出ConnectionError
+    丢弃总是以完整的帧为单位,不会破坏帧格式,使用计数器nonce的加密套件允许计数器不连续
+
+    @param connect:所属连接
+    @param high_water:高水位线(队列中未写出的字节数)
+    @param low_water:低水位线(默认为高水位线的一半)
+    @param policy:超过高水位线时的处理策略
+    """
+
+    def __init__(self,connect,high_water:int,low_water:int=None,policy:str='block')->None:
+        if high_water<=0:
+            raise ValueError('高水位线必须大于0')
+        if low_water is None:
+            low_water=high_water//2
+        if not 0<=low_water<=high_water:
+            raise ValueError('低水位线不合法')
+        if policy not in SEND_QUEUE_POLICIES:
+            raise ValueError('发送队列策略不合法')
+        self._connect=connect
+        self._high_water=high_water
+        self._low_water=low_water
+        self._policy=policy
+        # (缓冲区列表,字节数)
+        self._frames=collections.deque()
+        self._size=0
+        self._waiters=collections.deque()
+        self._wakeup=None
+        self._task=None
+        self._idle=asyncio.Event()
+        self._idle.set()
+        self._closed=False
+        self._exception=None
+        self._stats=collections.Counter()
+        self._size_peak=0
+
+    def size(self)->int:
+        """获取队列中未写出的字节数"""
+        return self._size
+
+    def policy(self)->str:
+        """获取超过高水位线时的处理策略"""
+        return self._policy
+
+    async def put(self,parts:list)->bool:
+        """
+        放入一个帧
+
+        @param parts:需要依次发送的缓冲区列表
+        @return:是否已放入队列(drop_newest策略丢弃新的帧时返回False)
+        """
+        self._check()
+        size=sum(len(part) for part in parts)
+        # 队列为空时总是允许放入,避免超过高水位线的单个帧永远无法发送
+        if self._waiters or (self._frames and self._size+size>self._high_water):
+            if self._policy=='block':
+                metrics=self._connect.get_metrics()
+                if metrics is None:
+                    await self._wait()
+                else:
+                    start=time.perf_counter_ns()
+                    try:
+                        await self._wait()
+                    finally:
+                        metrics.observe('send_queue_wait',time.perf_counter_ns()-start)
+            elif self._policy=='drop_newest':
+                self._stats['dropped_frames']+=1
+                self._stats['dropped_bytes']+=size
+                return False
+            elif self._policy=='drop_oldest':
+                while self._frames and self._size+size>self._high_water:
+                    _,dropped=self._frames.popleft()
+                    self._size-=dropped
+                    self._stats['dropped_frames']+=1
+                    self._stats['dropped_bytes']+=dropped
+            else:
+                self._stats['disconnected']+=1
+                self._fail(ConnectionError('对端接收过慢,连接已断开'))
+                self._connect.writer().transport.abort()
+                raise self._exception
+        if not all(isinstance(part,bytes) for part in parts):
+            # 放入队列后send就会返回,调用方可能修改可变的缓冲区(bytearray/memoryview),需要复制
+            parts=[part if isinstance(part,bytes) else bytes(part) for part in parts]
+        self._frames.append((parts,size))
+        self._size+=size
+        self._size_peak=max(self._size_peak,self._size)
+        self._stats['frames']+=1
+        self._stats['bytes']+=size
+        self._idle.clear()
+        if self._task is None:
+            self._task=asyncio.get_running_loop().create_task(self._run())
+        elif self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+        return True
+
+    async def flush(self)->None:
+        """等待队列中的数据全部写入传输层(写缓冲区超过高水位线时还会等待drain)"""
+        await self._idle.wait()
+        if self._exception is not None:
+            raise self._exception
+
+    def close(self)->None:
+        """
+        关闭队列并停止写入任务
+
+        队列中剩余的帧会直接交给传输层(由传输层在关闭前尽量发送),等待中的发送方会收到ConnectionError
+        """
+        if self._closed:
+            return
+        self._closed=True
+        transport=self._connect.writer().transport
+        if self._exception is None and not transport.is_closing():
+            while self._frames:
+                parts,_=self._frames.popleft()
+                self._connect._write_parts(parts)
+        self._frames.clear()
+        self._size=0
+        self._fail(ConnectionError('连接已关闭'))
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def stats(self)->dict:
+        """获取发送队列统计信息"""
+        return {
+            'policy':self._policy,
+            'high_water':self._high_water,
+            'low_water':self._low_water,
+            'size':self._size,
+            'size_peak':self._size_peak,
+            'frames':self._stats['frames'],
+            'bytes':self._stats['bytes'],
+            'blocked':self._stats['blocked'],
+            'dropped_frames':self._stats['dropped_frames'],
+            'dropped_bytes':self._stats['dropped_bytes'],
+            'disconnected':self._stats['disconnected']
+        }
+
+    def _check(self)->None:
+        if self._exception is not None:
+            raise self._exception
+        if self._closed:
+            raise ConnectionError('连接已关闭')
+
+    async def _wait(self)->None:
+        """等待队列降到低水位线以下(按到达顺序唤醒)"""
+        self._stats['blocked']+=1
+        waiter=asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        finally:
+            # 被唤醒后仍留在队列中直到放入帧,使新到达的发送方无法插队
+            self._waiters.remove(waiter)
+            if self._waiters and self._size<=self._low_water:
+                # 被唤醒的发送方已取消时不会再放入帧,需要继续唤醒后面的发送方
+                self._wake_waiters()
+        self._check()
+
+    def _wake_waiters(self)->None:
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _fail(self,exc:Exception)->None:
+        if self._exception is None:
+            self._exception=exc
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_exception(self._exception)
+                # 避免调用方已取消时出现未获取异常的警告
+                waiter.exception()
+        self._idle.set()
+
+    async def _run(self)->None:
+        """写入任务"""
+        connect=self._connect
+        loop=asyncio.get_running_loop()
+        try:
+            while True:
+                while not self._frames:
+                    self._idle.set()
+                    self._wakeup=loop.create_future()
+                    try:
+                        await self._wakeup
+                    finally:
+                        self._wakeup=None
+                parts,size=self._frames.popleft()
+                self._size-=size
+                connect._write_parts(parts)
+                if self._waiters and self._size<=self._low_water:
+                    self._wake_waiters()
+                await connect._drain_if_needed()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(e)
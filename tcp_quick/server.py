@@ -1,6 +1,18 @@
-import re,asyncio
+import re,asyncio,os,time
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABC,abstractmethod
 from .connect import Connect
+from .key_provider import KeyProvider
+from .ticket import TicketKeyCache
+from .admission import AdmissionQueue
+from .send_queue import SEND_QUEUE_POLICIES
+from .workers import WorkerPool
+from .loop import LOOP_NAMES,run
+from .broadcast import BroadcastResult,broadcast
+from .protocol import FrameProtocol
+from .rpc import RpcChannel
+from .mux import Multiplexer,MuxStream
+from .metrics import Metrics
 
 class Server(ABC):
     """
@@ -11,22 +23,71 @@ class Server(ABC):
     @param port:监听端口
     @param backlog:最大处理的连接数
     @param reject:是否拒绝超出最大处理连接数的连接
+    @param max_queue:最大排队数(默认为0,即不限制,排队数达到上限后新的连接会被拒绝)
+    @param queue_timeout:排队超时时间(默认为0,即不限制)
     @param listen_keywords:是否监听键盘输入
     @param use_line:是否使用行模式传输数据(仅支持以“\\n”,“\\r”或“\\r\\n”结尾的数据,开启后将自动在行尾添加“\\n”)
+    @param line_codec:行模式下发送数据的编码方式(escape:转义换行符,兼容旧版本,length:长度前缀行+原始数据,不改写数据,接收时兼容escape编码,需要与对端保持一致)
     @param ssl:SSL/TLS上下文(默认为None,即不使用SSL/TLS)
     @param use_aes:是否使用AES加密传输数据(默认为自动,即根据SSL/TLS上下文是否存在来决定是否使用AES加密)
+    @param cipher_suites:密钥交换时可协商的加密套件(按优先级排列,默认为aes-gcm,chacha20-poly1305,aes-eax,对端为旧版本时使用aes-eax)
+    @param key_provider:密钥交换使用的RSA密钥提供者(默认为None,即启动时生成仅保存在内存中的密钥对,可使用FileKeyProvider持久化服务端身份)
+    @param key_exchange:密钥交换方式(rsa:RSA-OAEP,兼容旧版本,x25519:X25519+HKDF,服务端使用RSA身份私钥签名临时公钥,需要与对端保持一致)
+    @param session_ticket:是否向客户端签发会话票据(客户端重新连接时可跳过RSA/X25519运算直接恢复会话)
+    @param ticket_keys:票据密钥缓存(默认为None,即使用有效期为1小时的TicketKeyCache,多进程时可传入共享的缓存)
+    @param crypto_workers:处理大数据加密/解密的线程池大小(默认为0,即总是在事件循环中加密/解密)
+    @param crypto_offload_threshold:交由线程池加密/解密的数据大小阈值(默认为1MiB)
     @param limit:限制每个连接默认的缓冲区大小(默认为65536字节,即64KiB)
+    @param send_queue:每个连接发送队列的高水位线(字节,默认为0,即不使用发送队列,发送时直接等待drain)
+    @param send_queue_policy:发送队列超过高水位线时的处理策略(block:等待,drop_oldest:丢弃最早的帧,drop_newest:丢弃新的帧,disconnect:断开连接)
+    @param compression:可协商的压缩算法(按优先级排列,例如['zlib'],默认为None,即不压缩,启用后需要与对端保持一致,不支持行模式)
+    @param compression_min_size:压缩的最小帧大小(默认为64字节)
+    @param compression_context:是否在帧之间保留压缩上下文(默认为True,大量相似的小消息也能得到较高的压缩率)
+    @param codecs:send_obj/recv_obj可协商的编码器(按优先级排列,例如['msgpack','json'],默认为None,即不协商,使用json,设置后需要与对端保持一致)
+    @param coalesce_delay:小消息合并窗口(秒,窗口内send发送的小消息合并为一个超级帧,默认为None,即不合并,对端接收时总是自动识别,不支持行模式)
+    @param coalesce_max_bytes:超级帧的最大数据大小(默认为16384字节)
+    @param metrics:是否记录性能指标(帧数、字节数以及握手、排队、加密/解密、等待drain等耗时的直方图,默认为False,即不记录,可通过get_metrics/dump_metrics获取)
+    @param engine:传输引擎(stream:基于StreamReader/StreamWriter,protocol:基于BufferedProtocol直接解析帧,适合大量小消息)
+    @param frame_version:发送数据时使用的帧格式版本(0:MCP-TCP0,1:MCP-TCP1二进制帧头,默认为自动,即收到对端的MCP-TCP1帧后切换,接收时总是自动识别)
+    @param max_frame_size:允许接收的最大帧大小(默认为0x7fffffff字节,MCP-TCP1帧可以超过该大小)
+    @param workers:工作进程数量(默认为1,即在当前进程中运行,大于1时fork出对应数量的工作进程共同监听,backlog等限制对每个工作进程单独生效)
+    @param reuse_port:多进程模式下是否使用SO_REUSEPORT(默认为自动,即平台支持时每个工作进程各自监听,否则共享同一个监听套接字)
+    @param loop:事件循环实现(默认为None,即asyncio默认事件循环,uvloop:使用uvloop,未安装时回退到默认事件循环,auto:已安装uvloop时使用uvloop,也可以传入返回事件循环的可调用对象或asyncio.AbstractEventLoopPolicy实例)
     """
 
     def __init__(
         self,
         host:str='0.0.0.0',port:int=10901,
         backlog:int=5,reject:bool=False,
+        max_queue:int=0,queue_timeout:float=0,
         listen_keywords:bool=False,
         use_line:bool=False,
+        line_codec:str='escape',
         ssl=None,
         use_aes=None,
-        limit:int=65536
+        cipher_suites=None,
+        key_provider:KeyProvider=None,
+        key_exchange:str='rsa',
+        session_ticket:bool=True,
+        ticket_keys:TicketKeyCache=None,
+        crypto_workers:int=0,
+        crypto_offload_threshold:int=1<<20,
+        limit:int=65536,
+        send_queue:int=0,
+        send_queue_policy:str='block',
+        compression=None,
+        compression_min_size:int=64,
+        compression_context:bool=True,
+        codecs=None,
+        coalesce_delay:float=None,
+        coalesce_max_bytes:int=16384,
+        metrics:bool=False,
+        engine:str='stream',
+        frame_version:int=None,
+        max_frame_size:int=0x7fffffff,
+        workers:int=1,
+        reuse_port:bool=None,
+        loop=None
     )->None:
         self._listen_ip=self._validate_ip(host)
         self._listen_port=self._validate_port(port)
@@ -34,13 +95,54 @@ class Server(ABC):
             raise ValueError('最大连接数必须大于0')
         self._backlog=backlog
         self._limit=limit
+        if send_queue<0:
+            raise ValueError('发送队列高水位线不能小于0')
+        if send_queue_policy not in SEND_QUEUE_POLICIES:
+            raise ValueError('发送队列策略不合法')
+        self._send_queue=send_queue
+        self._send_queue_policy=send_queue_policy
+        if compression is not None and use_line:
+            raise ValueError('行模式不支持压缩')
+        self._compression=compression
+        self._compression_min_size=compression_min_size
+        self._compression_context=compression_context
+        self._codecs=codecs
+        if coalesce_delay is not None and use_line:
+            raise ValueError('行模式不支持合并发送')
+        self._coalesce_delay=coalesce_delay
+        self._coalesce_max_bytes=coalesce_max_bytes
+        # 已关闭连接的性能指标(None表示未启用)
+        self._metrics=Metrics() if metrics else None
+        if engine not in ('stream','protocol'):
+            raise ValueError('传输引擎不合法')
+        self._engine=engine
+        if frame_version not in (None,0,1):
+            raise ValueError('帧格式版本不合法')
+        self._frame_version=frame_version
+        self._max_frame_size=max_frame_size
         self._reject=reject
+        self._admission=AdmissionQueue(backlog,max_queue,queue_timeout)
         self._use_line=use_line
+        if line_codec not in ('escape','length'):
+            raise ValueError('行模式编码方式不合法')
+        self._line_codec=line_codec
         self._ssl=ssl
         if use_aes is None:
             self._use_aes=False if ssl else True
         else:
             self._use_aes=use_aes
+        self._cipher_suites=cipher_suites
+        self._key_provider=key_provider
+        if key_exchange not in ('rsa','x25519'):
+            raise ValueError('密钥交换方式不合法')
+        self._key_exchange=key_exchange
+        if session_ticket and ticket_keys is None:
+            ticket_keys=TicketKeyCache()
+        self._ticket_keys=ticket_keys if session_ticket else None
+        if crypto_workers<0:
+            raise ValueError('线程池大小不能小于0')
+        self._crypto_executor=ThreadPoolExecutor(crypto_workers,'tcp_quick_crypto') if crypto_workers else None
+        self._crypto_offload_threshold=crypto_offload_threshold
         self._connected_clients=0
         self._queue_clients=0
         self._connect=set()
@@ -49,6 +151,18 @@ class Server(ABC):
         self._shutdown_event=asyncio.Event()
         self._is_shutdown=False
         self._listen_keyboard=listen_keywords
+        if workers<=0:
+            raise ValueError('工作进程数量必须大于0')
+        self._workers=workers
+        if isinstance(loop,str) and loop not in LOOP_NAMES:
+            raise ValueError('事件循环不合法')
+        self._loop=loop
+        self._reuse_port=reuse_port
+        # 多进程模式下由WorkerPool设置
+        self._worker_index=0
+        self._listen_sock=None
+        # RPC方法名->处理函数
+        self._rpc_handlers={}
 
     async def _run_tasks(self):
         """运行并行任务"""
@@ -60,7 +174,10 @@ class Server(ABC):
     def run(self):
         """运行服务器"""
         try:
-            asyncio.run(self._run_tasks())
+            if self._workers>1:
+                WorkerPool(self,self._workers,self._reuse_port).run()
+                return
+            run(self._run_tasks(),self._loop)
         except Exception as e:
             self._server_error(e)
 
@@ -77,16 +194,38 @@ class Server(ABC):
             return port
         raise ValueError('端口号不合法')
 
+    async def _prepare(self)->None:
+        """开始监听前准备好RSA密钥,避免第一个连接等待密钥生成"""
+        if self._use_aes:
+            if self._key_provider is not None:
+                await self._key_provider.prepare()
+            else:
+                await Connect.get_public_key()
+
     async def _start_server(self)->None:
         """启动服务器"""
-        # 监听连接
-        self._server=await asyncio.start_server(
-            self._handle_client,
-            self._listen_ip,
-            self._listen_port,
-            limit=self._limit,
-            ssl=self._ssl
-        )
+        await self._prepare()
+        # 监听连接(多进程模式下使用SO_REUSEPORT或主进程创建的监听套接字)
+        if self._listen_sock is not None:
+            listen={'sock':self._listen_sock}
+        else:
+            listen={'host':self._listen_ip,'port':self._listen_port}
+            if self._workers>1 and self._reuse_port:
+                listen['reuse_port']=True
+        if self._engine=='protocol':
+            loop=asyncio.get_running_loop()
+            self._server=await loop.create_server(
+                lambda:FrameProtocol(self._handle_client,self._limit),
+                ssl=self._ssl,
+                **listen
+            )
+        else:
+            self._server=await asyncio.start_server(
+                self._handle_client,
+                limit=self._limit,
+                ssl=self._ssl,
+                **listen
+            )
         async with self._server:
             await self._shutdown_event.wait()
         await self._server.wait_closed()
@@ -95,49 +234,172 @@ class Server(ABC):
         addr=writer.get_extra_info('peername')
         try:
             connect=Connect(reader,writer,use_aes=self._use_aes)
+            connect.set_frame_version(self._frame_version)
+            connect.set_max_frame_size(self._max_frame_size)
+            if self._cipher_suites is not None:
+                connect.set_cipher_suites(self._cipher_suites)
+            connect.set_key_provider(self._key_provider)
+            connect.set_key_exchange(self._key_exchange)
+            connect.set_ticket_keys(self._ticket_keys)
+            if self._crypto_executor is not None:
+                connect.set_crypto_executor(self._crypto_executor,self._crypto_offload_threshold)
             if self._use_line:
-                connect.use_line()
-            if self._connected_clients>=self._backlog:
+                connect.use_line().set_line_codec(self._line_codec)
+            if self._send_queue:
+                connect.set_send_queue(self._send_queue,policy=self._send_queue_policy)
+            if self._compression is not None:
+                connect.set_compression(self._compression,min_size=self._compression_min_size,use_context=self._compression_context)
+            if self._codecs is not None:
+                connect.set_codecs(self._codecs)
+            if self._metrics is not None:
+                connect.set_metrics()
+            if not self._admission.try_acquire():
                 if self._reject:
                     await self._reject_client(connect)
                     return
-                else:
-                    self._queue_clients+=1
-                    self._queue_connect.add(connect)
-                    is_closing=False
-                    try:
-                        while self._connected_clients>=self._backlog:
-                            await asyncio.sleep(0.1)
-                            if writer.transport.is_closing():
-                                is_closing=True
-                                raise ConnectionError('排队中的客户端已关闭')
-                    except Exception as e:
-                        await self._queue_error(connect,e)
-                    self._queue_clients-=1
-                    self._queue_connect.discard(connect)
-                    if is_closing:
-                        return
+                start=time.perf_counter_ns()
+                admitted=await self._wait_admission(connect)
+                if self._metrics is not None:
+                    connect.get_metrics().observe('admission_wait',time.perf_counter_ns()-start)
+                if not admitted:
+                    self._close_metrics(connect)
+                    return
         except Exception as e:
             await self._error(addr,e)
             return
         try:
             self._connected_clients+=1
             self._connect.add(connect)
+            start=time.perf_counter_ns()
             if self._use_aes:
                 await self.key_exchange_to_client(connect)
+            if self._compression is not None:
+                await connect.negotiate_compression(True)
+            if self._codecs is not None:
+                await connect.negotiate_codec(True)
+            if self._coalesce_delay is not None:
+                connect.set_coalesce(self._coalesce_delay,self._coalesce_max_bytes)
+            if self._metrics is not None:
+                metrics=connect.get_metrics()
+                metrics.add('handshakes')
+                metrics.observe('handshake',time.perf_counter_ns()-start)
             await self._connection_made(addr,connect)
             await self._handle(connect)
         except Exception as e:
             await self._error(addr,e)
         finally:
             self._connected_clients-=1
+            self._admission.release()
             self._connect.discard(connect)
+            self._close_metrics(connect)
             await self._connection_closed(addr,connect)
 
+    async def _wait_admission(self,connect:Connect)->bool:
+        """
+        排队等待空闲名额(有连接释放名额时按优先级和到达顺序唤醒,排队期间客户端断开会立即退出队列)
+
+        @return:是否获取到名额
+        """
+        self._queue_clients+=1
+        self._queue_connect.add(connect)
+        acquire=asyncio.ensure_future(self._admission.acquire(await self._queue_priority(connect)))
+        closed=asyncio.ensure_future(connect.wait_eof())
+        try:
+            await asyncio.wait((acquire,closed),return_when=asyncio.FIRST_COMPLETED)
+            if not acquire.done():
+                acquire.cancel()
+                await asyncio.gather(acquire,return_exceptions=True)
+                raise ConnectionError('排队中的客户端已关闭')
+            if acquire.exception() is not None:
+                if isinstance(acquire.exception(),ConnectionError):
+                    # 排队数已达上限
+                    await self._reject_client(connect)
+                    return False
+                raise acquire.exception()
+            return True
+        except Exception as e:
+            await self._queue_error(connect,e)
+            await connect.close()
+            return False
+        finally:
+            if not acquire.done():
+                acquire.cancel()
+            closed.cancel()
+            self._queue_clients-=1
+            self._queue_connect.discard(connect)
+
+    def get_stats(self)->dict:
+        """获取当前进程的统计信息(多进程模式下由主进程汇总)"""
+        return {
+            'worker':self._worker_index,
+            'pid':os.getpid(),
+            'connections':len(self._connect),
+            'queue':self.get_queue_stats(),
+            'send_queue':self.get_send_queue_stats(),
+            'metrics':self.get_metrics()
+        }
+
+    def get_metrics(self)->Metrics:
+        """汇总当前进程所有连接(包括已关闭的连接)的性能指标(未启用时返回None)"""
+        if self._metrics is None:
+            return None
+        total=Metrics().merge(self._metrics)
+        for connect in self._connect:
+            metrics=connect.get_metrics()
+            if metrics is not None:
+                total.merge(metrics)
+        total.set_gauge('connections',len(self._connect))
+        total.set_gauge('queued',self._queue_clients)
+        return total
+
+    def dump_metrics(self,format:str='prometheus')->str:
+        """
+        导出性能指标(未启用时返回空字符串)
+
+        @param format:导出格式(prometheus:Prometheus文本格式,带worker标签,json:JSON)
+        """
+        if format not in ('prometheus','json'):
+            raise ValueError('导出格式不合法')
+        metrics=self.get_metrics()
+        if metrics is None:
+            return ''
+        if format=='json':
+            return metrics.to_json()
+        return metrics.to_prometheus(labels={'worker':self._worker_index})
+
+    def _close_metrics(self,connect:Connect)->None:
+        """将关闭的连接的性能指标计入服务端"""
+        metrics=connect.get_metrics()
+        if metrics is not None and self._metrics is not None:
+            self._metrics.merge(metrics)
+
+    def get_send_queue_stats(self)->dict:
+        """汇总所有连接的发送队列统计信息(未使用发送队列时返回None)"""
+        if not self._send_queue:
+            return None
+        total=dict.fromkeys(('size','size_peak','frames','bytes','blocked','dropped_frames','dropped_bytes','disconnected'),0)
+        for connect in self._connect:
+            stats=connect.get_send_queue_stats()
+            if stats is None:
+                continue
+            for key in total:
+                total[key]=max(total[key],stats[key]) if key=='size_peak' else total[key]+stats[key]
+        return {'policy':self._send_queue_policy,'high_water':self._send_queue,**total}
+
+    def get_queue_stats(self)->dict:
+        """获取排队统计信息(当前排队数,各优先级排队数,已准入/拒绝/超时数,平均/最长等待时间等)"""
+        return self._admission.stats()
+
     async def key_exchange_to_client(self,connect:Connect)->None:
         """与客户端进行密钥交换"""
         await connect.key_exchange_to_client()
 
+    async def rotate_key(self)->None:
+        """轮换RSA密钥(新密钥生成完成前继续使用旧密钥,已建立的连接不受影响)"""
+        if self._key_provider is None:
+            raise ValueError('未设置密钥提供者')
+        await self._key_provider.rotate()
+
     def get_all_connections(self)->list:
         """获取所有连接"""
         return list(self._connect)
@@ -162,6 +424,8 @@ class Server(ABC):
         if self._server:
             self._server.close()
             await self._server.wait_closed()
+        if self._crypto_executor is not None:
+            self._crypto_executor.shutdown(wait=False)
         self._shutdown_event.set()
 
     async def is_shutdown(self)->bool:
@@ -209,8 +473,9 @@ class Server(ABC):
         @param timeout:单个任务的超时时间
         @return:返回一个列表,列表中的元素为每个任务的返回结果和异常
         """
-        tasks=[connect.send(data,timeout) for connect in self.get_all_connections()]
-        return await asyncio.gather(*tasks,return_exceptions=True)
+        connects=self.get_all_connections()
+        result=await broadcast(connects,data,timeout)
+        return [result.errors.get(connect) for connect in connects]
 
     async def sendall_raw(self,data:bytes,timeout:int=0)->list:
         """
@@ -220,8 +485,92 @@ class Server(ABC):
         @param timeout:单个任务的超时时间
         @return:返回一个列表,列表中的元素为每个任务的返回结果和异常
         """
-        tasks=[connect.send_raw(data,timeout) for connect in self.get_all_connections()]
-        return await asyncio.gather(*tasks,return_exceptions=True)
+        connects=self.get_all_connections()
+        result=await broadcast(connects,data,timeout,raw=True)
+        return [result.errors.get(connect) for connect in connects]
+
+    async def broadcast(self,data:bytes,timeout:float=0,concurrency:int=256,raw:bool=False,connects:list=None)->BroadcastResult:
+        """
+        广播数据(编码方式相同的未加密连接共用同一份帧数据,并发数有上限)
+
+        @param data:要发送的数据
+        @param timeout:单个连接的发送超时时间
+        @param concurrency:最多同时等待发送的连接数
+        @param raw:是否发送原始数据
+        @param connects:目标连接(默认为所有连接)
+        @return:广播结果,失败的连接及异常见errors,摘要见summary()
+        """
+        if await self.is_shutdown():
+            raise ConnectionError('服务器已关闭')
+        if connects is None:
+            connects=self.get_all_connections()
+        return await broadcast(connects,data,timeout,concurrency,raw)
+
+    def register_rpc(self,method:str,handler)->None:
+        """
+        注册RPC处理函数(在_handle中调用serve_rpc后生效)
+
+        @param method:方法名
+        @param handler:协程函数,参数为(connect,payload),返回响应数据,抛出的异常会以RpcError的形式返回给调用方
+        """
+        self._rpc_handlers[method]=handler
+
+    def rpc_method(self,method:str):
+        """注册RPC处理函数的装饰器"""
+        def decorator(handler):
+            self.register_rpc(method,handler)
+            return handler
+        return decorator
+
+    async def serve_rpc(self,connect:Connect)->None:
+        """
+        在连接上处理RPC请求,直到连接关闭(同一连接上的多个请求会并发处理)
+
+        通常在_handle中调用: await self.serve_rpc(connect)
+        """
+        channel=RpcChannel(connect,self._rpc_handlers)
+        try:
+            await channel.serve()
+        finally:
+            await channel.close()
+
+    async def serve_streams(self,connect:Connect,window:int=256*1024)->None:
+        """
+        在连接上接受客户端打开的多路复用流,每个流交给_handle_stream在独立的任务中处理,直到连接关闭
+
+        通常在_handle中调用: await self.serve_streams(connect)
+
+        @param window:每个流的流量控制窗口(需要与客户端保持一致)
+        """
+        mux=Multiplexer(connect,is_client=False,window=window).start()
+        tasks=set()
+        try:
+            while True:
+                try:
+                    stream=await mux.accept()
+                except ConnectionError:
+                    break
+                task=asyncio.ensure_future(self._serve_stream(connect,stream))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks,return_exceptions=True)
+            await mux.close()
+
+    async def _serve_stream(self,connect:Connect,stream:MuxStream)->None:
+        try:
+            await self._handle_stream(connect,stream)
+        except Exception as e:
+            stream.reset()
+            await self._error(connect.peername(),e)
+        else:
+            await stream.close()
+
+    async def _handle_stream(self,connect:Connect,stream:MuxStream)->None:
+        """处理多路复用的流(使用serve_streams时需要重写,返回后会自动关闭流的发送方向,抛出异常时重置流)"""
+        raise NotImplementedError('未实现流处理方法')
 
     async def _list_connections(self)->None:
         """列出所有连接"""
@@ -248,6 +597,9 @@ class Server(ABC):
                 print("exit/quit/stop:关闭服务器")
                 print("backlog:修改最大连接数")
                 print("reject:切换“超出最大连接数”模式")
+                print("rotate:轮换RSA密钥")
+                print("queue:查看排队统计信息")
+                print("metrics:查看性能指标")
             elif command.lower() in ['exit','quit','stop']:
                 await self.close_all()
                 break
@@ -257,15 +609,34 @@ class Server(ABC):
                 backlog=int(await asyncio.to_thread(input,"请输入新的最大连接数:"))
                 if backlog>0:
                     self._backlog=backlog
+                    self._admission.set_limit(backlog)
                     print(f"已将最大连接数设置为{backlog}")
                 else:
                     print("最大连接数必须大于0")
             elif command.lower()=='reject':
                 self._reject=not self._reject
                 print(f"从下一次开始连接的“超出最大连接数”模式设置为{'拒绝' if self._reject else '阻塞'}")
+            elif command.lower()=='queue':
+                for key,value in self.get_queue_stats().items():
+                    print(f"{key}: {value}")
+            elif command.lower()=='metrics':
+                if self._metrics is None:
+                    print("未启用性能指标")
+                else:
+                    print(self.dump_metrics(),end='')
+            elif command.lower()=='rotate':
+                try:
+                    await self.rotate_key()
+                    print("已轮换RSA密钥")
+                except ValueError as e:
+                    print(e)
             else:
                 print("未知命令,请输入help查看帮助")
 
+    async def _queue_priority(self,connect:Connect)->int:
+        """获取排队连接的优先级(数字越小优先级越高,默认所有连接优先级相同)"""
+        return 0
+
     async def _reject_client(self,connect:Connect)->None:
         """连接超出最大连接数被拒绝时的连接处理"""
         await connect.close()
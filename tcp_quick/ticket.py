@@ -0,0 +1,206 @@
+import collections,hashlib,hmac,os,struct,time
+from typing import Optional
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+# 会话票据恢复消息格式
+# 恢复请求: 魔数+客户端随机数(32)+票据
+# 恢复响应: 魔数+状态(1,0:拒绝,1:接受)+服务端随机数(32)+校验码(32)
+# 新票据: 有效期(u32,秒)+票据
+# 票据: 票据密钥ID(4,密钥段号)+nonce(12)+AES-GCM加密的(过期时间(u64)+加密套件(1)+恢复密钥(32))
+RESUME_MAGIC=b'MCP-RESM'
+TICKET_REQUEST=b'MCP-TICKET'
+_ticket_struct=struct.Struct('!QB')
+_lifetime_struct=struct.Struct('!I')
+_key_id_struct=struct.Struct('!I')
+
+class TicketKeyCache:
+    """
+    服务端票据密钥缓存
+
+    票据密钥按时间分段,每rotate_interval秒为一段,每段的密钥由主密钥通过HKDF派生,密钥ID即为段号
+    只接受最近max_keys段内签发的票据,派生出的密钥对象最多缓存max_keys个
+    由于密钥只取决于主密钥和时间,fork出的多个进程(或传入相同secret的多台服务器)无需同步即可互相恢复会话
+
+    @param lifetime:票据有效期(秒)
+    @param rotate_interval:票据密钥轮换间隔(秒,默认为有效期)
+    @param max_keys:接受的票据密钥数量(需要不小于有效期/轮换间隔+1,否则票据会提前失效)
+    @param secret:主密钥(默认为随机生成)
+    """
+
+    def __init__(self,lifetime:int=3600,rotate_interval:int=0,max_keys:int=4,secret:bytes=None)->None:
+        if lifetime<=0:
+            raise ValueError('票据有效期必须大于0')
+        if max_keys<=0:
+            raise ValueError('票据密钥数量必须大于0')
+        self._lifetime=lifetime
+        self._rotate_interval=rotate_interval or lifetime
+        self._max_keys=max_keys
+        self._secret=secret or os.urandom(32)
+        # 段号->AESGCM
+        self._keys=collections.OrderedDict()
+
+    def lifetime(self)->int:
+        """获取票据有效期"""
+        return self._lifetime
+
+    def issue(self,secret:bytes,suite:int)->bytes:
+        """签发票据"""
+        now=time.time()
+        epoch=int(now//self._rotate_interval)
+        key_id=_key_id_struct.pack(epoch&0xffffffff)
+        nonce=os.urandom(12)
+        data=_ticket_struct.pack(int(now)+self._lifetime,suite)+secret
+        return key_id+nonce+self._key(epoch).encrypt(nonce,data,key_id)
+
+    def open(self,ticket:bytes)->Optional[tuple]:
+        """
+        解密票据
+
+        @return:(恢复密钥,加密套件),票据无效或已过期时返回None
+        """
+        if len(ticket)<16:
+            return None
+        now=time.time()
+        current=int(now//self._rotate_interval)
+        epoch=current-((current-_key_id_struct.unpack_from(ticket)[0])&0xffffffff)
+        if epoch<=current-self._max_keys:
+            return None
+        try:
+            data=self._key(epoch).decrypt(ticket[4:16],ticket[16:],ticket[:4])
+        except InvalidTag:
+            return None
+        expires,suite=_ticket_struct.unpack_from(data)
+        if expires<now:
+            return None
+        return data[_ticket_struct.size:],suite
+
+    def rotate(self,secret:bytes=None)->None:
+        """更换主密钥(之前签发的所有票据立即失效)"""
+        self._secret=secret or os.urandom(32)
+        self._keys.clear()
+
+    def _key(self,epoch:int)->AESGCM:
+        """获取指定段的票据密钥"""
+        aead=self._keys.get(epoch)
+        if aead is None:
+            key=HKDF(hashes.SHA256(),16,None,TICKET_REQUEST+b'-KEY'+struct.pack('!Q',epoch)).derive(self._secret)
+            aead=self._keys[epoch]=AESGCM(key)
+            while len(self._keys)>self._max_keys:
+                self._keys.popitem(last=False)
+        return aead
+
+class SessionTicket:
+    """
+    客户端保存的会话票据
+
+    @param ticket:服务端签发的票据(对客户端不透明)
+    @param secret:恢复密钥
+    @param suite:加密套件
+    @param expires:过期时间(time.monotonic)
+    """
+    __slots__=('ticket','secret','suite','expires')
+
+    def __init__(self,ticket:bytes,secret:bytes,suite:int,expires:float)->None:
+        self.ticket=ticket
+        self.secret=secret
+        self.suite=suite
+        self.expires=expires
+
+    def is_valid(self)->bool:
+        """判断票据是否仍在有效期内"""
+        return self.expires>time.monotonic()
+
+class SessionCache:
+    """
+    客户端会话票据缓存(按服务端地址保存,超出数量时淘汰最久未使用的票据)
+
+    @param max_size:最多保存的票据数量
+    """
+
+    def __init__(self,max_size:int=256)->None:
+        self._max_size=max_size
+        self._tickets=collections.OrderedDict()
+
+    def get(self,key)->Optional[SessionTicket]:
+        """获取仍在有效期内的票据"""
+        session=self._tickets.get(key)
+        if session is None:
+            return None
+        if not session.is_valid():
+            del self._tickets[key]
+            return None
+        self._tickets.move_to_end(key)
+        return session
+
+    def put(self,key,session:SessionTicket)->None:
+        """保存票据"""
+        self._tickets[key]=session
+        self._tickets.move_to_end(key)
+        while len(self._tickets)>self._max_size:
+            self._tickets.popitem(last=False)
+
+    def discard(self,key)->None:
+        """删除票据"""
+        self._tickets.pop(key,None)
+
+def derive_secret(key:bytes,context:bytes)->bytes:
+    """根据会话密钥派生用于恢复会话的恢复密钥"""
+    return HKDF(hashes.SHA256(),32,None,TICKET_REQUEST+hashlib.sha256(context).digest()).derive(key)
+
+def derive_resumed_key(secret:bytes,client_random:bytes,server_random:bytes)->tuple:
+    """
+    派生恢复后的会话密钥
+
+    @return:(会话密钥,服务端校验码)
+    """
+    data=HKDF(hashes.SHA256(),64,client_random+server_random,RESUME_MAGIC).derive(secret)
+    key,mac_key=data[:32],data[32:]
+    return key,hmac.new(mac_key,RESUME_MAGIC+client_random+server_random,hashlib.sha256).digest()
+
+def pack_new_ticket(lifetime:int,ticket:bytes)->bytes:
+    """构建新票据消息"""
+    return _lifetime_struct.pack(lifetime)+ticket
+
+def parse_new_ticket(data:bytes,secret:bytes,suite:int)->SessionTicket:
+    """解析新票据消息"""
+    if len(data)<=_lifetime_struct.size:
+        raise ValueError('秘钥交换失败')
+    lifetime=_lifetime_struct.unpack_from(data)[0]
+    return SessionTicket(data[_lifetime_struct.size:],secret,suite,time.monotonic()+lifetime)
+
+def pack_resume_request(client_random:bytes,ticket:bytes)->bytes:
+    """构建恢复请求"""
+    return RESUME_MAGIC+client_random+ticket
+
+def parse_resume_request(data:bytes)->tuple:
+    """
+    解析恢复请求
+
+    @return:(客户端随机数,票据)
+    """
+    if len(data)<=40 or not data.startswith(RESUME_MAGIC):
+        raise ValueError('秘钥交换失败')
+    return data[8:40],data[40:]
+
+def pack_resume_reply(server_random:bytes=b'',mac:bytes=b'')->bytes:
+    """构建恢复响应(不传入参数时表示拒绝恢复)"""
+    if not server_random:
+        return RESUME_MAGIC+b'\x00'
+    return RESUME_MAGIC+b'\x01'+server_random+mac
+
+def parse_resume_reply(data:bytes)->Optional[tuple]:
+    """
+    解析恢复响应
+
+    @return:(服务端随机数,校验码),服务端拒绝恢复时返回None
+    """
+    if not data.startswith(RESUME_MAGIC) or len(data)<9:
+        raise ValueError('秘钥交换失败')
+    if data[8]==0:
+        return None
+    if data[8]!=1 or len(data)!=73:
+        raise ValueError('秘钥交换失败')
+    return data[9:41],data[41:73]
@@ -0,0 +1,295 @@
+import asyncio,multiprocessing,signal,socket,threading
+from .loop import run
+from .metrics import Metrics
+
+class WorkerPool:
+    """
+    多进程服务端
+
+    主进程准备好RSA密钥和票据密钥后fork出多个工作进程,每个工作进程运行独立的事件循环和Server实例
+    支持SO_REUSEPORT时每个工作进程各自监听同一端口,由内核分配连接,否则所有工作进程共享主进程创建的监听套接字
+    主进程负责处理信号和控制台命令,通过管道通知工作进程调用close_all并汇总各工作进程的统计信息
+
+    注意: backlog/max_queue等限制对每个工作进程单独生效;仅支持可以fork的平台
+
+    @param server:服务端实例(工作进程中为fork得到的副本)
+    @param workers:工作进程数量
+    @param reuse_port:是否使用SO_REUSEPORT(默认为自动,即平台支持时使用)
+    @param shutdown_timeout:关闭时等待工作进程退出的时间(秒),超时后强制结束
+    """
+
+    def __init__(self,server,workers:int,reuse_port:bool=None,shutdown_timeout:float=10)->None:
+        if workers<=0:
+            raise ValueError('工作进程数量必须大于0')
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise ValueError('当前平台不支持多进程模式')
+        if reuse_port is None:
+            reuse_port=hasattr(socket,'SO_REUSEPORT')
+        self._server=server
+        self._workers=workers
+        self._reuse_port=reuse_port
+        self._shutdown_timeout=shutdown_timeout
+        self._processes=[]
+        self._pipes=[]
+        self._pending={}
+        self._shutdown_event=None
+
+    def run(self)->None:
+        """启动工作进程并运行主进程"""
+        server=self._server
+        # fork前准备好密钥,所有工作进程使用相同的服务端身份
+        asyncio.run(server._prepare())
+        sock=None
+        if not self._reuse_port:
+            sock=socket.create_server((server._listen_ip,server._listen_port),backlog=128)
+        context=multiprocessing.get_context('fork')
+        try:
+            for index in range(self._workers):
+                parent_pipe,child_pipe=context.Pipe()
+                process=context.Process(target=self._worker_main,args=(index,child_pipe,parent_pipe,sock),daemon=True)
+                process.start()
+                child_pipe.close()
+                self._processes.append(process)
+                self._pipes.append(parent_pipe)
+            if sock is not None:
+                sock.close()
+            asyncio.run(self._run_master())
+        finally:
+            self._stop_processes()
+
+    async def get_stats(self,timeout:float=5)->dict:
+        """
+        获取各工作进程的统计信息并汇总
+
+        @return:{'workers':[每个工作进程的统计信息],'total':汇总后的统计信息}
+        """
+        loop=asyncio.get_running_loop()
+        futures=[]
+        for index,pipe in enumerate(self._pipes):
+            if not self._processes[index].is_alive():
+                continue
+            future=loop.create_future()
+            self._pending.setdefault(index,[]).append(future)
+            try:
+                pipe.send(('stats',))
+            except OSError:
+                self._pending[index].remove(future)
+                continue
+            futures.append(future)
+        results=[]
+        if futures:
+            done,_=await asyncio.wait(futures,timeout=timeout)
+            results=[future.result() for future in futures if future in done and not future.cancelled()]
+        results.sort(key=lambda stats:stats['worker'])
+        return {'workers':results,'total':aggregate_stats(results)}
+
+    async def broadcast(self,*command)->None:
+        """向所有工作进程发送命令"""
+        for pipe in self._pipes:
+            try:
+                pipe.send(command)
+            except OSError:
+                pass
+
+    def shutdown(self)->None:
+        """通知所有工作进程关闭"""
+        if self._shutdown_event is not None:
+            self._shutdown_event.set()
+
+    async def _run_master(self)->None:
+        loop=asyncio.get_running_loop()
+        self._shutdown_event=asyncio.Event()
+        for signum in (signal.SIGINT,signal.SIGTERM):
+            loop.add_signal_handler(signum,self.shutdown)
+        for index,pipe in enumerate(self._pipes):
+            loop.add_reader(pipe.fileno(),self._on_message,index)
+            loop.add_reader(self._processes[index].sentinel,self._on_worker_exit,index)
+        console=None
+        if self._server._listen_keyboard:
+            console=asyncio.ensure_future(self._listen_keyboard_input())
+        await self._shutdown_event.wait()
+        if console is not None:
+            console.cancel()
+        for index,pipe in enumerate(self._pipes):
+            loop.remove_reader(pipe.fileno())
+            loop.remove_reader(self._processes[index].sentinel)
+        await self.broadcast('close')
+        await asyncio.to_thread(self._join,self._shutdown_timeout)
+
+    def _on_message(self,index:int)->None:
+        try:
+            message=self._pipes[index].recv()
+        except (EOFError,OSError):
+            asyncio.get_running_loop().remove_reader(self._pipes[index].fileno())
+            return
+        if message[0]=='stats':
+            pending=self._pending.get(index)
+            if pending:
+                future=pending.pop(0)
+                if not future.done():
+                    future.set_result(message[1])
+
+    def _on_worker_exit(self,index:int)->None:
+        loop=asyncio.get_running_loop()
+        loop.remove_reader(self._processes[index].sentinel)
+        for future in self._pending.pop(index,[]):
+            future.cancel()
+        if self._shutdown_event.is_set():
+            return
+        self._server._server_error(RuntimeError(f'工作进程{index}(pid:{self._processes[index].pid})已退出'))
+        if not any(process.is_alive() for process in self._processes):
+            self.shutdown()
+
+    def _join(self,timeout:float)->None:
+        for process in self._processes:
+            process.join(timeout)
+
+    def _stop_processes(self)->None:
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            process.join()
+        for pipe in self._pipes:
+            pipe.close()
+
+    async def _listen_keyboard_input(self)->None:
+        """主进程控制台"""
+        print("控制台已启动,请输入help查看帮助")
+        while True:
+            command=await self._input("> ")
+            if command.lower()=='help':
+                print("list:查看各工作进程的连接和排队统计信息")
+                print("exit/quit/stop:关闭服务器")
+                print("backlog:修改每个工作进程的最大连接数")
+                print("reject:切换“超出最大连接数”模式")
+                print("metrics:查看所有工作进程汇总的性能指标")
+            elif command.lower() in ['exit','quit','stop']:
+                self.shutdown()
+                break
+            elif command.lower() in ['list','queue']:
+                stats=await self.get_stats()
+                for worker in stats['workers']:
+                    print(f"工作进程{worker['worker']}(pid:{worker['pid']}): 连接数 {worker['connections']},排队数 {worker['queue']['queued']}")
+                total=stats['total']
+                print(f"合计: 连接数 {total['connections']},排队数 {total['queue']['queued']},工作进程 {total['workers']}/{self._workers}")
+                for key,value in total['queue'].items():
+                    print(f"{key}: {value}")
+            elif command.lower()=='metrics':
+                metrics=(await self.get_stats())['total']['metrics']
+                if metrics is None:
+                    print("未启用性能指标")
+                else:
+                    print(metrics.to_prometheus(),end='')
+            elif command.lower()=='backlog':
+                backlog=int(await self._input("请输入新的最大连接数:"))
+                if backlog>0:
+                    await self.broadcast('backlog',backlog)
+                    print(f"已将每个工作进程的最大连接数设置为{backlog}")
+                else:
+                    print("最大连接数必须大于0")
+            elif command.lower()=='reject':
+                self._server._reject=not self._server._reject
+                await self.broadcast('reject',self._server._reject)
+                print(f"从下一次开始连接的“超出最大连接数”模式设置为{'拒绝' if self._server._reject else '阻塞'}")
+            else:
+                print("未知命令,请输入help查看帮助")
+
+    @staticmethod
+    def _input(prompt:str)->asyncio.Future:
+        """在守护线程中读取输入(收到信号关闭时不会因为等待输入而无法退出)"""
+        loop=asyncio.get_running_loop()
+        future=loop.create_future()
+
+        def set_result(method,value)->None:
+            if not future.done():
+                method(value)
+
+        def target()->None:
+            try:
+                result=input(prompt)
+            except Exception as e:
+                loop.call_soon_threadsafe(set_result,future.set_exception,e)
+                return
+            loop.call_soon_threadsafe(set_result,future.set_result,result)
+
+        threading.Thread(target=target,daemon=True).start()
+        return future
+
+    def _worker_main(self,index:int,pipe,parent_pipe,sock)->None:
+        """工作进程入口"""
+        parent_pipe.close()
+        for other in self._pipes:
+            other.close()
+        # Ctrl+C由主进程统一处理
+        signal.signal(signal.SIGINT,signal.SIG_IGN)
+        server=self._server
+        server._worker_index=index
+        server._listen_keyboard=False
+        server._listen_sock=sock
+        server._reuse_port=sock is None
+        try:
+            run(self._run_worker(pipe),server._loop)
+        except Exception as e:
+            server._server_error(e)
+        finally:
+            pipe.close()
+
+    async def _run_worker(self,pipe)->None:
+        loop=asyncio.get_running_loop()
+        server=self._server
+
+        def close()->None:
+            loop.remove_reader(pipe.fileno())
+            asyncio.ensure_future(server.close_all())
+
+        def on_command()->None:
+            try:
+                command=pipe.recv()
+            except (EOFError,OSError):
+                # 主进程已退出
+                close()
+                return
+            if command[0]=='close':
+                close()
+            elif command[0]=='stats':
+                pipe.send(('stats',server.get_stats()))
+            elif command[0]=='backlog':
+                server._backlog=command[1]
+                server._admission.set_limit(command[1])
+            elif command[0]=='reject':
+                server._reject=command[1]
+
+        loop.add_signal_handler(signal.SIGTERM,close)
+        loop.add_reader(pipe.fileno(),on_command)
+        await server._run_tasks()
+
+def aggregate_stats(stats_list:list)->dict:
+    """汇总多个工作进程的统计信息"""
+    queue={}
+    queued_by_priority={}
+    wait_total=0.0
+    for stats in stats_list:
+        for key,value in stats['queue'].items():
+            if key=='queued_by_priority':
+                for priority,count in value.items():
+                    queued_by_priority[priority]=queued_by_priority.get(priority,0)+count
+            elif key=='wait_max':
+                queue[key]=max(queue.get(key,0.0),value)
+            elif key=='wait_avg':
+                wait_total+=value*stats['queue']['admitted_from_queue']
+            else:
+                queue[key]=queue.get(key,0)+value
+    queue['queued_by_priority']=queued_by_priority
+    waited=queue.get('admitted_from_queue',0)
+    queue['wait_avg']=wait_total/waited if waited else 0.0
+    metrics=None
+    for stats in stats_list:
+        if stats.get('metrics') is not None:
+            metrics=(metrics or Metrics()).merge(stats['metrics'])
+    return {
+        'workers':len(stats_list),
+        'connections':sum(stats['connections'] for stats in stats_list),
+        'queue':queue,
+        'metrics':metrics
+    }
@@ -0,0 +1,70 @@
+import asyncio,os,sys,unittest
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tcp_quick.connect import Connect
+from tcp_quick.broadcast import broadcast
+
+async def open_pair()->tuple:
+    """建立一对未加密的连接(服务端,客户端)"""
+    accepted=asyncio.get_running_loop().create_future()
+
+    async def accept(reader,writer)->None:
+        accepted.set_result(Connect(reader,writer))
+
+    server=await asyncio.start_server(accept,'127.0.0.1',0)
+    reader,writer=await asyncio.open_connection('127.0.0.1',server.sockets[0].getsockname()[1])
+    return server,await accepted,Connect(reader,writer)
+
+class BroadcastOrderTest(unittest.IsolatedAsyncioTestCase):
+    """广播不能越过合并缓冲区中尚未发送的消息"""
+
+    async def check_order(self,raw:bool)->None:
+        server,connect,peer=await open_pair()
+        try:
+            connect.set_coalesce(1)
+            await connect.send(b'first')
+            result=await broadcast([connect],b'second',raw=raw)
+            self.assertEqual(result.errors,{})
+            self.assertEqual(await peer.recv(5),b'first')
+            if raw:
+                self.assertEqual(await peer.recv_raw(6,5,-1,0),b'second')
+            else:
+                self.assertEqual(await peer.recv(5),b'second')
+        finally:
+            await connect.close()
+            await peer.close()
+            server.close()
+            await server.wait_closed()
+
+    async def test_broadcast_after_coalesced_send(self)->None:
+        await self.check_order(False)
+
+    async def test_raw_broadcast_after_coalesced_send(self)->None:
+        await self.check_order(True)
+
+class BroadcastMetricsTest(unittest.IsolatedAsyncioTestCase):
+    """广播与逐个发送记录的帧数和字节数一致"""
+
+    async def test_broadcast_counts_like_send(self)->None:
+        server,connect,peer=await open_pair()
+        try:
+            connect.set_metrics()
+            peer.set_metrics()
+            await connect.send(b'hello')
+            await broadcast([connect],b'world!')
+            await connect.send_encoded(connect.encode(b'encoded'))
+            for data in (b'hello',b'world!',b'encoded'):
+                self.assertEqual(await peer.recv(5),data)
+            sent=connect.get_metrics().counters
+            received=peer.get_metrics().counters
+            self.assertEqual(sent['frames_out'],3)
+            self.assertEqual(sent['bytes_out'],18)
+            self.assertEqual(sent['frames_out'],received['frames_in'])
+            self.assertEqual(sent['bytes_out'],received['bytes_in'])
+        finally:
+            await connect.close()
+            await peer.close()
+            server.close()
+            await server.wait_closed()
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import os,sys,unittest
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tcp_quick.buffer import RecvBuffer
+
+class RecvBufferTest(unittest.TestCase):
+    """以“\\r”结尾的行只影响下一次读取行"""
+
+    def test_crlf_split_between_feeds(self)->None:
+        buffer=RecvBuffer()
+        buffer.feed(b'first\r')
+        self.assertEqual(buffer.read_line(),b'first')
+        self.assertIsNone(buffer.read_line())
+        buffer.feed(b'\nsecond\n')
+        self.assertEqual(buffer.read_line(),b'second')
+        self.assertFalse(buffer)
+
+    def test_raw_data_after_cr_line(self)->None:
+        buffer=RecvBuffer()
+        buffer.feed(b'line\r')
+        self.assertEqual(buffer.read_line(),b'line')
+        buffer.feed(b'\n\x00binary')
+        self.assertEqual(buffer.read(8),b'\n\x00binary')
+        buffer.feed(b'\nnext\n')
+        self.assertEqual(buffer.read(1),b'\n')
+        self.assertEqual(buffer.read_line(),b'next')
+
+if __name__=='__main__':
+    unittest.main()
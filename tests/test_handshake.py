@@ -0,0 +1,53 @@
+import asyncio,os,sys,unittest
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tcp_quick.connect import Connect
+
+async def open_pair(key_exchange:str)->tuple:
+    """建立一对使用AES的连接(服务端,客户端)"""
+    accepted=asyncio.get_running_loop().create_future()
+
+    async def accept(reader,writer)->None:
+        accepted.set_result(Connect(reader,writer,True))
+
+    server=await asyncio.start_server(accept,'127.0.0.1',0)
+    reader,writer=await asyncio.open_connection('127.0.0.1',server.sockets[0].getsockname()[1])
+    connect=Connect(reader,writer,True)
+    peer=await accepted
+    connect.set_key_exchange(key_exchange)
+    peer.set_key_exchange(key_exchange)
+    return server,peer,connect
+
+class HandshakeTest(unittest.IsolatedAsyncioTestCase):
+    """完整的密钥交换(不替换公钥认证,服务器公钥已受信任)"""
+
+    async def asyncSetUp(self)->None:
+        self._trust=Connect.__dict__.get('_trust_public_key')
+        public_key=await Connect.get_public_key()
+        Connect._trust_public_key=[public_key.export_key().decode()]
+
+    async def asyncTearDown(self)->None:
+        if self._trust is None:
+            del Connect._trust_public_key
+        else:
+            Connect._trust_public_key=self._trust
+
+    async def check_handshake(self,key_exchange:str)->None:
+        server,peer,connect=await open_pair(key_exchange)
+        try:
+            await asyncio.wait_for(asyncio.gather(peer.key_exchange_to_client(),connect.key_exchange_to_server()),30)
+            await connect.send(b'hello')
+            self.assertEqual(await peer.recv(5),b'hello')
+        finally:
+            await connect.close()
+            await peer.close()
+            server.close()
+            await server.wait_closed()
+
+    async def test_rsa(self)->None:
+        await self.check_handshake('rsa')
+
+    async def test_x25519(self)->None:
+        await self.check_handshake('x25519')
+
+if __name__=='__main__':
+    unittest.main()
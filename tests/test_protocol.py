@@ -0,0 +1,51 @@
+import asyncio,os,sys,unittest
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tcp_quick.connect import Connect
+from tcp_quick.protocol import FrameProtocol
+
+async def open_pair()->tuple:
+    """建立一对未加密的连接(服务端使用FrameProtocol,客户端使用StreamReader)"""
+    loop=asyncio.get_running_loop()
+    accepted=loop.create_future()
+
+    async def accept(reader,writer)->None:
+        accepted.set_result(Connect(reader,writer))
+
+    server=await loop.create_server(lambda:FrameProtocol(accept),'127.0.0.1',0)
+    reader,writer=await asyncio.open_connection('127.0.0.1',server.sockets[0].getsockname()[1])
+    return server,await accepted,Connect(reader,writer)
+
+class FrameProtocolTest(unittest.IsolatedAsyncioTestCase):
+    """FrameProtocol与StreamReader的读取行为一致"""
+
+    async def test_raw_after_frame(self)->None:
+        server,connect,peer=await open_pair()
+        try:
+            # 帧和之后的原始数据在同一次写入中到达
+            peer.writer().writelines([*peer.encode(b'frame'),b'\xa1raw data'])
+            self.assertEqual(await connect.recv(5),b'frame')
+            self.assertEqual(await connect.recv_raw(9,5,-1,0),b'\xa1raw data')
+            await peer.send(b'next')
+            self.assertEqual(await connect.recv(5),b'next')
+        finally:
+            await connect.close()
+            await peer.close()
+            server.close()
+            await server.wait_closed()
+
+    async def test_large_frame(self)->None:
+        server,connect,peer=await open_pair()
+        try:
+            data=os.urandom(5<<20)
+            sending=asyncio.ensure_future(peer.send(data))
+            received=await connect.recv(5,-1,0)
+            await sending
+            self.assertEqual(received,data)
+        finally:
+            await connect.close()
+            await peer.close()
+            server.close()
+            await server.wait_closed()
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import asyncio,os,sys,unittest
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tcp_quick.connect import Connect
+
+async def open_pair()->tuple:
+    """建立一对未加密的连接(服务端,客户端)"""
+    accepted=asyncio.get_running_loop().create_future()
+
+    async def accept(reader,writer)->None:
+        accepted.set_result(Connect(reader,writer))
+
+    server=await asyncio.start_server(accept,'127.0.0.1',0)
+    reader,writer=await asyncio.open_connection('127.0.0.1',server.sockets[0].getsockname()[1])
+    return server,await accepted,Connect(reader,writer)
+
+class SendQueueTest(unittest.IsolatedAsyncioTestCase):
+    """send返回后修改调用方的缓冲区不影响队列中的帧"""
+
+    async def test_reuse_buffer_after_send(self)->None:
+        server,connect,peer=await open_pair()
+        try:
+            connect.set_send_queue(1<<20)
+            buffer=bytearray(b'first')
+            await connect.send(buffer)
+            buffer[:]=b'xxxxx'
+            await connect.send(memoryview(buffer))
+            buffer[:]=b'yyyyy'
+            self.assertEqual(await peer.recv(5),b'first')
+            self.assertEqual(await peer.recv(5),b'xxxxx')
+        finally:
+            await connect.close()
+            await peer.close()
+            server.close()
+            await server.wait_closed()
+
+if __name__=='__main__':
+    unittest.main()